@@ -12,8 +12,7 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from ss_monitor.config import config
 from ss_monitor.database import DatabaseManager
-from ss_monitor.database.user_manager import UserManager
-from ss_monitor.bot.interactive_bot import InteractiveSSMonitorBot
+from ss_monitor.runtime import MonitorRuntime
 
 # Setup logging
 logging.basicConfig(
@@ -37,19 +36,16 @@ def main():
         db_manager = DatabaseManager()
         db_manager._init_database()
         
-        # Initialize user manager
-        user_manager = UserManager(db_manager)
-        
-        # Initialize bot
-        logger.info("Initializing interactive bot...")
-        bot = InteractiveSSMonitorBot(db_manager)
+        # Initialize bot and background scheduler
+        logger.info("Initializing interactive bot and scheduler...")
+        runtime = MonitorRuntime(db_manager)
         
         # Start bot
         logger.info("Bot is ready! Send /start to your bot in Telegram")
         logger.info("Press Ctrl+C to stop the bot")
         
-        # Run bot
-        bot.run()
+        # Run bot and scheduler on one event loop
+        runtime.run()
         
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt, shutting down...")
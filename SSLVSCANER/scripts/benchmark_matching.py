@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Subscription matching benchmark for SS.lv Monitor
+
+Compares the linear ads x subscriptions scan with SubscriptionIndex and,
+when numpy is installed, the vectorized BatchMatcher.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from ss_monitor.database.models import SubscriptionModel
+from ss_monitor.parser.models import Advertisement, PriceInfo
+from ss_monitor.notifications.subscription_index import SubscriptionIndex, subscription_matches
+from ss_monitor.notifications.batch_matcher import NUMPY_AVAILABLE, BatchMatcher
+
+CATEGORIES = ['apartment', 'house']
+
+def build_subscriptions(count: int, rng: random.Random):
+    """Build subscriptions with typical filters: a price band, often rooms and area"""
+    subscriptions = []
+    for i in range(count):
+        min_price = rng.randrange(20, 300) * 1000
+        min_rooms = rng.choice([None, rng.randrange(1, 5)])
+        min_area = rng.choice([None, rng.randrange(25, 120)])
+        subscriptions.append(SubscriptionModel(
+            id=i,
+            user_id=str(i),
+            category=rng.choice(CATEGORIES + ['']),
+            min_price=rng.choice([None, min_price]),
+            max_price=min_price + rng.randrange(10, 60) * 1000,
+            min_area=min_area,
+            max_area=rng.choice([None, (min_area or 25) + rng.randrange(15, 60)]),
+            min_rooms=min_rooms,
+            max_rooms=rng.choice([None, (min_rooms or 1) + rng.randrange(0, 2)])
+        ))
+    return subscriptions
+
+def build_ads(count: int, rng: random.Random):
+    """Build scanned advertisements"""
+    return [
+        Advertisement(
+            ss_id=str(i),
+            title=f"Advertisement {i}",
+            url=f"https://www.ss.lv/msg/{i}.html",
+            price_info=PriceInfo(price=float(rng.randrange(15, 400) * 1000), currency='EUR'),
+            area=float(rng.randrange(20, 250)),
+            rooms=rng.randrange(1, 7),
+            property_type=rng.choice(CATEGORIES)
+        )
+        for i in range(count)
+    ]
+
+def run_benchmark(subscription_count: int, ad_count: int) -> bool:
+    """Run matching benchmark"""
+    print("⏱️  SS.lv Subscription Matching Benchmark")
+    print("=" * 50)
+    
+    rng = random.Random(42)
+    subscriptions = build_subscriptions(subscription_count, rng)
+    ads = build_ads(ad_count, rng)
+    print(f"{subscription_count} subscriptions x {ad_count} ads\n")
+    
+    start = time.perf_counter()
+    linear = [[sub for sub in subscriptions if subscription_matches(ad, sub)] for ad in ads]
+    linear_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    index = SubscriptionIndex(subscriptions)
+    build_time = time.perf_counter() - start
+    indexed = [index.match(ad) for ad in ads]
+    indexed_time = time.perf_counter() - start
+    
+    identical = linear == indexed
+    matches = sum(len(result) for result in linear)
+    
+    print(f"  linear  {linear_time * 1000:9.1f} ms")
+    print(f"  indexed {indexed_time * 1000:9.1f} ms  (build {build_time * 1000:.1f} ms, {linear_time / indexed_time:.1f}x)")
+    
+    if NUMPY_AVAILABLE:
+        start = time.perf_counter()
+        batched = BatchMatcher(subscriptions).match_all(ads)
+        batch_time = time.perf_counter() - start
+        identical = identical and linear == batched
+        print(f"  numpy   {batch_time * 1000:9.1f} ms  ({linear_time / batch_time:.1f}x)")
+    else:
+        print("  numpy   not installed")
+    
+    print(f"\nMatches: {matches}")
+    print(f"Identical matches: {'✅' if identical else '❌'}")
+    return identical
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--subscriptions', type=int, default=10000, help='number of subscriptions')
+    arg_parser.add_argument('--ads', type=int, default=1000, help='number of advertisements')
+    args = arg_parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    
+    success = run_benchmark(args.subscriptions, args.ads)
+    sys.exit(0 if success else 1)
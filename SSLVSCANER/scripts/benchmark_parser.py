@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark for SS.lv Monitor
+
+Compares BeautifulSoup and lxml backends on a synthetic listing page and
+measures the listing page cache on repeated scans.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+from pathlib import Path
+
+import httpx
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from ss_monitor.parser.ss_parser import SSParser
+from ss_monitor.parser.page_cache import PageCache
+
+ROW_TEMPLATE = """
+<tr id="tr_{ss_id}">
+    <td class="msga2 pp0"><input type="checkbox" id="c{ss_id}"></td>
+    <td class="msga2 pp0"><a href="/msg/lv/real-estate/flats/riga/centre/{ss_id}.html"><img class="isfoto isfotor" src="https://i.ss.lv/gallery/{ss_id}.th2.jpg" alt=""></a></td>
+    <td class="msg2"><div class="d1"><a class="am" id="dm_{ss_id}" href="/msg/lv/real-estate/flats/riga/centre/{ss_id}.html">Pārdod {rooms} istabu dzīvokli centrā, pēc kapitālā remonta</a></div></td>
+    <td class="msga2-o pp6">centrs<br>Tērbatas {ss_id_short}</td>
+    <td class="msga2-o pp6">{rooms}</td>
+    <td class="msga2-o pp6">{area}</td>
+    <td class="msga2-o pp6">{floor}/9</td>
+    <td class="msga2-o pp6">Renov.</td>
+    <td class="msga2-o pp6">{price}&nbsp;€</td>
+</tr>
+"""
+
+def build_listing_page(rows: int, first_id: int = 5000000) -> bytes:
+    """Build synthetic listing page similar to ss.lv markup"""
+    body = ''.join(
+        ROW_TEMPLATE.format(
+            ss_id=first_id + i,
+            ss_id_short=i,
+            rooms=1 + i % 4,
+            area=30 + i % 90,
+            floor=1 + i % 9,
+            price=f"{50 + i * 3:,}".replace(',', ' ') + " 000"
+        )
+        for i in range(rows)
+    )
+    page = f"""
+    <html>
+        <head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8"><title>SS.LV</title></head>
+        <body>
+            <div id="main_table"><table id="filter_tbl"><tr><td>Filter</td></tr></table></div>
+            <table id="page_main" border="0" cellpadding="0" cellspacing="0" width="100%">
+                <tr id="head_line"><td class="msg_column" colspan="3">Sludinājumi</td></tr>
+                {body}
+            </table>
+            <div id="footer">ss.lv</div>
+        </body>
+    </html>
+    """
+    return page.encode('utf-8')
+
+def benchmark_backend(backend: str, content: bytes, iterations: int):
+    """Parse page repeatedly, returns (seconds per page, parsed ads)"""
+    parser = SSParser(backend=backend)
+    ads = parser._parse_listing_page(content, 1)
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parser._parse_listing_page(content, 1)
+    elapsed = time.perf_counter() - start
+    
+    return elapsed / iterations, ads
+
+def run_benchmark(rows: int, iterations: int) -> bool:
+    """Run parser benchmark"""
+    print("⏱️  SS.lv Parser Benchmark")
+    print("=" * 50)
+    
+    content = build_listing_page(rows)
+    print(f"Page: {rows} rows, {len(content) / 1024:.1f} KB, {iterations} iterations\n")
+    
+    results = {}
+    for backend in ('bs4', 'lxml'):
+        per_page, ads = benchmark_backend(backend, content, iterations)
+        results[backend] = (per_page, ads)
+        print(f"  {backend:<5} {per_page * 1000:8.2f} ms/page  ({len(ads)} ads)")
+    
+    identical = results['bs4'][1] == results['lxml'][1]
+    speedup = results['bs4'][0] / results['lxml'][0]
+    
+    print(f"\nSpeedup lxml vs bs4: {speedup:.1f}x")
+    print(f"Identical advertisements: {'✅' if identical else '❌'}")
+    return identical
+
+def benchmark_page_cache(rows: int, pages: int, scans: int, change_rate: float):
+    """Scan the same pages repeatedly with and without cache, some pages change between scans"""
+    rng = random.Random(42)
+    versions = [0] * pages
+    scan_contents = []
+    for _ in range(scans):
+        for page in range(pages):
+            if rng.random() < change_rate:
+                versions[page] += 1
+        scan_contents.append([
+            build_listing_page(rows, first_id=5000000 + page * 1000 + versions[page] * 100000)
+            for page in range(pages)
+        ])
+    
+    def run(page_cache: PageCache) -> float:
+        parser = SSParser(page_cache=page_cache)
+        start = time.perf_counter()
+        for contents in scan_contents:
+            for page, content in enumerate(contents, start=1):
+                page_url = f"https://www.ss.lv/lv/real-estate/flats/riga/all/sell/?page={page}"
+                cached = parser.page_cache.get(page_url)
+                parser._read_listing_page(page_url, page, httpx.Response(200, content=content), cached)
+        return time.perf_counter() - start
+    
+    uncached = run(PageCache(max_size=0))
+    page_cache = PageCache(max_size=pages)
+    cached = run(page_cache)
+    stats = page_cache.get_stats()
+    
+    print(f"\nPage cache: {scans} scans x {pages} pages, {change_rate:.0%} of pages change per scan")
+    print(f"  without cache {uncached / scans * 1000:8.2f} ms/scan")
+    print(f"  with cache    {cached / scans * 1000:8.2f} ms/scan")
+    print(f"  hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.0%}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--rows', type=int, default=30, help='advertisement rows per page')
+    arg_parser.add_argument('--iterations', type=int, default=50, help='parse iterations per backend')
+    arg_parser.add_argument('--pages', type=int, default=3, help='pages per scan in cache benchmark')
+    arg_parser.add_argument('--scans', type=int, default=20, help='repeated scans in cache benchmark')
+    arg_parser.add_argument('--change-rate', type=float, default=0.2, help='share of pages changing per scan')
+    args = arg_parser.parse_args()
+    
+    # Keep per-page log lines out of the benchmark output
+    logging.disable(logging.INFO)
+    
+    success = run_benchmark(args.rows, args.iterations)
+    benchmark_page_cache(args.rows, args.pages, args.scans, args.change_rate)
+    sys.exit(0 if success else 1)
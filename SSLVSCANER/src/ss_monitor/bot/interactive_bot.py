@@ -1,6 +1,7 @@
 """
 Interactive Telegram Bot for SS.lv Monitor with full UI
 """
+import time
 import asyncio
 import logging
 from typing import Dict, List, Optional
@@ -11,11 +12,15 @@ from telegram.ext import Application, CommandHandler, CallbackQueryHandler, Mess
 from ..config import config
 from ..database import DatabaseManager
 from ..database.user_manager import UserManager
-from ..parser import SSParser
+from ..parser import SSParser, SectionPreviewCache
 from ..notifications import NotificationSystem
+from ..notifications.digest import TELEGRAM_MESSAGE_LIMIT
 
 logger = logging.getLogger(__name__)
 
+# Min seconds between edits of a progress message (Telegram allows about one per second per chat)
+DEBUG_PROGRESS_INTERVAL = 1.0
+
 class InteractiveSSMonitorBot:
     """Interactive SS.lv Monitor Telegram Bot with full UI"""
     
@@ -23,7 +28,8 @@ class InteractiveSSMonitorBot:
         self.db_manager = db_manager or DatabaseManager()
         self.user_manager = UserManager(self.db_manager)
         self.parser = SSParser()
-        self.notification_system = NotificationSystem(self.db_manager, self)
+        self.previews = SectionPreviewCache(self.parser)
+        self.notification_system = NotificationSystem(self.db_manager, self, parser=self.parser)
         self.application = None
         self.user_sessions = {}  # Хранение состояний пользователей
         self._setup_application()
@@ -31,7 +37,11 @@ class InteractiveSSMonitorBot:
     def _setup_application(self):
         """Setup the Telegram application"""
         try:
-            self.application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+            builder = Application.builder().token(config.TELEGRAM_BOT_TOKEN)
+            builder = builder.concurrent_updates(max(1, config.BOT_CONCURRENT_UPDATES))
+            if config.TELEGRAM_API_URL:
+                builder = builder.base_url(config.TELEGRAM_API_URL)
+            self.application = builder.build()
             self._setup_handlers()
             logger.info("Interactive Telegram application setup completed")
         except Exception as e:
@@ -247,6 +257,7 @@ class InteractiveSSMonitorBot:
             )
             return
         
+        self.previews.warm_display_names(sub.url for sub in subscriptions)
         keyboard = []
         for subscription in subscriptions:
             display_name = self._format_url_for_display(subscription.url)
@@ -469,6 +480,7 @@ class InteractiveSSMonitorBot:
             return
         
         # Create keyboard with subscription buttons
+        self.previews.warm_display_names(sub.url for sub in subscriptions)
         keyboard = []
         for sub in subscriptions:
             display_name = self._format_url_for_display(sub.url)
@@ -541,39 +553,70 @@ class InteractiveSSMonitorBot:
             )
             return
         
+        # Telegram only edits messages without a reply keyboard, it comes with the results
+        progress = await update.message.reply_text(self._format_debug_results(subscriptions, {}))
+        
+        async def debug_section(position: int, url: str):
+            return position, await self._debug_section(url)
+        
+        # Sections are checked concurrently, paced by the shared fetcher's rate limit
+        results = {}
+        last_edit = time.monotonic()
+        checks = [debug_section(i, sub.url) for i, sub in enumerate(subscriptions)]
+        for finished in asyncio.as_completed(checks):
+            position, result = await finished
+            results[position] = result
+            
+            if (len(results) == len(subscriptions)
+                    or time.monotonic() - last_edit < DEBUG_PROGRESS_INTERVAL):
+                continue
+            last_edit = time.monotonic()
+            await self._edit_progress(progress, self._format_debug_results(subscriptions, results))
+        
         await update.message.reply_text(
-            "🔧 Отладка\n\n"
-            "Сканирую ваши разделы...\n"
-            "Это может занять несколько секунд.",
+            self._format_debug_results(subscriptions, results),
             reply_markup=self._get_main_keyboard()
         )
+        try:
+            await progress.delete()
+        except Exception as e:
+            logger.warning(f"Could not delete progress message: {e}")
+    
+    async def _debug_section(self, url: str) -> dict:
+        """Preview a section afresh, with timings"""
+        started = time.perf_counter()
+        try:
+            preview = await self.previews.get(url, refresh=True)
+            return {
+                'found': len(preview.ads),
+                'ads': [self._preview_ad(ad) for ad in preview.ads[:2]],  # First 2 ads
+                'fetch_seconds': preview.fetch_seconds,
+                'parse_seconds': preview.parse_seconds,
+                'seconds': time.perf_counter() - started
+            }
+        except Exception as e:
+            logger.error(f"Error debugging section {url}: {e}")
+            return {'error': str(e), 'seconds': time.perf_counter() - started}
+    
+    def _format_debug_results(self, subscriptions: list, results: Dict[int, dict]) -> str:
+        """Format debug results, sections still being checked are marked pending"""
+        if len(results) < len(subscriptions):
+            result_text = (f"🔧 Отладка: проверено {len(results)} "
+                           f"из {len(subscriptions)} разделов\n\n")
+        else:
+            result_text = "🔧 Результаты отладки (объявления о продаже)\n\n"
         
-        # Test each subscription
-        debug_results = []
-        for sub in subscriptions:
-            try:
-                ads = await self._test_parse_section(sub.url)
-                debug_results.append({
-                    'url': sub.url,
-                    'display_name': self._format_url_for_display(sub.url),
-                    'ads': ads[:2]  # Last 2 ads
-                })
-            except Exception as e:
-                debug_results.append({
-                    'url': sub.url,
-                    'display_name': self._format_url_for_display(sub.url),
-                    'error': str(e)
-                })
-        
-        # Format results
-        result_text = "🔧 Результаты отладки (объявления о продаже)\n\n"
-        
-        for result in debug_results:
-            result_text += f"📋 {result['display_name']}\n"
+        for position, sub in enumerate(subscriptions):
+            result = results.get(position)
+            result_text += f"📋 {self._format_url_for_display(sub.url)}\n"
+            if result is None:
+                result_text += "⏳ Проверяется...\n\n"
+                continue
+            
             if 'error' in result:
-                result_text += f"❌ Ошибка: {result['error']}\n\n"
+                result_text += f"❌ Ошибка: {result['error']}\n"
             elif result['ads']:
-                result_text += f"✅ Найдено объявлений о продаже: {len(result['ads'])}\n"
+                result_text += f"✅ Найдено объявлений о продаже: {result['found']}\n"
                 for i, ad in enumerate(result['ads'], 1):
                     result_text += f"{i}. {ad.get('title', 'Без названия')}\n"
                     if ad.get('price'):
@@ -582,87 +625,45 @@ class InteractiveSSMonitorBot:
                         result_text += f"   📍 {ad['location']}\n"
                     if ad.get('link'):
                         result_text += f"   🔗 {ad['link']}\n"
-                result_text += "\n"
             else:
                 result_text += "⚠️ Объявления о продаже не найдены\n"
-                result_text += "Проверьте правильность ссылки\n\n"
+                result_text += "Проверьте правильность ссылки\n"
+            
+            result_text += f"⏱ {result['seconds']:.2f} с"
+            if 'fetch_seconds' in result:
+                result_text += (f" (загрузка {result['fetch_seconds']:.2f} с, "
+                                f"разбор {result['parse_seconds']:.2f} с)")
+            result_text += "\n\n"
         
-        await update.message.reply_text(
-            result_text,
-            reply_markup=self._get_main_keyboard()
-        )
+        if len(result_text) > TELEGRAM_MESSAGE_LIMIT:
+            result_text = result_text[:TELEGRAM_MESSAGE_LIMIT - 1] + "…"
+        return result_text
+    
+    async def _edit_progress(self, message, text: str):
+        """Replace text of a progress message"""
+        try:
+            await message.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Could not update progress message: {e}")
     
     async def _test_parse_section(self, url: str) -> list:
         """Test parse a section and return ads"""
-        import requests
-        from bs4 import BeautifulSoup
-        
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # Always try with /all/sell/ first for better results
-            if not url.endswith('/all/sell/'):
-                target_url = url.rstrip('/') + '/all/sell/'
-                logger.info(f"Trying URL with /all/sell/: {target_url}")
-            else:
-                target_url = url
-            
-            response = requests.get(target_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            ads = self._extract_ads_from_soup(soup)
-            
-            # If no ads found with /all/sell/, try original URL as fallback
-            if not ads and target_url != url:
-                logger.info(f"No ads found in {target_url}, trying original URL: {url}")
-                try:
-                    response = requests.get(url, headers=headers, timeout=10)
-                    response.raise_for_status()
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    ads = self._extract_ads_from_soup(soup)
-                except Exception as e:
-                    logger.error(f"Error parsing original URL {url}: {e}")
-            
-            return ads
-            
+            preview = await self.previews.get(url)
+            return [self._preview_ad(ad) for ad in preview.ads[:2]]  # First 2 ads
         except Exception as e:
             logger.error(f"Error parsing {url}: {e}")
             return []
     
-    def _extract_ads_from_soup(self, soup) -> list:
-        """Extract ads from BeautifulSoup object"""
-        ads = []
-        
-        # Find ad containers - look for table rows with specific structure
-        ad_containers = soup.find_all('tr', {'id': lambda x: x and x.startswith('tr_')})
-        
-        for container in ad_containers[:2]:  # Get first 2 ads
-            ad = {}
-            
-            # Extract title and link
-            title_elem = container.find('a', {'id': lambda x: x and x.startswith('dm_')})
-            if title_elem:
-                ad['title'] = title_elem.get_text(strip=True)
-                ad['link'] = 'https://www.ss.lv' + title_elem.get('href', '')
-            
-            # Extract price - look in the right column
-            price_cell = container.find('td', {'class': 'msga2-o', 'id': lambda x: x and 'price' in x})
-            if price_cell:
-                ad['price'] = price_cell.get_text(strip=True)
-            
-            # Extract location - look for location cell
-            location_cell = container.find('td', {'class': 'msga2-o', 'id': lambda x: x and 'pageid' in x})
-            if location_cell:
-                ad['location'] = location_cell.get_text(strip=True)
-            
-            # If we found title and link, it's a valid ad
-            if ad.get('title') and ad.get('link'):
-                ads.append(ad)
-        
-        return ads
+    def _preview_ad(self, ad) -> dict:
+        """Convert advertisement to a preview entry"""
+        preview_ad = {'title': ad.title, 'link': ad.url}
+        if ad.price_info.price is not None:
+            price = f"{ad.price_info.price:,.0f} {ad.price_info.currency or ''}"
+            preview_ad['price'] = price.strip()
+        if ad.location:
+            preview_ad['location'] = ad.location
+        return preview_ad
     
     async def _process_urls(self, update: Update, text: str):
         """Process single URL from user input"""
@@ -760,14 +761,10 @@ class InteractiveSSMonitorBot:
         return url.startswith('https://www.ss.lv/') and 'real-estate' in url
     
     def _format_url_for_display(self, url: str) -> str:
-        """Format URL for display by parsing the page title"""
-        try:
-            # Try to get the display name from the page
-            display_name = self._get_page_display_name(url)
-            if display_name:
-                return display_name
-        except Exception as e:
-            logger.warning(f"Could not parse display name for {url}: {e}")
+        """Format URL for display by the cached page title of the section"""
+        display_name = self.previews.display_name(url)
+        if display_name:
+            return display_name
         
         # Fallback to URL-based parsing
         if 'flats' in url:
@@ -777,45 +774,6 @@ class InteractiveSSMonitorBot:
         else:
             return url.replace('https://www.ss.lv/', 'ss.lv/')
     
-    def _get_page_display_name(self, url: str) -> str:
-        """Get display name by parsing the page title"""
-        import requests
-        from bs4 import BeautifulSoup
-        
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # Add /all/sell/ to URL for better results
-            if not url.endswith('/all/sell/'):
-                target_url = url.rstrip('/') + '/all/sell/'
-            else:
-                target_url = url
-            
-            response = requests.get(target_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Get title from page
-            title_element = soup.find('title')
-            if title_element:
-                title = title_element.get_text(strip=True)
-                # Extract meaningful part from title (usually after " - ")
-                if ' - ' in title:
-                    parts = title.split(' - ')
-                    if len(parts) >= 2:
-                        return parts[1].strip()
-                # If no " - " found, return the whole title
-                return title
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error parsing display name from {url}: {e}")
-            return None
-    
     def _format_frequency(self, freq: str) -> str:
         """Format frequency for display"""
         freq_map = {
@@ -868,6 +826,44 @@ class InteractiveSSMonitorBot:
         except Exception as e:
             logger.error(f"Error sending message to {chat_id}: {e}")
     
+    async def deliver_message(self, chat_id: str, message: str):
+        """Send message to user, raising Telegram errors for the caller to retry"""
+        await self.application.bot.send_message(chat_id=chat_id, text=message)
+    
+    def _webhook_options(self) -> dict:
+        """Options of the local webhook server
+        
+        Pending updates are kept: with several replicas behind a proxy a
+        restarting replica must not drop updates meant for the others.
+        """
+        return {
+            'listen': config.WEBHOOK_LISTEN,
+            'port': config.WEBHOOK_PORT,
+            'url_path': config.WEBHOOK_PATH,
+            'webhook_url': config.WEBHOOK_URL,
+            'secret_token': config.WEBHOOK_SECRET or None,
+            'drop_pending_updates': False
+        }
+    
+    async def start(self):
+        """Start receiving and handling updates on the running event loop"""
+        await self.application.initialize()
+        if config.BOT_MODE == 'webhook':
+            await self.application.updater.start_webhook(**self._webhook_options())
+            logger.info(f"Receiving updates on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}"
+                        f"/{config.WEBHOOK_PATH}")
+        else:
+            await self.application.updater.start_polling(drop_pending_updates=True)
+        await self.application.start()
+    
+    async def stop(self):
+        """Stop receiving updates and shut the application down"""
+        if self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+    
     def run(self):
         """Run the bot"""
         try:
@@ -878,7 +874,12 @@ class InteractiveSSMonitorBot:
             logger.info("Press Ctrl+C to stop the bot")
             
             # Run the bot
-            self.application.run_polling(drop_pending_updates=True)
+            if config.BOT_MODE == 'webhook':
+                logger.info(f"Receiving updates on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}"
+                            f"/{config.WEBHOOK_PATH}")
+                self.application.run_webhook(**self._webhook_options())
+            else:
+                self.application.run_polling(drop_pending_updates=True)
             
         except KeyboardInterrupt:
             logger.info("Received keyboard interrupt, shutting down...")
@@ -19,18 +19,90 @@ class Config:
     # Telegram Bot Configuration
     TELEGRAM_BOT_TOKEN: str = os.getenv('TELEGRAM_BOT_TOKEN') or '8348868901:AAFaXAgENEALsh0qRLWnb_b8pJearMYdEmo'
     TELEGRAM_ADMIN_ID: str = os.getenv('TELEGRAM_ADMIN_ID') or '380740159'
+    # e.g. http://localhost:8081/bot, empty uses api.telegram.org
+    TELEGRAM_API_URL: str = os.getenv('TELEGRAM_API_URL', '')
+    BOT_MODE: str = os.getenv('BOT_MODE', 'polling')  # polling or webhook
+    # Updates handled in parallel, 1 keeps per-user sessions sequential
+    BOT_CONCURRENT_UPDATES: int = int(os.getenv('BOT_CONCURRENT_UPDATES', '1'))
+    
+    # Webhook mode: Telegram posts updates to WEBHOOK_URL, proxied to the local server
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')  # public HTTPS URL registered with Telegram
+    WEBHOOK_LISTEN: str = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', 'telegram')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')  # X-Telegram-Bot-Api-Secret-Token
+    # Seconds to deliver queued notifications on shutdown
+    SHUTDOWN_TIMEOUT: float = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
     
     # Database Configuration
     DATABASE_PATH: str = os.getenv('DATABASE_PATH', 'ss_monitor.db')
+    DB_BUSY_TIMEOUT: float = float(os.getenv('DB_BUSY_TIMEOUT', '5.0'))  # seconds
+    DB_CACHE_SIZE_KB: int = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))  # page cache per connection
+    DB_MMAP_SIZE: int = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))  # bytes, 0 disables
     
     # Parsing Configuration
     MAX_PAGES_PER_CATEGORY: int = int(os.getenv('MAX_PAGES_PER_CATEGORY', '3'))
+    INCREMENTAL_SCAN: bool = os.getenv('INCREMENTAL_SCAN', 'true').lower() == 'true'
+    SCAN_TICK_SECONDS: int = int(os.getenv('SCAN_TICK_SECONDS', '60'))  # due queue check period
+    # Seconds until a failed section is retried, doubled on every further failure
+    SCAN_RETRY_DELAY: int = int(os.getenv('SCAN_RETRY_DELAY', '300'))
+    # Poll busy sections more often
+    ADAPTIVE_SCAN: bool = os.getenv('ADAPTIVE_SCAN', 'true').lower() == 'true'
+    SCAN_MIN_INTERVAL: int = int(os.getenv('SCAN_MIN_INTERVAL', '300'))  # floor for busy sections
+    # New ads/price changes wanted per scan of an adaptive section
+    SCAN_TARGET_EVENTS: float = float(os.getenv('SCAN_TARGET_EVENTS', '1'))
+    SCAN_WORKER_ID: str = os.getenv('SCAN_WORKER_ID', '')  # lease owner, defaults to host:pid
+    SCAN_LEASE_SECONDS: int = int(os.getenv('SCAN_LEASE_SECONDS', '300'))  # renewed while scanning
+    SCAN_LEASE_BATCH: int = int(os.getenv('SCAN_LEASE_BATCH', '50'))  # max sections leased per tick
     REQUEST_TIMEOUT: int = int(os.getenv('REQUEST_TIMEOUT', '30'))
     REQUEST_DELAY: float = float(os.getenv('REQUEST_DELAY', '1.0'))
     
+    # Process-wide per-host rate limit shared by every ss.lv request
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv(
+        'RATE_LIMIT_PER_SECOND', str(1.0 / REQUEST_DELAY if REQUEST_DELAY > 0 else 1.0)
+    ))
+    RATE_LIMIT_BURST: int = int(os.getenv('RATE_LIMIT_BURST', '3'))
+    PARSER_BACKEND: str = os.getenv('PARSER_BACKEND', 'lxml')  # lxml or bs4
+    # Parsing processes, 0 parses in-process
+    PARSER_WORKERS: int = int(os.getenv('PARSER_WORKERS', str(min(4, os.cpu_count() or 1))))
+    MAX_CONCURRENT_REQUESTS_PER_HOST: int = int(os.getenv('MAX_CONCURRENT_REQUESTS_PER_HOST', '4'))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+    PAGE_CACHE_SIZE: int = int(os.getenv('PAGE_CACHE_SIZE', '256'))  # listing pages, 0 disables
+    PAGE_CACHE_TTL: int = int(os.getenv('PAGE_CACHE_TTL', '3600'))  # seconds
+    # Section previews in the bot, 0 disables
+    PREVIEW_CACHE_SIZE: int = int(os.getenv('PREVIEW_CACHE_SIZE', '256'))
+    PREVIEW_CACHE_TTL: int = int(os.getenv('PREVIEW_CACHE_TTL', '300'))  # seconds
+    # Per-user status snapshots, dropped on writes
+    STATUS_CACHE_TTL: int = int(os.getenv('STATUS_CACHE_TTL', '300'))
+    
+    # HTTP headers sent with every parser request
+    REQUEST_HEADERS = {
+        'User-Agent': (
+            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        ),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    }
+    
     # Notification Configuration
     ENABLE_NOTIFICATIONS: bool = os.getenv('ENABLE_NOTIFICATIONS', 'true').lower() == 'true'
-    NOTIFICATION_COOLDOWN: int = int(os.getenv('NOTIFICATION_COOLDOWN', '300'))  # 5 minutes
+    NOTIFICATION_COOLDOWN: int = int(os.getenv('NOTIFICATION_COOLDOWN', '300'))  # digest window
+    NOTIFICATION_DIGEST: bool = os.getenv('NOTIFICATION_DIGEST', 'false').lower() == 'true'
+    DIGEST_MAX_MESSAGES: int = int(os.getenv('DIGEST_MAX_MESSAGES', '3'))  # per user and window
+    NOTIFICATION_LEDGER_TTL: int = int(os.getenv('NOTIFICATION_LEDGER_TTL', '2592000'))  # 30 days
+    # Recent ledger keys kept in memory
+    NOTIFICATION_LEDGER_CACHE: int = int(os.getenv('NOTIFICATION_LEDGER_CACHE', '100000'))
+    # Ads x subscriptions above which matching is vectorized, needs numpy
+    BATCH_MATCH_THRESHOLD: int = int(os.getenv('BATCH_MATCH_THRESHOLD', '200000'))
+    
+    # Telegram delivery limits (Bot API allows ~30 msgs/s overall and ~1 msg/s per chat)
+    DELIVERY_WORKERS: int = int(os.getenv('DELIVERY_WORKERS', '8'))
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+    TELEGRAM_CHAT_RATE: float = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+    DELIVERY_MAX_RETRIES: int = int(os.getenv('DELIVERY_MAX_RETRIES', '5'))
     
     # Logging Configuration
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
@@ -69,6 +141,10 @@ class Config:
             raise ValueError("TELEGRAM_BOT_TOKEN is required")
         if not cls.TELEGRAM_ADMIN_ID:
             raise ValueError("TELEGRAM_ADMIN_ID is required")
+        if cls.BOT_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"Unsupported BOT_MODE: {cls.BOT_MODE}")
+        if cls.BOT_MODE == 'webhook' and not cls.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL is required in webhook mode")
         return True
     
     @classmethod
@@ -2,6 +2,14 @@
 Database package for SS.lv Monitor
 """
 from .database_manager import DatabaseManager
-from .models import AdvertisementModel, PriceHistoryModel, SubscriptionModel
+from .ad_index import AdvertisementIndex
+from .models import (
+    AdvertisementModel, PriceHistoryModel, SubscriptionModel, UpsertResult,
+    OutboxMessageModel, ScanStateModel, ScanLeaseModel, UserSnapshot
+)
 
-__all__ = ['DatabaseManager', 'AdvertisementModel', 'PriceHistoryModel', 'SubscriptionModel']
+__all__ = [
+    'DatabaseManager', 'AdvertisementIndex', 'AdvertisementModel', 'PriceHistoryModel',
+    'SubscriptionModel', 'UpsertResult', 'OutboxMessageModel', 'ScanStateModel',
+    'ScanLeaseModel', 'UserSnapshot'
+]
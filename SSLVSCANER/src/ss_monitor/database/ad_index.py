@@ -0,0 +1,63 @@
+"""
+In-memory index of stored advertisements for change detection
+"""
+import hashlib
+import threading
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from .models import AdvertisementModel
+
+logger = logging.getLogger(__name__)
+
+class IndexedAdvertisement(NamedTuple):
+    """Stored advertisement state needed to classify a scanned ad"""
+    id: int
+    price: Optional[float]
+    fingerprint: str
+
+def advertisement_fingerprint(ad: AdvertisementModel) -> str:
+    """Hash of the stored advertisement fields, equal fingerprints need no write"""
+    fields = (
+        ad.title, ad.url, ad.price, ad.currency, ad.price_per_sqm, bool(ad.is_monthly),
+        ad.location, ad.area, ad.rooms, ad.floor, ad.total_floors, ad.property_type,
+        ad.image_url, ad.description
+    )
+    return hashlib.blake2b(repr(fields).encode('utf-8'), digest_size=16).hexdigest()
+
+class AdvertisementIndex:
+    """Thread-safe ss_id -> (id, price, fingerprint) map of active advertisements"""
+    
+    def __init__(self):
+        self._entries: Dict[str, IndexedAdvertisement] = {}
+        self._lock = threading.Lock()
+    
+    def load(self, ads: Iterable[AdvertisementModel]):
+        """Replace index contents with the given stored advertisements"""
+        entries = {
+            ad.ss_id: IndexedAdvertisement(ad.id, ad.price, advertisement_fingerprint(ad))
+            for ad in ads
+        }
+        with self._lock:
+            self._entries = entries
+        logger.info(f"Advertisement index loaded with {len(entries)} ads")
+    
+    def get(self, ss_id: str) -> Optional[IndexedAdvertisement]:
+        """Get indexed advertisement by SS ID"""
+        return self._entries.get(ss_id)
+    
+    def set(self, ss_id: str, ad_id: int, price: Optional[float], fingerprint: str):
+        """Record advertisement state after a committed write"""
+        with self._lock:
+            self._entries[ss_id] = IndexedAdvertisement(ad_id, price, fingerprint)
+    
+    def discard(self, ss_id: str):
+        """Forget advertisement, the next save falls back to the database"""
+        with self._lock:
+            self._entries.pop(ss_id, None)
+    
+    def __contains__(self, ss_id: str) -> bool:
+        return ss_id in self._entries
+    
+    def __len__(self) -> int:
+        return len(self._entries)
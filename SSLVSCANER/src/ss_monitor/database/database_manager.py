@@ -3,21 +3,41 @@ Database manager for SS.lv Monitor
 """
 import sqlite3
 import logging
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+import threading
+from typing import Callable, List, Optional, Dict
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 
 from ..config import config
-from .models import AdvertisementModel, PriceHistoryModel, SubscriptionModel
+from .models import (
+    AdvertisementModel, PriceHistoryModel, SubscriptionModel, UpsertResult,
+    OutboxMessageModel, ScanStateModel, ScanLeaseModel
+)
+from .ad_index import AdvertisementIndex, advertisement_fingerprint
 
 logger = logging.getLogger(__name__)
 
+# Max host parameters per IN (...) lookup
+SQL_VARIABLES_CHUNK = 500
+
+# Counters row -> table whose active rows it counts, kept up to date by triggers
+COUNTED_TABLES = {
+    'active_ads': 'advertisements',
+    'active_subscriptions': 'subscriptions',
+}
+
 class DatabaseManager:
     """Database manager with improved error handling and connection management"""
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or config.DATABASE_PATH
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._subscription_listeners: List[Callable[[str], None]] = []
+        self.ad_index = AdvertisementIndex()
         self._init_database()
+        self._load_ad_index()
     
     def _init_database(self):
         """Initialize database and create tables"""
@@ -85,6 +105,65 @@ class DatabaseManager:
                     )
                 ''')
                 
+                # Create outbox table for notifications awaiting delivery
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        chat_id TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        advertisement_id INTEGER,
+                        status TEXT DEFAULT 'pending',
+                        attempts INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        delivered_at TIMESTAMP,
+                        FOREIGN KEY (advertisement_id) REFERENCES advertisements (id)
+                    )
+                ''')
+                
+                # Create ledger of sent notifications, one row per (user, ad, event, price)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS notification_ledger (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id TEXT NOT NULL,
+                        ss_id TEXT NOT NULL,
+                        event_type TEXT NOT NULL,
+                        price REAL NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (user_id, ss_id, event_type, price)
+                    )
+                ''')
+                
+                # Create scan state table, one row per listing section
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_state (
+                        section_url TEXT PRIMARY KEY,
+                        last_scan_at TIMESTAMP,
+                        next_due_at TIMESTAMP NOT NULL,
+                        last_result_hash TEXT,
+                        consecutive_failures INTEGER DEFAULT 0,
+                        churn_rate REAL DEFAULT 0
+                    )
+                ''')
+                
+                # Create scan lease table, a section is scanned only by the worker holding its lease
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_leases (
+                        section_url TEXT PRIMARY KEY,
+                        owner_id TEXT NOT NULL,
+                        expires_at TIMESTAMP NOT NULL,
+                        heartbeat_at TIMESTAMP NOT NULL
+                    )
+                ''')
+                
+                # Create counters table, maintained by triggers instead of COUNT(*) scans
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS counters (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                self._create_counter_triggers(cursor)
+                
                 # Create indexes for better performance
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_ss_id ON advertisements(ss_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_advertisements_property_type ON advertisements(property_type)')
@@ -92,6 +171,14 @@ class DatabaseManager:
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_advertisement_id ON price_history(advertisement_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_is_active ON subscriptions(is_active)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status)')
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_notification_ledger_created_at '
+                    'ON notification_ledger(created_at)'
+                )
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_scan_leases_owner_id ON scan_leases(owner_id)'
+                )
                 
                 conn.commit()
                 logger.info("Database initialized successfully")
@@ -100,22 +187,95 @@ class DatabaseManager:
             logger.error(f"Error initializing database: {e}")
             raise
     
+    def _create_counter_triggers(self, cursor):
+        """Seed counters of active rows and create the triggers maintaining them"""
+        for name, table in COUNTED_TABLES.items():
+            # Seeding and trigger creation share one transaction, no write is missed in between
+            cursor.execute(
+                'INSERT OR IGNORE INTO counters (name, value) '
+                f'SELECT ?, COUNT(*) FROM {table} WHERE is_active = 1',
+                (name,)
+            )
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+                WHEN NEW.is_active IS 1
+                BEGIN
+                    UPDATE counters SET value = value + 1 WHERE name = '{name}';
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_count_update
+                AFTER UPDATE OF is_active ON {table}
+                WHEN (NEW.is_active IS 1) != (OLD.is_active IS 1)
+                BEGIN
+                    UPDATE counters SET value = value + (NEW.is_active IS 1) - (OLD.is_active IS 1)
+                    WHERE name = '{name}';
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+                WHEN OLD.is_active IS 1
+                BEGIN
+                    UPDATE counters SET value = value - 1 WHERE name = '{name}';
+                END
+            ''')
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open connection with WAL journaling so readers never wait for writers"""
+        conn = sqlite3.connect(
+            self.db_path, timeout=config.DB_BUSY_TIMEOUT, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={int(config.DB_BUSY_TIMEOUT * 1000)}')
+        return conn
+    
     @contextmanager
     def _get_connection(self):
-        """Get database connection with proper error handling"""
-        conn = None
+        """Get this thread's long-lived connection with proper error handling"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn not in self._connections:
+            conn = self._connect()
+            with self._connections_lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+            self._local.depth = 0
+        
+        self._local.depth += 1
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
             yield conn
         except Exception as e:
-            if conn:
-                conn.rollback()
+            conn.rollback()
             logger.error(f"Database connection error: {e}")
             raise
         finally:
-            if conn:
+            self._local.depth -= 1
+            # Like closing a short-lived connection, drop work the caller did not commit
+            if self._local.depth == 0 and conn.in_transaction:
+                conn.rollback()
+    
+    def close(self):
+        """Close connections of all threads"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
                 conn.close()
+            except Exception as e:
+                logger.error(f"Error closing database connection: {e}")
+    
+    def _load_ad_index(self):
+        """Load index of active advertisements with a single query"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM advertisements WHERE is_active = 1')
+                self.ad_index.load(self._row_to_advertisement(row) for row in cursor)
+        except Exception as e:
+            logger.error(f"Error loading advertisement index: {e}")
     
     def save_advertisement(self, ad: AdvertisementModel) -> int:
         """Save or update advertisement"""
@@ -159,12 +319,386 @@ class DatabaseManager:
                     ad_id = cursor.lastrowid
                 
                 conn.commit()
+                self.ad_index.set(ad.ss_id, ad_id, ad.price, advertisement_fingerprint(ad))
                 return ad_id
                 
         except Exception as e:
             logger.error(f"Error saving advertisement {ad.ss_id}: {e}")
             raise
     
+    def save_advertisements_bulk(self, ads: List[AdvertisementModel],
+                                 build_outbox: Callable[[List[UpsertResult]],
+                                                        List[OutboxMessageModel]] = None
+                                 ) -> List[UpsertResult]:
+        """Save or update a batch of advertisements in one transaction
+        
+        Returns one result per unique ss_id, in input order, classifying the
+        advertisement as inserted, price_changed or unchanged. Price history
+        for new ads and price changes is written in the same transaction.
+        Ads are classified against the stored prices, read under the write
+        lock since other workers may have changed them; the in-memory index
+        only tells which rows have unchanged content and need no write.
+        
+        build_outbox turns the results into notifications, which are stored
+        in the outbox within the same transaction (their ids are set), so a
+        change is never committed without its notifications.
+        """
+        if not ads:
+            return []
+        
+        # The same ad can show up on two pages when the listing shifts during a scan
+        unique_ads: Dict[str, AdvertisementModel] = {}
+        for ad in ads:
+            unique_ads.setdefault(ad.ss_id, ad)
+        ss_ids = list(unique_ads)
+        fingerprints = {ss_id: advertisement_fingerprint(ad) for ss_id, ad in unique_ads.items()}
+        
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if not conn.in_transaction:
+                    # Hold the write lock from the read on, no other worker writes in between
+                    cursor.execute('BEGIN IMMEDIATE')
+                
+                existing = self._select_ids_and_prices(cursor, ss_ids)
+                unchanged_content = set()
+                for ss_id, stored in existing.items():
+                    indexed = self.ad_index.get(ss_id)
+                    # The fingerprint is only trusted while the stored row still matches the index
+                    if (indexed and (indexed.id, indexed.price) == stored
+                            and indexed.fingerprint == fingerprints[ss_id]):
+                        unchanged_content.add(ss_id)
+                
+                cursor.executemany('''
+                    INSERT INTO advertisements (
+                        ss_id, title, url, price, currency, price_per_sqm, is_monthly,
+                        location, area, rooms, floor, total_floors, property_type,
+                        image_url, description
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(ss_id) DO UPDATE SET
+                        title = excluded.title, url = excluded.url, price = excluded.price,
+                        currency = excluded.currency, price_per_sqm = excluded.price_per_sqm,
+                        is_monthly = excluded.is_monthly, location = excluded.location,
+                        area = excluded.area, rooms = excluded.rooms, floor = excluded.floor,
+                        total_floors = excluded.total_floors,
+                        property_type = excluded.property_type,
+                        image_url = excluded.image_url, description = excluded.description,
+                        updated_at = CURRENT_TIMESTAMP, is_active = 1
+                ''', [
+                    (
+                        ad.ss_id, ad.title, ad.url, ad.price, ad.currency, ad.price_per_sqm,
+                        ad.is_monthly, ad.location, ad.area, ad.rooms, ad.floor,
+                        ad.total_floors, ad.property_type, ad.image_url, ad.description
+                    )
+                    for ss_id, ad in unique_ads.items()
+                    if ss_id not in unchanged_content
+                ])
+                
+                # executemany has no lastrowid per row, look up ids of inserted ads
+                inserted = self._select_ids_and_prices(
+                    cursor, [ss_id for ss_id in ss_ids if ss_id not in existing]
+                )
+                
+                results = []
+                for ss_id, ad in unique_ads.items():
+                    if ss_id in existing:
+                        ad_id, old_price = existing[ss_id]
+                        status = 'price_changed' if old_price != ad.price else 'unchanged'
+                    else:
+                        ad_id, old_price = inserted[ss_id][0], None
+                        status = 'inserted'
+                    results.append(UpsertResult(
+                        advertisement_id=ad_id,
+                        ss_id=ss_id,
+                        status=status,
+                        old_price=old_price,
+                        new_price=ad.price
+                    ))
+                
+                cursor.executemany('''
+                    INSERT INTO price_history (
+                        advertisement_id, old_price, new_price, currency, change_type
+                    ) VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (
+                        result.advertisement_id, result.old_price, result.new_price,
+                        unique_ads[result.ss_id].currency,
+                        'new_ad' if result.is_new else 'price_change'
+                    )
+                    for result in results
+                    if result.is_price_changed or (result.is_new and result.new_price)
+                ])
+                
+                if build_outbox:
+                    self._insert_outbox_messages(cursor, build_outbox(results))
+                
+                conn.commit()
+                
+                for result in results:
+                    self.ad_index.set(result.ss_id, result.advertisement_id, result.new_price,
+                                      fingerprints[result.ss_id])
+                return results
+                
+        except Exception as e:
+            logger.error(f"Error saving {len(unique_ads)} advertisements: {e}")
+            raise
+    
+    def _select_ids_and_prices(self, cursor, ss_ids: List[str]) -> Dict[str, tuple]:
+        """Get (id, price) of stored advertisements by SS ID"""
+        found = {}
+        for start in range(0, len(ss_ids), SQL_VARIABLES_CHUNK):
+            chunk = ss_ids[start:start + SQL_VARIABLES_CHUNK]
+            cursor.execute(
+                "SELECT id, ss_id, price FROM advertisements "
+                f"WHERE ss_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                found[row['ss_id']] = (row['id'], row['price'])
+        return found
+    
+    def _insert_outbox_messages(self, cursor, messages: List[OutboxMessageModel]):
+        """Insert pending outbox messages, setting their ids"""
+        for message in messages:
+            cursor.execute('''
+                INSERT INTO outbox (chat_id, message, advertisement_id, status)
+                VALUES (?, ?, ?, 'pending')
+            ''', (message.chat_id, message.message, message.advertisement_id))
+            message.id = cursor.lastrowid
+            message.status = 'pending'
+    
+    def get_pending_outbox(self, limit: int = None) -> List[OutboxMessageModel]:
+        """Get undelivered outbox messages, oldest first"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                query = "SELECT * FROM outbox WHERE status = 'pending' ORDER BY id"
+                if limit:
+                    query += f" LIMIT {int(limit)}"
+                cursor.execute(query)
+                return [self._row_to_outbox_message(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting pending outbox messages: {e}")
+            return []
+    
+    def mark_outbox_delivered(self, message_id: int, attempts: int = 1) -> bool:
+        """Mark outbox message as delivered"""
+        return self._set_outbox_status(message_id, 'delivered', attempts)
+    
+    def mark_outbox_failed(self, message_id: int, attempts: int = 1) -> bool:
+        """Mark outbox message as permanently failed, it is not replayed"""
+        return self._set_outbox_status(message_id, 'failed', attempts)
+    
+    def _set_outbox_status(self, message_id: int, status: str, attempts: int) -> bool:
+        """Record final status of an outbox message"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE outbox SET status = ?, attempts = ?,
+                        delivered_at = CASE WHEN ? = 'delivered'
+                            THEN CURRENT_TIMESTAMP ELSE delivered_at END
+                    WHERE id = ?
+                ''', (status, attempts, status, message_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error updating outbox message {message_id}: {e}")
+            return False
+    
+    def claim_notifications(self, keys: List[tuple]) -> List[bool]:
+        """Record (user_id, ss_id, event_type, price) keys in the ledger
+        
+        Returns True for keys not recorded before. Joins the caller's open
+        transaction (e.g. a bulk upsert building its outbox) instead of
+        committing, so claims roll back together with it.
+        """
+        if not keys:
+            return []
+        
+        try:
+            with self._get_connection() as conn:
+                joined = conn.in_transaction
+                cursor = conn.cursor()
+                claimed = []
+                for user_id, ss_id, event_type, price in keys:
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO notification_ledger
+                            (user_id, ss_id, event_type, price)
+                        VALUES (?, ?, ?, ?)
+                    ''', (user_id, ss_id, event_type, price if price is not None else 0))
+                    claimed.append(cursor.rowcount == 1)
+                if not joined:
+                    conn.commit()
+                return claimed
+        except Exception as e:
+            logger.error(f"Error recording {len(keys)} notifications in the ledger: {e}")
+            raise
+    
+    def purge_notification_ledger(self, ttl_seconds: int) -> int:
+        """Delete ledger entries older than ttl_seconds, returns number deleted"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM notification_ledger WHERE created_at < datetime('now', ?)",
+                    (f'-{int(ttl_seconds)} seconds',)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error purging notification ledger: {e}")
+            return 0
+    
+    def get_scan_states(self, section_urls: List[str] = None) -> List[ScanStateModel]:
+        """Get scan state of the given sections, or of all sections"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if section_urls is None:
+                    cursor.execute('SELECT * FROM scan_state ORDER BY next_due_at')
+                    return [self._row_to_scan_state(row) for row in cursor.fetchall()]
+                
+                section_urls = list(section_urls)
+                states = []
+                for start in range(0, len(section_urls), SQL_VARIABLES_CHUNK):
+                    chunk = section_urls[start:start + SQL_VARIABLES_CHUNK]
+                    cursor.execute(
+                        "SELECT * FROM scan_state "
+                        f"WHERE section_url IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    )
+                    states.extend(self._row_to_scan_state(row) for row in cursor.fetchall())
+                return states
+        except Exception as e:
+            logger.error(f"Error getting scan states: {e}")
+            return []
+    
+    def save_scan_state(self, state: ScanStateModel) -> bool:
+        """Insert or update scan state of a section"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO scan_state (
+                        section_url, last_scan_at, next_due_at, last_result_hash,
+                        consecutive_failures, churn_rate
+                    ) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(section_url) DO UPDATE SET
+                        last_scan_at = excluded.last_scan_at, next_due_at = excluded.next_due_at,
+                        last_result_hash = excluded.last_result_hash,
+                        consecutive_failures = excluded.consecutive_failures,
+                        churn_rate = excluded.churn_rate
+                ''', (
+                    state.section_url,
+                    state.last_scan_at.isoformat(sep=' ') if state.last_scan_at else None,
+                    state.next_due_at.isoformat(sep=' '),
+                    state.last_result_hash,
+                    state.consecutive_failures,
+                    state.churn_rate
+                ))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error saving scan state of {state.section_url}: {e}")
+            return False
+    
+    def acquire_scan_leases(self, owner_id: str, section_urls: List[str], duration: float,
+                            now: datetime = None, limit: int = None) -> List[str]:
+        """Lease up to limit sections to owner_id for duration seconds, returns the sections leased
+        
+        A section is leased when it has no lease, its lease expired or
+        owner_id already holds it. All claims happen in one transaction, so
+        concurrent workers never lease the same section.
+        """
+        if not section_urls:
+            return []
+        
+        now = now or datetime.now()
+        expires_at = (now + timedelta(seconds=duration)).isoformat(sep=' ')
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                leased = []
+                for url in section_urls:
+                    if limit is not None and len(leased) >= limit:
+                        break
+                    cursor.execute('''
+                        INSERT INTO scan_leases (section_url, owner_id, expires_at, heartbeat_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(section_url) DO UPDATE SET
+                            owner_id = excluded.owner_id, expires_at = excluded.expires_at,
+                            heartbeat_at = excluded.heartbeat_at
+                        WHERE scan_leases.expires_at <= ?
+                            OR scan_leases.owner_id = excluded.owner_id
+                    ''', (url, owner_id, expires_at, now.isoformat(sep=' '),
+                          now.isoformat(sep=' ')))
+                    if cursor.rowcount == 1:
+                        leased.append(url)
+                conn.commit()
+                return leased
+        except Exception as e:
+            logger.error(f"Error acquiring {len(section_urls)} scan leases: {e}")
+            return []
+    
+    def renew_scan_leases(self, owner_id: str, section_urls: List[str], duration: float,
+                          now: datetime = None) -> List[str]:
+        """Extend leases still held by owner_id, returns the sections renewed"""
+        if not section_urls:
+            return []
+        
+        now = now or datetime.now()
+        expires_at = (now + timedelta(seconds=duration)).isoformat(sep=' ')
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                renewed = []
+                for url in section_urls:
+                    cursor.execute('''
+                        UPDATE scan_leases SET expires_at = ?, heartbeat_at = ?
+                        WHERE section_url = ? AND owner_id = ?
+                    ''', (expires_at, now.isoformat(sep=' '), url, owner_id))
+                    if cursor.rowcount == 1:
+                        renewed.append(url)
+                conn.commit()
+                return renewed
+        except Exception as e:
+            logger.error(f"Error renewing {len(section_urls)} scan leases: {e}")
+            return []
+    
+    def release_scan_leases(self, owner_id: str, section_urls: List[str] = None) -> int:
+        """Release leases held by owner_id on the given sections, or all of them"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if section_urls is None:
+                    cursor.execute('DELETE FROM scan_leases WHERE owner_id = ?', (owner_id,))
+                    released = cursor.rowcount
+                else:
+                    released = 0
+                    for url in section_urls:
+                        cursor.execute(
+                            'DELETE FROM scan_leases WHERE section_url = ? AND owner_id = ?',
+                            (url, owner_id)
+                        )
+                        released += cursor.rowcount
+                conn.commit()
+                return released
+        except Exception as e:
+            logger.error(f"Error releasing scan leases of {owner_id}: {e}")
+            return 0
+    
+    def get_scan_leases(self) -> List[ScanLeaseModel]:
+        """Get all section leases"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM scan_leases ORDER BY expires_at')
+                return [self._row_to_scan_lease(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting scan leases: {e}")
+            return []
+    
     def get_advertisement_by_ss_id(self, ss_id: str) -> Optional[AdvertisementModel]:
         """Get advertisement by SS ID"""
         try:
@@ -256,6 +790,7 @@ class DatabaseManager:
                 ))
                 
                 conn.commit()
+                self._notify_subscription_change(subscription.user_id)
                 return cursor.lastrowid
                 
         except Exception as e:
@@ -310,33 +845,44 @@ class DatabaseManager:
                 ))
                 
                 conn.commit()
+                self._notify_subscription_change(subscription.user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
             logger.error(f"Error updating subscription: {e}")
             return False
     
-    def get_total_ads_count(self) -> int:
-        """Get total advertisements count"""
+    def add_subscription_listener(self, callback: Callable[[str], None]):
+        """Call callback(user_id) after every committed subscription write"""
+        self._subscription_listeners.append(callback)
+    
+    def _notify_subscription_change(self, user_id: str):
+        """Tell listeners that subscriptions of a user changed"""
+        for callback in self._subscription_listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.error(f"Error notifying subscription change of user {user_id}: {e}")
+    
+    def get_counter(self, name: str) -> int:
+        """Get value of a maintained counter"""
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM advertisements WHERE is_active = 1')
-                return cursor.fetchone()[0]
+                cursor.execute('SELECT value FROM counters WHERE name = ?', (name,))
+                row = cursor.fetchone()
+                return row[0] if row else 0
         except Exception as e:
-            logger.error(f"Error getting ads count: {e}")
+            logger.error(f"Error getting counter {name}: {e}")
             return 0
     
+    def get_total_ads_count(self) -> int:
+        """Get total advertisements count"""
+        return self.get_counter('active_ads')
+    
     def get_total_subscriptions_count(self) -> int:
         """Get total subscriptions count"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM subscriptions WHERE is_active = 1')
-                return cursor.fetchone()[0]
-        except Exception as e:
-            logger.error(f"Error getting subscriptions count: {e}")
-            return 0
+        return self.get_counter('active_subscriptions')
     
     def _row_to_advertisement(self, row) -> AdvertisementModel:
         """Convert database row to AdvertisementModel"""
@@ -374,6 +920,41 @@ class DatabaseManager:
             created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
         )
     
+    def _row_to_outbox_message(self, row) -> OutboxMessageModel:
+        """Convert database row to OutboxMessageModel"""
+        return OutboxMessageModel(
+            id=row['id'],
+            chat_id=row['chat_id'],
+            message=row['message'],
+            advertisement_id=row['advertisement_id'],
+            status=row['status'],
+            attempts=row['attempts'],
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
+            delivered_at=(datetime.fromisoformat(row['delivered_at'])
+                          if row['delivered_at'] else None)
+        )
+    
+    def _row_to_scan_state(self, row) -> ScanStateModel:
+        """Convert database row to ScanStateModel"""
+        return ScanStateModel(
+            section_url=row['section_url'],
+            next_due_at=datetime.fromisoformat(row['next_due_at']),
+            last_scan_at=(datetime.fromisoformat(row['last_scan_at'])
+                          if row['last_scan_at'] else None),
+            last_result_hash=row['last_result_hash'],
+            consecutive_failures=row['consecutive_failures'],
+            churn_rate=row['churn_rate'] or 0.0
+        )
+    
+    def _row_to_scan_lease(self, row) -> ScanLeaseModel:
+        """Convert database row to ScanLeaseModel"""
+        return ScanLeaseModel(
+            section_url=row['section_url'],
+            owner_id=row['owner_id'],
+            expires_at=datetime.fromisoformat(row['expires_at']),
+            heartbeat_at=datetime.fromisoformat(row['heartbeat_at'])
+        )
+    
     def _row_to_subscription(self, row) -> SubscriptionModel:
         """Convert database row to SubscriptionModel"""
         return SubscriptionModel(
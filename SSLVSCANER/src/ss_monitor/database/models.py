@@ -1,7 +1,7 @@
 """
 Database models for SS.lv Monitor
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -113,6 +113,55 @@ class PriceHistoryModel:
             created_at=datetime.fromisoformat(data['created_at']) if data.get('created_at') else None
         )
 
+@dataclass
+class UpsertResult:
+    """Outcome of saving one advertisement in a bulk upsert"""
+    advertisement_id: int
+    ss_id: str
+    status: str  # inserted, price_changed, unchanged
+    old_price: Optional[float] = None
+    new_price: Optional[float] = None
+    
+    @property
+    def is_new(self) -> bool:
+        """Advertisement was not in the database before"""
+        return self.status == 'inserted'
+    
+    @property
+    def is_price_changed(self) -> bool:
+        """Known advertisement with a different price"""
+        return self.status == 'price_changed'
+
+@dataclass
+class OutboxMessageModel:
+    """Notification stored in the outbox until it is delivered"""
+    id: Optional[int] = None
+    chat_id: str = ""
+    message: str = ""
+    advertisement_id: Optional[int] = None
+    status: str = "pending"  # pending, delivered, failed
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    delivered_at: Optional[datetime] = None
+
+@dataclass
+class ScanStateModel:
+    """Scan schedule and outcome of one listing section"""
+    section_url: str = ""
+    next_due_at: Optional[datetime] = None
+    last_scan_at: Optional[datetime] = None
+    last_result_hash: Optional[str] = None
+    consecutive_failures: int = 0
+    churn_rate: float = 0.0  # new ads and price changes per hour, EWMA
+
+@dataclass
+class ScanLeaseModel:
+    """Lease of a listing section held by one scanner worker"""
+    section_url: str = ""
+    owner_id: str = ""
+    expires_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+
 @dataclass
 class SubscriptionModel:
     """Subscription database model"""
@@ -172,3 +221,11 @@ class SubscriptionModel:
             created_at=datetime.fromisoformat(data['created_at']) if data.get('created_at') else None,
             updated_at=datetime.fromisoformat(data['updated_at']) if data.get('updated_at') else None
         )
+
+@dataclass
+class UserSnapshot:
+    """Cached subscriptions and statistics of a user"""
+    user_id: str
+    subscriptions: List[SubscriptionModel] = field(default_factory=list)
+    stats: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = 0.0  # time.monotonic()
@@ -1,19 +1,61 @@
 """
 User and subscription management for SS.lv Monitor
 """
+import time
 import logging
+import threading
+from dataclasses import replace
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime
+from ..config import config
 from .database_manager import DatabaseManager
-from .models import SubscriptionModel
+from .models import SubscriptionModel, UserSnapshot
 
 logger = logging.getLogger(__name__)
 
 class UserManager:
-    """User and subscription management"""
+    """User and subscription management
     
-    def __init__(self, db_manager: DatabaseManager):
+    Subscriptions and statistics of a user are served from an in-memory
+    snapshot, dropped whenever the database commits a subscription write
+    and otherwise refreshed after STATUS_CACHE_TTL seconds (writes of other
+    processes).
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, snapshot_ttl: float = None):
         self.db_manager = db_manager
+        self.snapshot_ttl = config.STATUS_CACHE_TTL if snapshot_ttl is None else snapshot_ttl
+        self._snapshots: Dict[str, UserSnapshot] = {}
+        self._generations: Dict[str, int] = {}  # user_id -> number of invalidations
+        self._lock = threading.Lock()
+        db_manager.add_subscription_listener(self.invalidate)
+    
+    def invalidate(self, user_id: str):
+        """Drop cached snapshot of a user"""
+        with self._lock:
+            self._snapshots.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+    
+    def get_user_snapshot(self, user_id: str) -> UserSnapshot:
+        """Get subscriptions and statistics of a user, from memory when cached"""
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            generation = self._generations.get(user_id, 0)
+        if snapshot and time.monotonic() - snapshot.loaded_at <= self.snapshot_ttl:
+            return snapshot
+        
+        subscriptions = self.db_manager.get_subscriptions(user_id=user_id, active_only=True)
+        snapshot = UserSnapshot(
+            user_id=user_id,
+            subscriptions=subscriptions,
+            stats=self._build_user_stats(user_id, subscriptions),
+            loaded_at=time.monotonic()
+        )
+        with self._lock:
+            # A write committed while loading makes this snapshot stale already
+            if self._generations.get(user_id, 0) == generation:
+                self._snapshots[user_id] = snapshot
+        return snapshot
     
     def create_user_subscription(self, user_id: str, url: str, frequency: str = '1h') -> bool:
         """Create user subscription"""
@@ -50,7 +92,9 @@ class UserManager:
     def get_user_subscriptions(self, user_id: str) -> List[SubscriptionModel]:
         """Get user subscriptions"""
         try:
-            return self.db_manager.get_subscriptions(user_id=user_id, active_only=True)
+            # Copies, callers may modify them before writing
+            snapshot = self.get_user_snapshot(user_id)
+            return [replace(subscription) for subscription in snapshot.subscriptions]
         except Exception as e:
             logger.error(f"Error getting subscriptions for user {user_id}: {e}")
             return []
@@ -157,8 +201,15 @@ class UserManager:
     def get_user_stats(self, user_id: str) -> Dict[str, Any]:
         """Get user statistics"""
         try:
-            subscriptions = self.get_user_subscriptions(user_id)
-            
+            return dict(self.get_user_snapshot(user_id).stats)
+        except Exception as e:
+            logger.error(f"Error getting stats for user {user_id}: {e}")
+            return self._build_user_stats(user_id, [])
+    
+    def _build_user_stats(self, user_id: str,
+                          subscriptions: List[SubscriptionModel]) -> Dict[str, Any]:
+        """Build user statistics from the user's subscriptions"""
+        try:
             return {
                 'user_id': user_id,
                 'total_subscriptions': len(subscriptions),
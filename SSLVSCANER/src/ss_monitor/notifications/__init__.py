@@ -2,5 +2,13 @@
 Notifications package for SS.lv Monitor
 """
 from .notification_system import NotificationSystem
+from .subscription_index import SubscriptionIndex
+from .batch_matcher import BatchMatcher
+from .delivery import DeliveryPipeline
+from .outbox import OutboxDispatcher
+from .ledger import NotificationLedger
 
-__all__ = ['NotificationSystem']
+__all__ = [
+    'NotificationSystem', 'SubscriptionIndex', 'BatchMatcher', 'DeliveryPipeline',
+    'OutboxDispatcher', 'NotificationLedger'
+]
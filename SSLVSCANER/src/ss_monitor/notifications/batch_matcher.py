@@ -0,0 +1,95 @@
+"""
+Vectorized batch matching of advertisements against subscriptions
+
+Requires the optional numpy dependency; callers check NUMPY_AVAILABLE and
+fall back to SubscriptionIndex without it.
+"""
+import math
+import logging
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ..parser import Advertisement
+from ..database.models import SubscriptionModel
+from .subscription_index import DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+NUMPY_AVAILABLE = np is not None
+
+# Upper bound of ads x subscriptions cells evaluated at once
+MAX_MATRIX_CELLS = 4_000_000
+
+ANY_CATEGORY = -1
+UNKNOWN_CATEGORY = -2
+
+def _value(value) -> float:
+    """Ad value or subscription bound as float, NaN when empty (passes every comparison)"""
+    return float(value) if value else math.nan
+
+class BatchMatcher:
+    """Match a batch of ads against all subscriptions with NumPy broadcasting
+    
+    Gives the same matches as subscription_matches: NaN bounds are open and
+    a NaN ad value fails no comparison, so a missing value passes.
+    """
+    
+    def __init__(self, subscriptions: List[SubscriptionModel]):
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy is required for batch matching")
+        
+        self._subscriptions = list(subscriptions)
+        self._category_codes = {}
+        for subscription in self._subscriptions:
+            if subscription.category:
+                self._category_codes.setdefault(subscription.category, len(self._category_codes))
+        
+        self._categories = np.array([
+            self._category_codes[sub.category] if sub.category else ANY_CATEGORY
+            for sub in self._subscriptions
+        ], dtype=np.int32)
+        self._bounds = {
+            name: (
+                np.array([_value(getattr(sub, min_attr)) for sub in self._subscriptions],
+                         dtype=np.float64),
+                np.array([_value(getattr(sub, max_attr)) for sub in self._subscriptions],
+                         dtype=np.float64)
+            )
+            for name, (_, min_attr, max_attr) in DIMENSIONS.items()
+        }
+    
+    def match_matrix(self, ads: List[Advertisement]) -> 'np.ndarray':
+        """Boolean ads x subscriptions match matrix"""
+        ad_categories = np.array([
+            self._category_codes.get(ad.property_type, UNKNOWN_CATEGORY) for ad in ads
+        ], dtype=np.int32)
+        matrix = ((self._categories[None, :] == ANY_CATEGORY)
+                  | (ad_categories[:, None] == self._categories[None, :]))
+        
+        for name, (get_value, _, _) in DIMENSIONS.items():
+            values = np.array([_value(get_value(ad)) for ad in ads], dtype=np.float64)[:, None]
+            min_values, max_values = self._bounds[name]
+            matrix &= ~(values < min_values[None, :])
+            matrix &= ~(values > max_values[None, :])
+        
+        return matrix
+    
+    def match_all(self, ads: List[Advertisement]) -> List[List[SubscriptionModel]]:
+        """Matching subscriptions for every ad, in subscription order"""
+        if not self._subscriptions:
+            return [[] for _ in ads]
+        
+        chunk_size = max(1, MAX_MATRIX_CELLS // len(self._subscriptions))
+        results = []
+        for start in range(0, len(ads), chunk_size):
+            matrix = self.match_matrix(ads[start:start + chunk_size])
+            for row in matrix:
+                results.append([self._subscriptions[position] for position in np.flatnonzero(row)])
+        return results
+    
+    def __len__(self) -> int:
+        return len(self._subscriptions)
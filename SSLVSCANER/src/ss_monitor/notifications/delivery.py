@@ -0,0 +1,253 @@
+"""
+Rate-limited concurrent delivery of Telegram messages
+"""
+import asyncio
+import threading
+import warnings
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from ..config import config
+from ..rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# First retry delay after a failed send, doubled on every further attempt
+RETRY_BACKOFF = 1.0
+
+SendFunction = Callable[[str, str], Awaitable[None]]
+FinishedCallback = Callable[['OutgoingMessage', bool], None]
+
+@dataclass
+class OutgoingMessage:
+    """Message waiting for delivery"""
+    chat_id: str
+    text: str
+    attempts: int = 0
+    outbox_ids: Tuple[int, ...] = ()  # outbox rows carried by this message
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Seconds to wait from a RetryAfter error (int or timedelta depending on version)"""
+    with warnings.catch_warnings():
+        # Deprecation notice about the int -> timedelta switch, both are handled
+        warnings.simplefilter('ignore')
+        retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+_global_limiter: Optional[TokenBucket] = None
+_global_limiter_lock = threading.Lock()
+
+def get_global_limiter() -> TokenBucket:
+    """Get the process-wide token bucket for the bot's outgoing messages"""
+    global _global_limiter
+    with _global_limiter_lock:
+        if _global_limiter is None:
+            rate = config.TELEGRAM_GLOBAL_RATE
+            _global_limiter = TokenBucket(rate, max(1, int(rate)))
+        return _global_limiter
+
+class DeliveryPipeline:
+    """Queue of outgoing messages drained by concurrent workers
+    
+    Every chat has its own FIFO lane handled by at most one worker at a
+    time, so messages to one chat keep their order and obey the per-chat
+    rate while other chats are served in parallel under the global rate.
+    A chat waiting for its rate is parked on a timer instead of holding a
+    worker. Messages are only dropped on permanent errors (bot blocked,
+    chat not found) or after DELIVERY_MAX_RETRIES failed attempts.
+    """
+    
+    def __init__(self, send: SendFunction, workers: Optional[int] = None,
+                 global_limiter: Optional[TokenBucket] = None, chat_rate: Optional[float] = None,
+                 max_retries: Optional[int] = None, on_finished: Optional[FinishedCallback] = None):
+        self.send = send
+        self.on_finished = on_finished
+        self.workers = max(1, workers or config.DELIVERY_WORKERS)
+        self.global_limiter = global_limiter or get_global_limiter()
+        self.chat_rate = chat_rate or config.TELEGRAM_CHAT_RATE
+        self.max_retries = config.DELIVERY_MAX_RETRIES if max_retries is None else max_retries
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Queue] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks = []
+        self._timers = set()
+        self._lanes: Dict[str, Deque[OutgoingMessage]] = {}
+        self._chat_limiters: Dict[str, TokenBucket] = {}
+        self._pending = 0
+        
+        self.stats = {'delivered': 0, 'retried': 0, 'failed': 0}
+    
+    def _ensure_started(self):
+        """Start workers on the running loop, state of a previous loop is discarded"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        
+        if self._pending:
+            logger.warning(
+                f"Discarding {self._pending} undelivered messages from a closed event loop"
+            )
+        self._loop = loop
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._timers = set()
+        self._lanes = {}
+        self._pending = 0
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+    
+    def enqueue(self, chat_id, text: str, outbox_ids: Iterable[int] = ()):
+        """Queue a message for delivery, must be called from the event loop"""
+        self._ensure_started()
+        chat_id = str(chat_id)
+        message = OutgoingMessage(chat_id, text, outbox_ids=tuple(outbox_ids))
+        
+        self._pending += 1
+        self._idle.clear()
+        
+        lane = self._lanes.get(chat_id)
+        if lane:
+            lane.append(message)
+        else:
+            self._lanes[chat_id] = deque([message])
+            self._schedule(chat_id, 0)
+    
+    @property
+    def pending(self) -> int:
+        """Number of queued messages not yet delivered or dropped"""
+        return self._pending
+    
+    def queued_outbox_ids(self) -> Set[int]:
+        """Outbox ids of messages still waiting in this loop's lanes"""
+        if self._loop is not asyncio.get_running_loop():
+            return set()
+        return {
+            outbox_id
+            for lane in self._lanes.values() for message in lane
+            for outbox_id in message.outbox_ids
+        }
+    
+    async def join(self):
+        """Wait until every queued message is delivered or dropped"""
+        if self._idle is not None and self._loop is asyncio.get_running_loop():
+            await self._idle.wait()
+    
+    async def stop(self, timeout: Optional[float] = None):
+        """Deliver what is queued (up to timeout seconds) and stop workers"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Delivery stopped with {self._pending} undelivered messages")
+        
+        for timer in self._timers:
+            timer.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._loop = None
+        self._tasks = []
+    
+    def _chat_limiter(self, chat_id: str) -> TokenBucket:
+        """Get the token bucket of a chat"""
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = self._chat_limiters[chat_id] = TokenBucket(self.chat_rate)
+        return limiter
+    
+    def _schedule(self, chat_id: str, delay: float):
+        """Hand the chat's lane to a worker now or after delay seconds"""
+        if delay <= 0:
+            self._ready.put_nowait(chat_id)
+            return
+        
+        def wake():
+            self._timers.discard(timer)
+            self._ready.put_nowait(chat_id)
+        
+        timer = self._loop.call_later(delay, wake)
+        self._timers.add(timer)
+    
+    def _finish(self, chat_id: str, delivered: bool):
+        """Remove the lane's head message and pass the lane on"""
+        lane = self._lanes[chat_id]
+        message = lane.popleft()
+        self.stats['delivered' if delivered else 'failed'] += 1
+        
+        if self.on_finished:
+            try:
+                self.on_finished(message, delivered)
+            except Exception as e:
+                logger.error(f"Error recording delivery to {chat_id}: {e}")
+        
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+        
+        if lane:
+            self._schedule(chat_id, 0)
+        else:
+            del self._lanes[chat_id]
+    
+    async def _worker(self):
+        """Deliver head messages of ready chat lanes"""
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._deliver_next(chat_id)
+            except Exception as e:
+                logger.error(f"Error delivering message to {chat_id}: {e}")
+                if self._lanes.get(chat_id):
+                    self._finish(chat_id, delivered=False)
+    
+    async def _deliver_next(self, chat_id: str):
+        """Send the head message of a chat lane, rescheduling it on rate limits and errors"""
+        wait = self._chat_limiter(chat_id).try_acquire()
+        if wait > 0:
+            self._schedule(chat_id, wait)
+            return
+        
+        message = self._lanes[chat_id][0]
+        await self.global_limiter.acquire_async()
+        
+        try:
+            await self.send(chat_id, message.text)
+        
+        except RetryAfter as e:
+            # Flood control applies to the whole bot, hold back every chat
+            delay = retry_after_seconds(e)
+            logger.warning(f"Telegram flood control, retrying {chat_id} in {delay:.1f}s")
+            self.global_limiter.pause(delay)
+            self.stats['retried'] += 1
+            self._schedule(chat_id, delay)
+        
+        except (Forbidden, BadRequest) as e:
+            logger.error(f"Dropping message to {chat_id}: {e}")
+            self._finish(chat_id, delivered=False)
+        
+        except Exception as e:
+            message.attempts += 1
+            if message.attempts > self.max_retries:
+                logger.error(
+                    f"Dropping message to {chat_id} after {message.attempts} attempts: {e}"
+                )
+                self._finish(chat_id, delivered=False)
+            else:
+                delay = RETRY_BACKOFF * 2 ** (message.attempts - 1)
+                logger.warning(f"Error sending message to {chat_id}, "
+                               f"retry {message.attempts} in {delay:.1f}s: {e}")
+                self.stats['retried'] += 1
+                self._schedule(chat_id, delay)
+        
+        else:
+            self._finish(chat_id, delivered=True)
@@ -0,0 +1,124 @@
+"""
+Per-user digest batching of notifications
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import config
+from ..database.models import OutboxMessageModel
+from .delivery import DeliveryPipeline
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects longer text messages
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+
+# Room kept in a message for the digest header and the overflow note
+DIGEST_RESERVE = 100
+
+def pack_digest(texts: List[str], max_messages: int,
+                limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[Tuple[str, int]]:
+    """Pack notification texts into at most max_messages messages under limit
+    
+    Returns (message, number of texts it covers) pairs. Texts that do not
+    fit are summarized by a note at the end of the last message and are
+    counted as covered by it.
+    """
+    max_messages = max(1, max_messages)
+    item_limit = limit - 2 * DIGEST_RESERVE
+    
+    packed: List[Tuple[str, int]] = []
+    parts = [f"📬 Подборка уведомлений: {len(texts)}"]
+    length = len(parts[0])
+    covered = 0
+    
+    for position, text in enumerate(texts):
+        if len(text) > item_limit:
+            text = text[:item_limit - 1] + "…"
+        
+        # The last allowed message keeps room for the overflow note
+        budget = limit - (DIGEST_RESERVE if len(packed) == max_messages - 1 else 0)
+        if covered and length + len(DIGEST_SEPARATOR) + len(text) > budget:
+            if len(packed) == max_messages - 1:
+                parts.append(f"…и ещё {len(texts) - position} уведомлений")
+                covered += len(texts) - position
+                break
+            packed.append((DIGEST_SEPARATOR.join(parts), covered))
+            parts, length, covered = [], -len(DIGEST_SEPARATOR), 0
+        
+        parts.append(text)
+        length += len(DIGEST_SEPARATOR) + len(text)
+        covered += 1
+    
+    packed.append((DIGEST_SEPARATOR.join(parts), covered))
+    return packed
+
+class DigestBuffer:
+    """Buffer notifications per user and send them as digests
+    
+    The first notification for a user opens a cooldown window; everything
+    matched for that user until it closes goes out together. Buffered
+    outbox rows stay pending, so a crash loses no notification.
+    """
+    
+    def __init__(self, pipeline: DeliveryPipeline, cooldown: Optional[float] = None,
+                 max_messages: Optional[int] = None):
+        self.pipeline = pipeline
+        self.cooldown = config.NOTIFICATION_COOLDOWN if cooldown is None else cooldown
+        self.max_messages = max_messages or config.DIGEST_MAX_MESSAGES
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffers: Dict[str, List[OutboxMessageModel]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+    
+    def _ensure_loop(self):
+        """Bind to the running loop, buffers of a previous loop are discarded"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._buffers = {}
+            self._timers = {}
+    
+    def add(self, message: OutboxMessageModel):
+        """Buffer a stored notification until its user's window closes"""
+        self._ensure_loop()
+        chat_id = str(message.chat_id)
+        self._buffers.setdefault(chat_id, []).append(message)
+        if chat_id not in self._timers:
+            self._timers[chat_id] = self._loop.call_later(self.cooldown, self.flush, chat_id)
+    
+    def buffered_ids(self) -> Set[int]:
+        """Outbox ids waiting in open windows of this loop"""
+        if self._loop is not asyncio.get_running_loop():
+            return set()
+        return {message.id for messages in self._buffers.values() for message in messages}
+    
+    def flush(self, chat_id: Optional[str] = None):
+        """Send the digest of one user now, or of every user"""
+        chat_ids = [chat_id] if chat_id is not None else list(self._buffers)
+        for chat_id in chat_ids:
+            timer = self._timers.pop(chat_id, None)
+            if timer:
+                timer.cancel()
+            messages = self._buffers.pop(chat_id, [])
+            if messages:
+                self._send(chat_id, messages)
+    
+    def _send(self, chat_id: str, messages: List[OutboxMessageModel]):
+        """Queue digest messages, each carrying the outbox rows it covers"""
+        if len(messages) == 1:
+            self.pipeline.enqueue(chat_id, messages[0].message, outbox_ids=[messages[0].id])
+            return
+        
+        start = 0
+        packed = pack_digest([message.message for message in messages], self.max_messages)
+        for text, covered in packed:
+            outbox_ids = [message.id for message in messages[start:start + covered]]
+            self.pipeline.enqueue(chat_id, text, outbox_ids=outbox_ids)
+            start += covered
+        logger.info(
+            f"Digest for {chat_id}: {len(messages)} notifications in {len(packed)} messages"
+        )
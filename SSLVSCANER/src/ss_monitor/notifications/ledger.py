@@ -0,0 +1,86 @@
+"""
+Ledger of sent notifications for deduplication
+"""
+import threading
+import logging
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from ..config import config
+from ..database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# user_id, ss_id, event_type, price
+NotificationKey = Tuple[str, str, str, Optional[float]]
+
+class NotificationLedger:
+    """Reject notifications already sent to a user
+    
+    Keys live in the notification_ledger table (unique per user, ad, event
+    and price) with an LRU of recent keys in front, so repeats are turned
+    away in O(1) without touching the database. Only committed keys enter
+    the LRU: claim() caches keys the database already had, and remember()
+    adds newly claimed ones once their transaction is committed.
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, cache_size: Optional[int] = None):
+        self.db_manager = db_manager
+        self.cache_size = config.NOTIFICATION_LEDGER_CACHE if cache_size is None else cache_size
+        self._recent: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.stats = {'cache_rejects': 0, 'ledger_rejects': 0, 'claimed': 0}
+    
+    def claim(self, keys: List[NotificationKey]) -> List[bool]:
+        """Claim keys for sending, True for keys never sent before"""
+        accepted = [False] * len(keys)
+        candidates = []
+        batch = set()
+        with self._lock:
+            for position, key in enumerate(keys):
+                if key in self._recent:
+                    self._recent.move_to_end(key)
+                    self.stats['cache_rejects'] += 1
+                elif key not in batch:
+                    # Repeats within the batch (several subscriptions of one user) are rejected here
+                    batch.add(key)
+                    candidates.append(position)
+        
+        claimed = self.db_manager.claim_notifications([keys[position] for position in candidates])
+        
+        known = []
+        for position, is_new in zip(candidates, claimed):
+            accepted[position] = is_new
+            if not is_new:
+                known.append(keys[position])
+        self.stats['claimed'] += sum(claimed)
+        self.stats['ledger_rejects'] += len(known)
+        
+        self.remember(known)
+        return accepted
+    
+    def remember(self, keys: Iterable[NotificationKey]):
+        """Cache keys stored in the ledger"""
+        if not self.cache_size:
+            return
+        with self._lock:
+            for key in keys:
+                self._recent[key] = None
+                self._recent.move_to_end(key)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+    
+    def purge(self, ttl: Optional[int] = None) -> int:
+        """Forget notifications older than ttl seconds, they may be sent again"""
+        deleted = self.db_manager.purge_notification_ledger(
+            config.NOTIFICATION_LEDGER_TTL if ttl is None else ttl
+        )
+        with self._lock:
+            # Cached keys may be older than the TTL, the ledger decides again
+            self._recent.clear()
+        logger.info(f"Purged {deleted} notification ledger entries")
+        return deleted
+    
+    def __len__(self) -> int:
+        return len(self._recent)
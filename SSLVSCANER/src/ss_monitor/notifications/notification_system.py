@@ -3,23 +3,33 @@ Notification System for SS.lv Monitor - Refactored version
 """
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
 
 from ..config import config
 from ..database import DatabaseManager
 from ..parser import SSParser, Advertisement
-from ..database.models import AdvertisementModel, PriceHistoryModel, SubscriptionModel
+from ..database.models import (
+    AdvertisementModel, SubscriptionModel, UpsertResult, OutboxMessageModel
+)
+from .subscription_index import SubscriptionIndex, subscription_matches
+from .batch_matcher import NUMPY_AVAILABLE, BatchMatcher
+from .outbox import OutboxDispatcher
+from .ledger import NotificationLedger, NotificationKey
 
 logger = logging.getLogger(__name__)
 
 class NotificationSystem:
     """Notification system with improved error handling and structure"""
     
-    def __init__(self, db_manager: DatabaseManager, bot=None):
+    def __init__(self, db_manager: DatabaseManager, bot=None, parser: SSParser = None):
         self.db_manager = db_manager
-        self.parser = SSParser()
+        self.parser = parser or SSParser()
         self.bot = bot
+        self.outbox = OutboxDispatcher(self.db_manager, self._deliver_message,
+                                       digest=config.NOTIFICATION_DIGEST)
+        self.delivery = self.outbox.pipeline
+        self.ledger = NotificationLedger(self.db_manager)
         self.last_scan_time = None
     
     async def scan_and_notify(self) -> Dict[str, Any]:
@@ -33,14 +43,14 @@ class NotificationSystem:
             current_ads = await self._get_current_advertisements()
             logger.info(f"Retrieved {len(current_ads)} current advertisements")
             
-            # Process new advertisements
-            new_ads_result = await self._process_new_advertisements(current_ads)
-            
-            # Process price changes
-            price_changes_result = await self._process_price_changes(current_ads)
+            # Save advertisements, detect new ads and price changes and store their notifications
+            new_ads_result, price_changes_result, outbox = await self._save_advertisements(
+                current_ads
+            )
             
             # Send notifications
-            notifications_result = await self._send_notifications(new_ads_result, price_changes_result)
+            notifications_result = await self._send_notifications(outbox)
+            await self.flush_notifications()
             
             # Update last scan time
             self.last_scan_time = start_time
@@ -68,104 +78,171 @@ class NotificationSystem:
                 'error': str(e)
             }
     
+    async def process_section_ads(self, ads: List[Advertisement],
+                                  subscriptions: List[SubscriptionModel]) -> Dict[str, Any]:
+        """Process ads scanned from one section and notify its subscribers"""
+        new_ads_result, price_changes_result, outbox = await self._save_advertisements(
+            ads, subscriptions
+        )
+        notifications_result = await self._send_notifications(outbox)
+        
+        return {
+            'total_ads_scanned': len(ads),
+            'new_ads_found': len(new_ads_result.get('new_ads', [])),
+            'price_changes': len(price_changes_result.get('price_changes', [])),
+            'notifications_sent': notifications_result.get('notifications_sent', 0)
+        }
+    
+    async def replay_outbox(self) -> int:
+        """Queue notifications left undelivered by a previous run"""
+        if not self.bot:
+            return 0
+        return self.outbox.replay()
+    
+    async def flush_notifications(self):
+        """Send pending digests and wait until all queued notifications are delivered"""
+        self.outbox.flush_digests()
+        await self.delivery.join()
+    
+    async def close(self, timeout: float = None):
+        """Send pending digests, deliver what is queued (up to timeout seconds) and stop delivery"""
+        self.outbox.flush_digests()
+        await self.delivery.stop(timeout)
+    
+    async def _deliver_message(self, chat_id: str, message: str):
+        """Send one queued notification, errors are handled by the delivery pipeline"""
+        await self.bot.deliver_message(chat_id, message)
+    
     async def _get_current_advertisements(self) -> List[Advertisement]:
         """Get current advertisements from all categories"""
-        all_ads = []
+        categories = list(config.SUPPORTED_CATEGORIES.keys())
         
-        for category in config.SUPPORTED_CATEGORIES.keys():
-            try:
-                ads = self.parser.get_real_estate_ads(
-                    category=category,
-                    city='riga',  # Default to Riga for now
-                    max_pages=config.MAX_PAGES_PER_CATEGORY
-                )
-                all_ads.extend(ads)
-                logger.info(f"Found {len(ads)} {category} advertisements")
-            except Exception as e:
-                logger.error(f"Error fetching {category} advertisements: {e}")
+        # Fetch all categories concurrently
+        results = await asyncio.gather(*[
+            self.parser.get_real_estate_ads_async(
+                config.get_category_url(category, 'riga'),  # Default to Riga for now
+                category,
+                max_pages=config.MAX_PAGES_PER_CATEGORY
+            )
+            for category in categories
+        ], return_exceptions=True)
+        
+        all_ads = []
+        for category, ads in zip(categories, results):
+            if isinstance(ads, Exception):
+                logger.error(f"Error fetching {category} advertisements: {ads}")
                 continue
+            all_ads.extend(ads)
+            logger.info(f"Found {len(ads)} {category} advertisements")
         
         return all_ads
     
-    async def _process_new_advertisements(self, current_ads: List[Advertisement]) -> Dict[str, Any]:
-        """Process new advertisements"""
+    async def _save_advertisements(self, current_ads: List[Advertisement],
+                                   subscriptions: Optional[List[SubscriptionModel]] = None
+                                   ) -> Tuple[Dict[str, Any], Dict[str, Any],
+                                              List[OutboxMessageModel]]:
+        """Save advertisements in one batch, returns new ads, price changes and their notifications
+        
+        Notifications for matching subscriptions (all active ones unless
+        given) are stored in the outbox in the same transaction.
+        """
         new_ads = []
+        price_changes = []
+        outbox = []
+        claimed_keys: List[NotificationKey] = []
         
-        for ad in current_ads:
-            try:
-                # Check if advertisement exists in database
-                existing_ad = self.db_manager.get_advertisement_by_ss_id(ad.ss_id)
-                
-                if not existing_ad:
-                    # New advertisement
-                    logger.info(f"New advertisement: {ad.ss_id} - {ad.title}")
-                    
-                    # Convert to database model and save
-                    ad_model = self._advertisement_to_model(ad)
-                    ad_id = self.db_manager.save_advertisement(ad_model)
-                    
-                    # Save price history
-                    if ad.price_info.price:
-                        price_history = PriceHistoryModel(
-                            advertisement_id=ad_id,
-                            old_price=None,
-                            new_price=ad.price_info.price,
-                            currency=ad.price_info.currency,
-                            change_type='new_ad'
-                        )
-                        self.db_manager.save_price_history(price_history)
-                    
-                    new_ads.append(ad)
-                
-            except Exception as e:
-                logger.error(f"Error processing advertisement {ad.ss_id}: {e}")
-                continue
+        if self.bot and subscriptions is None:
+            subscriptions = self.db_manager.get_subscriptions(active_only=True)
         
-        return {'new_ads': new_ads}
-    
-    async def _process_price_changes(self, current_ads: List[Advertisement]) -> Dict[str, Any]:
-        """Process price changes"""
-        price_changes = []
+        # First occurrence wins, as in the upsert
+        ads_by_ss_id = {ad.ss_id: ad for ad in reversed(current_ads)}
         
-        for ad in current_ads:
-            try:
-                # Get existing advertisement
-                existing_ad = self.db_manager.get_advertisement_by_ss_id(ad.ss_id)
+        def build_outbox(results: List[UpsertResult]) -> List[OutboxMessageModel]:
+            advertisement_ids = {}
+            for result in results:
+                ad = ads_by_ss_id[result.ss_id]
+                advertisement_ids[ad.ss_id] = result.advertisement_id
                 
-                if existing_ad and existing_ad.price != ad.price_info.price:
-                    # Price changed
-                    logger.info(f"Price change detected: {ad.ss_id} - {existing_ad.price} -> {ad.price_info.price}")
-                    
-                    # Save price history
-                    price_history = PriceHistoryModel(
-                        advertisement_id=existing_ad.id,
-                        old_price=existing_ad.price,
-                        new_price=ad.price_info.price,
-                        currency=ad.price_info.currency,
-                        change_type='price_change'
-                    )
-                    self.db_manager.save_price_history(price_history)
-                    
-                    # Update advertisement
-                    ad_model = self._advertisement_to_model(ad)
-                    ad_model.id = existing_ad.id
-                    self.db_manager.save_advertisement(ad_model)
-                    
+                if result.is_new:
+                    logger.info(f"New advertisement: {ad.ss_id} - {ad.title}")
+                    new_ads.append(ad)
+                elif result.is_price_changed:
+                    logger.info(f"Price change detected: {ad.ss_id} - "
+                                f"{result.old_price} -> {result.new_price}")
                     price_changes.append({
                         'advertisement': ad,
-                        'old_price': existing_ad.price,
-                        'new_price': ad.price_info.price,
+                        'old_price': result.old_price,
+                        'new_price': result.new_price,
                         'currency': ad.price_info.currency
                     })
-                
-            except Exception as e:
-                logger.error(f"Error processing price change for {ad.ss_id}: {e}")
-                continue
+            
+            if self.bot:
+                notifications = self._build_notifications(
+                    new_ads, price_changes, subscriptions, advertisement_ids
+                )
+                for key, message in notifications:
+                    claimed_keys.append(key)
+                    outbox.append(message)
+            return outbox
+        
+        try:
+            self.db_manager.save_advertisements_bulk(
+                [self._advertisement_to_model(ad) for ad in current_ads],
+                build_outbox
+            )
+        except Exception as e:
+            logger.error(f"Error saving {len(current_ads)} advertisements: {e}")
+            return {'new_ads': []}, {'price_changes': []}, []
+        
+        self.ledger.remember(claimed_keys)
+        return {'new_ads': new_ads}, {'price_changes': price_changes}, outbox
+    
+    def _build_notifications(self, new_ads: List[Advertisement],
+                             price_changes: List[Dict[str, Any]],
+                             subscriptions: List[SubscriptionModel],
+                             advertisement_ids: Dict[str, int]
+                             ) -> List[Tuple[NotificationKey, OutboxMessageModel]]:
+        """Build outbox messages for every subscription matching a new ad or price change
         
-        return {'price_changes': price_changes}
+        Notifications already in the ledger (e.g. from another scan or a
+        second subscription of the same user) are left out.
+        """
+        logger.info(f"Processing {len(new_ads)} new ads against {len(subscriptions)} subscriptions")
+        
+        changed_ads = [change['advertisement'] for change in price_changes]
+        matches = self._match_ads(new_ads + changed_ads, subscriptions)
+        candidates = []
+        
+        # New advertisement notifications
+        for ad, ad_matches in zip(new_ads, matches):
+            for subscription in ad_matches:
+                key = (subscription.user_id, ad.ss_id, 'new_ad', ad.price_info.price)
+                candidates.append((key, ad, None))
+        
+        # Price change notifications
+        for change, change_matches in zip(price_changes, matches[len(new_ads):]):
+            ad = change['advertisement']
+            for subscription in change_matches:
+                key = (subscription.user_id, ad.ss_id, 'price_change', change['new_price'])
+                candidates.append((key, ad, change))
+        
+        claimed = self.ledger.claim([key for key, _, _ in candidates])
+        if len(candidates) > sum(claimed):
+            logger.info(f"Skipped {len(candidates) - sum(claimed)} already sent notifications")
+        
+        return [
+            (key, OutboxMessageModel(
+                chat_id=key[0],
+                message=(self._format_price_change_message(change) if change
+                         else self._format_new_ad_message(ad)),
+                advertisement_id=advertisement_ids.get(ad.ss_id)
+            ))
+            for (key, ad, change), is_new in zip(candidates, claimed)
+            if is_new
+        ]
     
-    async def _send_notifications(self, new_ads_result: Dict[str, Any], price_changes_result: Dict[str, Any]) -> Dict[str, Any]:
-        """Send notifications to users"""
+    async def _send_notifications(self, outbox: List[OutboxMessageModel]) -> Dict[str, Any]:
+        """Hand stored notifications to the delivery pipeline without waiting for Telegram"""
         if not self.bot:
             logger.warning("No bot instance available for sending notifications")
             return {'notifications_sent': 0}
@@ -173,63 +250,33 @@ class NotificationSystem:
         notifications_sent = 0
         
         try:
-            # Get all active subscriptions
-            subscriptions = self.db_manager.get_subscriptions(active_only=True)
-            logger.info(f"Processing {len(new_ads_result.get('new_ads', []))} new ads against {len(subscriptions)} subscriptions")
-            
-            # Send new advertisement notifications
-            for ad in new_ads_result.get('new_ads', []):
-                for subscription in subscriptions:
-                    if self._matches_subscription(ad, subscription):
-                        message = self._format_new_ad_message(ad)
-                        await self.bot.send_message(subscription.user_id, message)
-                        notifications_sent += 1
-            
-            # Send price change notifications
-            for change in price_changes_result.get('price_changes', []):
-                for subscription in subscriptions:
-                    if self._matches_subscription(change['advertisement'], subscription):
-                        message = self._format_price_change_message(change)
-                        await self.bot.send_message(subscription.user_id, message)
-                        notifications_sent += 1
-            
-            logger.info(f"Sent {notifications_sent} notifications")
-            
+            notifications_sent = self.outbox.dispatch(outbox)
+            logger.info(f"Queued {notifications_sent} notifications")
         except Exception as e:
             logger.error(f"Error sending notifications: {e}")
         
         return {'notifications_sent': notifications_sent}
     
+    def _match_ads(self, ads: List[Advertisement],
+                   subscriptions: List[SubscriptionModel]) -> List[List[SubscriptionModel]]:
+        """Get matching subscriptions for every ad, vectorized for large batches"""
+        if not ads or not subscriptions:
+            return [[] for _ in ads]
+        
+        if NUMPY_AVAILABLE and len(ads) * len(subscriptions) >= config.BATCH_MATCH_THRESHOLD:
+            try:
+                return BatchMatcher(subscriptions).match_all(ads)
+            except Exception as e:
+                logger.error(f"Error in batch matching, falling back to index: {e}")
+        
+        # Index subscriptions once, each ad is then checked only against likely matches
+        subscription_index = SubscriptionIndex(subscriptions)
+        return [subscription_index.match(ad) for ad in ads]
+    
     def _matches_subscription(self, ad: Advertisement, subscription: SubscriptionModel) -> bool:
         """Check if advertisement matches subscription criteria"""
         try:
-            # Check category
-            if subscription.category and ad.property_type != subscription.category:
-                return False
-            
-            # Check price range
-            if ad.price_info.price:
-                if subscription.min_price and ad.price_info.price < subscription.min_price:
-                    return False
-                if subscription.max_price and ad.price_info.price > subscription.max_price:
-                    return False
-            
-            # Check area range
-            if ad.area:
-                if subscription.min_area and ad.area < subscription.min_area:
-                    return False
-                if subscription.max_area and ad.area > subscription.max_area:
-                    return False
-            
-            # Check rooms range
-            if ad.rooms:
-                if subscription.min_rooms and ad.rooms < subscription.min_rooms:
-                    return False
-                if subscription.max_rooms and ad.rooms > subscription.max_rooms:
-                    return False
-            
-            return True
-            
+            return subscription_matches(ad, subscription)
         except Exception as e:
             logger.error(f"Error checking subscription match: {e}")
             return False
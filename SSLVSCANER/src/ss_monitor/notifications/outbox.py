@@ -0,0 +1,67 @@
+"""
+Dispatching of outbox notifications to the delivery pipeline
+"""
+import logging
+from typing import List
+
+from ..database import DatabaseManager
+from ..database.models import OutboxMessageModel
+from .delivery import DeliveryPipeline, OutgoingMessage, SendFunction
+from .digest import DigestBuffer
+
+logger = logging.getLogger(__name__)
+
+class OutboxDispatcher:
+    """Deliver outbox rows and record their outcome
+    
+    Rows are written together with the advertisement changes they report,
+    so after a crash every undelivered notification is still pending and
+    replay() queues it again. A message sent right before a crash, but not
+    yet marked delivered, is sent twice rather than lost.
+    
+    In digest mode rows are buffered per user and sent combined once the
+    user's cooldown window closes.
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, send: SendFunction, digest: bool = False,
+                 **pipeline_options):
+        self.db_manager = db_manager
+        self.pipeline = DeliveryPipeline(send, on_finished=self._on_finished, **pipeline_options)
+        self.digest = DigestBuffer(self.pipeline) if digest else None
+    
+    def dispatch(self, messages: List[OutboxMessageModel]) -> int:
+        """Queue stored outbox messages for delivery, returns number queued"""
+        queued_ids = self.pipeline.queued_outbox_ids()
+        if self.digest:
+            queued_ids |= self.digest.buffered_ids()
+        
+        queued = 0
+        for message in messages:
+            if message.id in queued_ids:
+                continue
+            if self.digest:
+                self.digest.add(message)
+            else:
+                self.pipeline.enqueue(message.chat_id, message.message, outbox_ids=[message.id])
+            queued += 1
+        return queued
+    
+    def flush_digests(self):
+        """Send buffered digests without waiting for their windows to close"""
+        if self.digest:
+            self.digest.flush()
+    
+    def replay(self) -> int:
+        """Queue every pending outbox message, e.g. left over from a previous run"""
+        queued = self.dispatch(self.db_manager.get_pending_outbox())
+        if queued:
+            logger.info(f"Replaying {queued} pending notifications from the outbox")
+        return queued
+    
+    def _on_finished(self, message: OutgoingMessage, delivered: bool):
+        """Record pipeline outcome of the outbox rows a message carried"""
+        for outbox_id in message.outbox_ids:
+            if delivered:
+                self.db_manager.mark_outbox_delivered(outbox_id, message.attempts + 1)
+            else:
+                self.db_manager.mark_outbox_failed(outbox_id, message.attempts + 1)
@@ -0,0 +1,173 @@
+"""
+Subscription index for matching advertisements against many subscriptions
+"""
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from ..parser import Advertisement
+from ..database.models import SubscriptionModel
+
+logger = logging.getLogger(__name__)
+
+# Ad value getter and subscription bound attributes per filtered dimension
+DIMENSIONS = {
+    'price': (lambda ad: ad.price_info.price, 'min_price', 'max_price'),
+    'area': (lambda ad: ad.area, 'min_area', 'max_area'),
+    'rooms': (lambda ad: ad.rooms, 'min_rooms', 'max_rooms'),
+}
+
+def subscription_matches(ad: Advertisement, subscription: SubscriptionModel) -> bool:
+    """Check if advertisement matches subscription criteria
+    
+    Empty bounds are unbounded, and an ad without a value for a dimension
+    passes that dimension's filter.
+    """
+    # Check category
+    if subscription.category and ad.property_type != subscription.category:
+        return False
+    
+    # Check price, area and rooms ranges
+    for get_value, min_attr, max_attr in DIMENSIONS.values():
+        value = get_value(ad)
+        if value:
+            min_value = getattr(subscription, min_attr)
+            max_value = getattr(subscription, max_attr)
+            if min_value and value < min_value:
+                return False
+            if max_value and value > max_value:
+                return False
+    
+    return True
+
+class _IntervalIndex:
+    """Static segment tree over one dimension's [min, max] subscription ranges
+    
+    Leaves are the distinct bound values and the gaps between them, so a
+    lookup walks one leaf-to-root path and collects the ranges containing
+    the value in O(log n + k).
+    """
+    
+    def __init__(self, entries: List[Tuple[int, SubscriptionModel]], min_attr: str, max_attr: str):
+        self.points = sorted({
+            getattr(sub, attr)
+            for _, sub in entries for attr in (min_attr, max_attr) if getattr(sub, attr)
+        })
+        self.leaves = 2 * len(self.points) + 1
+        self.nodes: List[List[int]] = [[] for _ in range(2 * self.leaves)]
+        
+        for position, sub in entries:
+            min_value, max_value = getattr(sub, min_attr), getattr(sub, max_attr)
+            first = self._leaf(min_value) if min_value else 0
+            last = self._leaf(max_value) if max_value else self.leaves - 1
+            
+            # Store the range in the O(log n) nodes covering leaves first..last
+            left, right = first + self.leaves, last + self.leaves + 1
+            while left < right:
+                if left & 1:
+                    self.nodes[left].append(position)
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    self.nodes[right].append(position)
+                left >>= 1
+                right >>= 1
+    
+    def _leaf(self, value) -> int:
+        """Leaf of a bound value (odd) or of the gap before the next bound (even)"""
+        i = bisect_left(self.points, value)
+        if i < len(self.points) and self.points[i] == value:
+            return 2 * i + 1
+        return 2 * i
+    
+    def _path(self, value) -> List[List[int]]:
+        """Nodes on the leaf-to-root path of value"""
+        node = self._leaf(value) + self.leaves
+        path = []
+        while node:
+            path.append(self.nodes[node])
+            node >>= 1
+        return path
+    
+    def count(self, value) -> int:
+        """Number of ranges containing value"""
+        return sum(len(positions) for positions in self._path(value))
+    
+    def stab(self, value) -> List[int]:
+        """Positions of subscriptions whose range contains value"""
+        found = []
+        for positions in self._path(value):
+            found.extend(positions)
+        return found
+
+class _Partition:
+    """Subscriptions of one category with a range index per dimension"""
+    
+    def __init__(self, entries: List[Tuple[int, SubscriptionModel]]):
+        self.positions = [position for position, _ in entries]
+        self.ranges = {
+            name: _IntervalIndex(entries, min_attr, max_attr)
+            for name, (_, min_attr, max_attr) in DIMENSIONS.items()
+        }
+    
+    def match(self, ad: Advertisement) -> List[int]:
+        """Positions of subscriptions whose ranges all accept the ad"""
+        filters = []
+        for name, (get_value, _, _) in DIMENSIONS.items():
+            value = get_value(ad)
+            # An ad without a value passes this dimension
+            if value:
+                filters.append((self.ranges[name].count(value), name, value))
+        
+        if not filters:
+            return self.positions
+        
+        # Intersect starting from the most selective dimension
+        filters.sort(key=lambda item: item[0])
+        _, name, value = filters[0]
+        matched = set(self.ranges[name].stab(value))
+        for _, name, value in filters[1:]:
+            if not matched:
+                break
+            matched.intersection_update(self.ranges[name].stab(value))
+        return list(matched)
+
+class SubscriptionIndex:
+    """Category-partitioned subscription index built once per notification cycle
+    
+    Gives the same matches as subscription_matches, in subscription order,
+    without checking subscriptions one by one.
+    """
+    
+    def __init__(self, subscriptions: List[SubscriptionModel]):
+        by_category: Dict[Optional[str], List[Tuple[int, SubscriptionModel]]] = {}
+        any_category: List[Tuple[int, SubscriptionModel]] = []
+        
+        for position, subscription in enumerate(subscriptions):
+            if subscription.category:
+                by_category.setdefault(subscription.category, []).append((position, subscription))
+            else:
+                any_category.append((position, subscription))
+        
+        self._subscriptions = list(subscriptions)
+        self._partitions = {
+            category: _Partition(entries) for category, entries in by_category.items()
+        }
+        self._any_category = _Partition(any_category)
+    
+    def match(self, ad: Advertisement) -> List[SubscriptionModel]:
+        """Get subscriptions matching the advertisement"""
+        try:
+            positions = self._any_category.match(ad)
+            partition = self._partitions.get(ad.property_type)
+            if partition:
+                positions = positions + partition.match(ad)
+            
+            return [self._subscriptions[position] for position in sorted(positions)]
+        
+        except Exception as e:
+            logger.error(f"Error matching advertisement {ad.ss_id}: {e}")
+            return []
+    
+    def __len__(self) -> int:
+        return len(self._subscriptions)
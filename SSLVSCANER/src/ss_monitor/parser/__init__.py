@@ -1,7 +1,15 @@
 """
 Parser package for SS.lv Monitor
 """
-from .ss_parser import SSParser
-from .models import Advertisement, PriceInfo
+from .ss_parser import SSParser, SectionFetchError, normalize_section_url
+from .async_fetcher import AsyncFetcher
+from .page_cache import PageCache
+from .parse_pool import get_parse_pool, shutdown_parse_pool
+from .preview import SectionPreviewCache
+from .models import Advertisement, PriceInfo, SectionPreview
 
-__all__ = ['SSParser', 'Advertisement', 'PriceInfo']
+__all__ = [
+    'SSParser', 'SectionFetchError', 'normalize_section_url', 'AsyncFetcher', 'PageCache',
+    'get_parse_pool', 'shutdown_parse_pool', 'SectionPreviewCache',
+    'Advertisement', 'PriceInfo', 'SectionPreview'
+]
@@ -0,0 +1,125 @@
+"""
+Asynchronous HTTP fetch engine for SS.lv parser
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import config
+from ..rate_limiter import TokenBucket, get_host_limiter, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Retry policy of every parser request, the blocking API runs through this engine too
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1.0
+
+class AsyncFetcher:
+    """Async HTTP fetcher with a shared connection pool and per-host concurrency limit"""
+
+    def __init__(self, max_per_host: int = None, rate_limiter: TokenBucket = None,
+                 transport: httpx.AsyncBaseTransport = None):
+        self.max_per_host = max_per_host or config.MAX_CONCURRENT_REQUESTS_PER_HOST
+        self.rate_limiter = rate_limiter
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_loop(self):
+        """Reset loop-bound state when used from a different event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = None
+            self._host_limits = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get shared HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=config.REQUEST_HEADERS,
+                timeout=config.REQUEST_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_MAX_CONNECTIONS
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    def _get_host_limit(self, url: str) -> asyncio.Semaphore:
+        """Get concurrency limit for the URL host"""
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    def _get_rate_limiter(self, url: str) -> TokenBucket:
+        """Get rate limiter, the process-wide host limiter unless overridden"""
+        return self.rate_limiter or get_host_limiter(url)
+
+    async def fetch(self, url: str, headers: Dict[str, str] = None) -> Optional[httpx.Response]:
+        """Fetch URL with retries, returns None on failure"""
+        self._ensure_loop()
+
+        async with self._get_host_limit(url):
+            return await self._get_with_retries(url, headers)
+
+    async def _get_with_retries(self, url: str,
+                                headers: Dict[str, str] = None) -> Optional[httpx.Response]:
+        """Make GET request retrying transient failures"""
+        client = self._get_client()
+        rate_limiter = self._get_rate_limiter(url)
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                await rate_limiter.acquire_async()
+                logger.debug(f"Making async request to: {url}")
+                response = await client.get(url, headers=headers)
+                if response.status_code == 429:
+                    rate_limiter.pause(parse_retry_after(
+                        response.headers.get('Retry-After'), BACKOFF_FACTOR * (2 ** attempt)
+                    ))
+                if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                    logger.warning(f"Got {response.status_code} for {url}, retrying")
+                    await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                    continue
+                if response.status_code != 304:  # Not Modified answers a conditional GET
+                    response.raise_for_status()
+                return response
+            except (httpx.UnsupportedProtocol, httpx.InvalidURL) as e:
+                logger.error(f"Invalid URL {url}: {e}")
+                return None
+            except httpx.TransportError as e:
+                if attempt < MAX_RETRIES:
+                    logger.warning(f"Transport error for {url}: {e}, retrying")
+                    await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                    continue
+                logger.error(f"Request failed for {url}: {e}")
+                return None
+            except httpx.HTTPError as e:
+                logger.error(f"Request failed for {url}: {e}")
+                return None
+
+        return None
+
+    async def close(self):
+        """Close the underlying HTTP client"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+_shared_fetcher: Optional[AsyncFetcher] = None
+
+def get_shared_fetcher() -> AsyncFetcher:
+    """Get process-wide fetcher so all parsers share one connection pool"""
+    global _shared_fetcher
+    if _shared_fetcher is None:
+        _shared_fetcher = AsyncFetcher()
+    return _shared_fetcher
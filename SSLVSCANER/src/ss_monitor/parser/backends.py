@@ -0,0 +1,175 @@
+"""
+HTML parsing backends for SS.lv listing pages
+
+Backends only extract raw strings from the page; SSParser turns them into
+Advertisement objects, so every backend produces identical results.
+"""
+import re
+import html
+import logging
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+AD_ROW_ID = re.compile(r'^tr_\d+')
+
+class RawAdRow(NamedTuple):
+    """Raw advertisement row extracted from a listing page"""
+    tr_id: str
+    title: str
+    href: str
+    cells: List[str]
+    image_src: Optional[str]
+
+# BeautifulSoup backend
+
+def extract_row_bs4(ad_element) -> Optional[RawAdRow]:
+    """Extract raw row from BeautifulSoup <tr> element"""
+    tr_id = ad_element.get('id', '')
+    if not tr_id.startswith('tr_'):
+        return None
+    
+    title_link = ad_element.find('a', class_='am')
+    if not title_link:
+        return None
+    
+    href = title_link.get('href')
+    if not href:
+        return None
+    
+    image_element = ad_element.find('img')
+    
+    return RawAdRow(
+        tr_id=tr_id,
+        title=title_link.get_text(strip=True),
+        href=href,
+        cells=[cell.get_text(strip=True) for cell in ad_element.find_all('td', class_='msga2-o')],
+        image_src=image_element.get('src') if image_element else None
+    )
+
+def extract_rows_bs4(content: Union[bytes, str]) -> Optional[List[RawAdRow]]:
+    """Extract advertisement rows with BeautifulSoup, None if page has no listing table"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    main_table = soup.find('table', id='page_main')
+    if not main_table:
+        return None
+    
+    rows = []
+    for ad_element in main_table.find_all('tr', id=AD_ROW_ID):
+        row = extract_row_bs4(ad_element)
+        if row:
+            rows.append(row)
+    return rows
+
+# lxml backend
+
+def _has_class(name: str) -> str:
+    """XPath predicate matching one class token, like BeautifulSoup class_"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+_MAIN_TABLE = etree.XPath("//table[@id='page_main']")
+_AD_ROWS = etree.XPath(".//tr[starts-with(@id, 'tr_')]")
+_TITLE_LINK = etree.XPath(f".//a[{_has_class('am')}]")
+_CELLS = etree.XPath(f".//td[{_has_class('msga2-o')}]")
+_IMAGE = etree.XPath("(.//img)[1]")
+
+_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+_html_parsers: Dict[str, lxml.html.HTMLParser] = {}
+
+def _page_encoding(content: bytes) -> str:
+    """Page encoding from its meta charset, UTF-8 by default"""
+    match = _CHARSET.search(content[:4096])
+    return match.group(1).decode('ascii').lower() if match else 'utf-8'
+
+def _get_html_parser(content: bytes) -> lxml.html.HTMLParser:
+    """Get HTML parser for the page encoding (meta charset, UTF-8 by default)"""
+    encoding = _page_encoding(content)
+    if encoding not in _html_parsers:
+        _html_parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return _html_parsers[encoding]
+
+def _text(element) -> str:
+    """Element text stripped the same way as BeautifulSoup get_text(strip=True)"""
+    return ''.join(text.strip() for text in element.itertext() if text.strip())
+
+def extract_rows_lxml(content: Union[bytes, str]) -> Optional[List[RawAdRow]]:
+    """Extract advertisement rows with lxml, None if page has no listing table"""
+    try:
+        if isinstance(content, bytes):
+            document = lxml.html.document_fromstring(content, parser=_get_html_parser(content))
+        else:
+            document = lxml.html.document_fromstring(content)
+    except etree.ParserError as e:
+        logger.warning(f"Could not parse page: {e}")
+        return None
+    
+    tables = _MAIN_TABLE(document)
+    if not tables:
+        return None
+    
+    rows = []
+    for ad_element in _AD_ROWS(tables[0]):
+        tr_id = ad_element.get('id')
+        if not AD_ROW_ID.match(tr_id):
+            continue
+        
+        title_links = _TITLE_LINK(ad_element)
+        if not title_links:
+            continue
+        
+        href = title_links[0].get('href')
+        if not href:
+            continue
+        
+        images = _IMAGE(ad_element)
+        
+        rows.append(RawAdRow(
+            tr_id=tr_id,
+            title=_text(title_links[0]),
+            href=href,
+            cells=[_text(cell) for cell in _CELLS(ad_element)],
+            image_src=images[0].get('src') if images else None
+        ))
+    return rows
+
+# <title> sits in the page head, only its start is searched
+_TITLE_BYTES = re.compile(rb'<title[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+_TITLE_TEXT = re.compile(r'<title[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+TITLE_SEARCH_LIMIT = 16384
+
+def extract_page_title(content: Union[bytes, str]) -> Optional[str]:
+    """Extract the page <title> text, None if the page has none
+    
+    Cheap enough for the event loop: the title is sliced out of the page
+    start instead of parsing the whole document.
+    """
+    if isinstance(content, bytes):
+        match = _TITLE_BYTES.search(content[:TITLE_SEARCH_LIMIT])
+        if not match:
+            return None
+        try:
+            title = match.group(1).decode(_page_encoding(content), errors='replace')
+        except LookupError:
+            title = match.group(1).decode('utf-8', errors='replace')
+    else:
+        match = _TITLE_TEXT.search(content[:TITLE_SEARCH_LIMIT])
+        if not match:
+            return None
+        title = match.group(1)
+    
+    title = html.unescape(title).strip()
+    return title or None
+
+BACKENDS = {
+    'bs4': extract_rows_bs4,
+    'lxml': extract_rows_lxml,
+}
+
+def extract_listing_rows(content: Union[bytes, str], backend: str) -> Optional[List[RawAdRow]]:
+    """Extract advertisement rows using the named backend"""
+    return BACKENDS[backend](content)
@@ -2,7 +2,7 @@
 Data models for SS.lv parser
 """
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 @dataclass
@@ -99,3 +99,12 @@ class Advertisement:
             created_at=datetime.fromisoformat(data['created_at']) if data.get('created_at') else None,
             updated_at=datetime.fromisoformat(data['updated_at']) if data.get('updated_at') else None
         )
+
+@dataclass
+class SectionPreview:
+    """First listing page of a section, shown to users adding it"""
+    url: str
+    ads: List[Advertisement]
+    title: Optional[str] = None  # page <title>
+    fetch_seconds: float = 0.0
+    parse_seconds: float = 0.0
@@ -0,0 +1,136 @@
+"""
+Listing page cache for SS.lv parser
+
+Pages are keyed by URL and remember their HTTP validators (ETag,
+Last-Modified) and a fingerprint of the listing table, so an unchanged page
+is answered from the cache without parsing it again.
+"""
+import re
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ..config import config
+from .models import Advertisement
+
+logger = logging.getLogger(__name__)
+
+_MAIN_TABLE_START = re.compile(rb'<table[^>]*\bid=["\']?page_main\b', re.IGNORECASE)
+_TABLE_TAG = re.compile(rb'<(/?)table\b', re.IGNORECASE)
+_WHITESPACE = re.compile(rb'\s+')
+
+def listing_fingerprint(content: bytes) -> Optional[str]:
+    """Hash of the normalized listing table, None if page has no listing table"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    
+    start = _MAIN_TABLE_START.search(content)
+    if not start:
+        return None
+    
+    # Find the matching </table>, listing rows may contain nested tables
+    end = len(content)
+    depth = 0
+    for tag in _TABLE_TAG.finditer(content, start.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = tag.end()
+            break
+    
+    table = _WHITESPACE.sub(b' ', content[start.start():end])
+    return hashlib.blake2b(table, digest_size=16).hexdigest()
+
+@dataclass
+class CachedPage:
+    """Cached listing page"""
+    ads: List[Advertisement]
+    fingerprint: Optional[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float = field(default_factory=time.monotonic)
+    
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET of this page"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class PageCache:
+    """Thread-safe LRU cache of parsed listing pages with TTL"""
+    
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = config.PAGE_CACHE_SIZE if max_size is None else max_size
+        self.ttl = config.PAGE_CACHE_TTL if ttl is None else ttl
+        self._pages: OrderedDict[str, CachedPage] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+    
+    def get(self, url: str) -> Optional[CachedPage]:
+        """Get cached page, None if missing or expired"""
+        with self._lock:
+            cached = self._pages.get(url)
+            if cached is None:
+                return None
+            if time.monotonic() - cached.stored_at > self.ttl:
+                del self._pages[url]
+                return None
+            self._pages.move_to_end(url)
+            return cached
+    
+    def store(self, url: str, ads: List[Advertisement], fingerprint: Optional[str],
+              etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store parsed page, evicting least recently used pages"""
+        if self.max_size <= 0:
+            return
+        
+        with self._lock:
+            self._pages[url] = CachedPage(
+                ads=list(ads),
+                fingerprint=fingerprint,
+                etag=etag,
+                last_modified=last_modified
+            )
+            self._pages.move_to_end(url)
+            while len(self._pages) > self.max_size:
+                self._pages.popitem(last=False)
+    
+    def record_hit(self, not_modified: bool = False):
+        """Count page answered from the cache"""
+        with self._lock:
+            self.hits += 1
+            if not_modified:
+                self.not_modified += 1
+    
+    def record_miss(self):
+        """Count page that had to be parsed"""
+        with self._lock:
+            self.misses += 1
+    
+    def clear(self):
+        """Drop all cached pages"""
+        with self._lock:
+            self._pages.clear()
+    
+    def get_stats(self) -> Dict[str, float]:
+        """Get cache statistics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._pages),
+                'hits': self.hits,
+                'not_modified': self.not_modified,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+    
+    def __len__(self) -> int:
+        return len(self._pages)
@@ -0,0 +1,65 @@
+"""
+Process pool for CPU-bound listing page parsing
+
+Workers only run the parser backends, which take page bytes and return
+picklable RawAdRow tuples; building Advertisement objects stays in the
+calling process.
+"""
+import asyncio
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Union
+
+from ..config import config
+from .backends import RawAdRow, extract_listing_rows
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Get the shared parsing process pool, None when PARSER_WORKERS is 0"""
+    global _pool
+    if config.PARSER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs threads and an event loop is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=config.PARSER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"Started parser process pool with {config.PARSER_WORKERS} workers")
+        return _pool
+
+def shutdown_parse_pool():
+    """Stop the parsing process pool, a later parse starts a new one"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+async def extract_listing_rows_async(content: Union[bytes, str],
+                                     backend: str) -> Optional[List[RawAdRow]]:
+    """Extract advertisement rows in the process pool without blocking the event loop"""
+    global _pool
+    pool = get_parse_pool()
+    if pool is None:
+        return extract_listing_rows(content, backend)
+    
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, extract_listing_rows, content, backend
+        )
+    except BrokenProcessPool as e:
+        # A worker died (e.g. killed for memory), parse here and start a fresh pool next time
+        logger.error(f"Parser process pool failed, parsing in process: {e}")
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return extract_listing_rows(content, backend)
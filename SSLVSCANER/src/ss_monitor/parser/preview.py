@@ -0,0 +1,140 @@
+"""
+Shared cache of section previews for the bot
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from ..config import config
+from .models import SectionPreview
+from .ss_parser import SSParser, normalize_section_url
+
+logger = logging.getLogger(__name__)
+
+def section_display_name(title: Optional[str]) -> Optional[str]:
+    """Section name from a listing page title (the part after " - " when present)"""
+    if not title:
+        return None
+    parts = title.split(' - ')
+    if len(parts) >= 2:
+        return parts[1].strip()
+    return title
+
+class SectionPreviewCache:
+    """Short-lived cache of section previews keyed by normalized section URL
+    
+    Previews go through the parser's async fetch path. Concurrent requests
+    for one section share a single fetch, and display names of previewed
+    sections are kept (without TTL) so menus never wait for pages: missing
+    names are fetched in the background, at most once per TTL per section.
+    """
+    
+    def __init__(self, parser: SSParser, max_size: int = None, ttl: float = None):
+        self.parser = parser
+        self.max_size = config.PREVIEW_CACHE_SIZE if max_size is None else max_size
+        self.ttl = config.PREVIEW_CACHE_TTL if ttl is None else ttl
+        self._previews: OrderedDict[str, Tuple[float, SectionPreview]] = OrderedDict()
+        self._names: OrderedDict[str, str] = OrderedDict()
+        self._name_attempts: OrderedDict[str, float] = OrderedDict()  # section -> last name fetch
+        self._background: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        self.stats = {'hits': 0, 'shared': 0, 'fetches': 0}
+    
+    def _ensure_loop(self):
+        """Drop in-flight fetches of a previous event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._inflight = {}
+    
+    async def get(self, url: str, refresh: bool = False) -> SectionPreview:
+        """Get preview of a section, fetching it unless cached (and not refresh) or in flight"""
+        key = normalize_section_url(url)
+        cached = self._previews.get(key)
+        if cached and not refresh and time.monotonic() - cached[0] <= self.ttl:
+            self._previews.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached[1]
+        
+        self._ensure_loop()
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, url))
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats['fetches'] += 1
+        else:
+            self.stats['shared'] += 1
+        
+        # One user giving up must not cancel the fetch others wait for
+        return await asyncio.shield(task)
+    
+    def _forget(self, key: str, task: asyncio.Future):
+        """Drop finished fetch from the in-flight map"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    async def _fetch(self, key: str, url: str) -> SectionPreview:
+        """Fetch preview and cache it, failed fetches are not cached"""
+        preview = await self.parser.get_section_preview_async(url)
+        if preview is None:
+            return SectionPreview(url=key, ads=[])
+        
+        self._store(key, preview)
+        return preview
+    
+    def _store(self, key: str, preview: SectionPreview):
+        """Remember preview and its display name, evicting least recently used entries"""
+        if self.max_size <= 0:
+            return
+        
+        self._previews[key] = (time.monotonic(), preview)
+        self._previews.move_to_end(key)
+        while len(self._previews) > self.max_size:
+            self._previews.popitem(last=False)
+        
+        name = section_display_name(preview.title)
+        if name:
+            self._names[key] = name
+            self._names.move_to_end(key)
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+    
+    def display_name(self, url: str) -> Optional[str]:
+        """Cached display name of a section, None until it was previewed"""
+        return self._names.get(normalize_section_url(url))
+    
+    def warm_display_names(self, urls: Iterable[str]) -> Optional[asyncio.Task]:
+        """Preview sections without a cached display name in the background
+        
+        Returns at once, callers show fallback names meanwhile. A section is
+        tried again only after the TTL, so failing sections are not fetched
+        on every call.
+        """
+        now = time.monotonic()
+        missing = {}
+        for url in urls:
+            key = normalize_section_url(url)
+            attempted = self._name_attempts.get(key)
+            if key in self._names or (attempted is not None and now - attempted <= self.ttl):
+                continue
+            missing[key] = url
+            self._name_attempts[key] = now
+            self._name_attempts.move_to_end(key)
+        
+        while len(self._name_attempts) > max(self.max_size, 0):
+            self._name_attempts.popitem(last=False)
+        if not missing:
+            return None
+        
+        self._ensure_loop()
+        task = asyncio.ensure_future(
+            asyncio.gather(*[self.get(url) for url in missing.values()], return_exceptions=True)
+        )
+        # Keep a reference, the event loop only holds weak ones
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
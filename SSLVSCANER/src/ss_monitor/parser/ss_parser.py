@@ -3,66 +3,63 @@ SS.lv Parser - Improved version with better error handling and structure
 """
 import re
 import time
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
-from urllib.parse import urljoin
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterator, Mapping, Set, Tuple, Union
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from bs4 import BeautifulSoup
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 from ..config import config
-from .models import Advertisement, PriceInfo
+from .models import Advertisement, PriceInfo, SectionPreview
+from .async_fetcher import AsyncFetcher, get_shared_fetcher
+from .backends import BACKENDS, RawAdRow, extract_listing_rows, extract_page_title, extract_row_bs4
+from .page_cache import CachedPage, PageCache, listing_fingerprint
+from .parse_pool import extract_listing_rows_async
 
 logger = logging.getLogger(__name__)
 
+# Already seen ads of a section: set of ss_ids or ss_id -> last known price
+KnownAds = Union[Set[str], Mapping[str, Optional[float]]]
+
+class SectionFetchError(Exception):
+    """No listing page of a section could be fetched"""
+
+def normalize_section_url(url: str) -> str:
+    """Normalize section URL to its canonical /all/sell/ listing URL"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/')
+    
+    # Drop existing listing suffixes so every variant maps to one URL
+    for suffix in ('/sell', '/all'):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path + '/all/sell/', '', ''))
+
 class SSParser:
     """SS.lv parser with improved error handling and retry logic"""
     
-    def __init__(self):
-        self.session = self._create_session()
+    def __init__(self, fetcher: AsyncFetcher = None, backend: str = None,
+                 page_cache: PageCache = None):
+        self.backend = backend or config.PARSER_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unsupported parser backend: {self.backend}")
+        self.fetcher = fetcher or get_shared_fetcher()
+        self.page_cache = page_cache if page_cache is not None else PageCache()
         self.base_url = config.SS_BASE_URL
-        
-    def _create_session(self) -> requests.Session:
-        """Create HTTP session with retry logic"""
-        session = requests.Session()
-        
-        # Configure retry strategy
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        # Set headers
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        })
-        
-        return session
     
-    def _make_request(self, url: str) -> Optional[requests.Response]:
-        """Make HTTP request with error handling"""
+    @contextmanager
+    def _sync_loop(self) -> Iterator[asyncio.AbstractEventLoop]:
+        """Private event loop for the blocking API, closing the fetcher's client after use"""
+        loop = asyncio.new_event_loop()
         try:
-            logger.debug(f"Making request to: {url}")
-            response = self.session.get(
-                url, 
-                timeout=config.REQUEST_TIMEOUT,
-                allow_redirects=True
-            )
-            response.raise_for_status()
-            return response
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed for {url}: {e}")
-            return None
+            yield loop
+        finally:
+            try:
+                loop.run_until_complete(self.fetcher.close())
+            finally:
+                loop.close()
     
     def _parse_price(self, price_text: str) -> PriceInfo:
         """Parse price and currency from text"""
@@ -109,40 +106,38 @@ class SSParser:
     def _parse_advertisement(self, ad_element: BeautifulSoup, base_url: str) -> Optional[Advertisement]:
         """Parse single advertisement element"""
         try:
-            tr_id = ad_element.get('id', '')
-            if not tr_id.startswith('tr_'):
-                return None
-            
-            ss_id = tr_id.replace('tr_', '')
-            
-            # Extract title and URL
-            title_link = ad_element.find('a', class_='am')
-            if not title_link:
+            row = extract_row_bs4(ad_element)
+            if not row:
                 return None
+            return self._build_advertisement(row, base_url)
             
-            title = title_link.get_text(strip=True)
-            relative_url = title_link.get('href')
-            if not relative_url:
-                return None
-            
-            full_url = urljoin(base_url, relative_url)
+        except Exception as e:
+            logger.error(f"Error parsing advertisement: {e}")
+            return None
+    
+    def _build_advertisement(self, row: RawAdRow, base_url: str) -> Optional[Advertisement]:
+        """Build advertisement from raw row extracted by a parser backend"""
+        try:
+            ss_id = row.tr_id.replace('tr_', '')
+            title = row.title
+            full_url = urljoin(base_url, row.href)
             
             # Extract data from cells
-            cells = ad_element.find_all('td', class_='msga2-o')
+            cells = row.cells
             if len(cells) < 4:
                 return None
             
             # Parse location (usually first cell)
-            location = cells[0].get_text(strip=True) if cells[0] else None
+            location = cells[0]
             
             # Parse rooms (usually second cell)
-            rooms_text = cells[1].get_text(strip=True) if len(cells) > 1 else ''
+            rooms_text = cells[1]
             rooms = None
             if rooms_text and rooms_text.isdigit():
                 rooms = int(rooms_text)
             
             # Parse area (usually third cell)
-            area_text = cells[2].get_text(strip=True) if len(cells) > 2 else ''
+            area_text = cells[2]
             area = None
             if area_text:
                 area_match = re.search(r'(\d+(?:\.\d+)?)', area_text)
@@ -150,7 +145,7 @@ class SSParser:
                     area = float(area_match.group(1))
             
             # Parse floor (usually fourth cell)
-            floor_text = cells[3].get_text(strip=True) if len(cells) > 3 else ''
+            floor_text = cells[3]
             floor = None
             total_floors = None
             if floor_text:
@@ -162,19 +157,13 @@ class SSParser:
                     floor = int(floor_text)
             
             # Parse price (usually last cell)
-            price_text = cells[-1].get_text(strip=True) if cells else ''
-            price_info = self._parse_price(price_text)
+            price_info = self._parse_price(cells[-1])
             
             # Determine property type
             property_type = 'apartment' if 'kv' in title.lower() or 'dzīvoklis' in title.lower() else 'house'
             
             # Extract image URL
-            image_element = ad_element.find('img')
-            image_url = None
-            if image_element:
-                image_src = image_element.get('src')
-                if image_src:
-                    image_url = urljoin(base_url, image_src)
+            image_url = urljoin(base_url, row.image_src) if row.image_src else None
             
             return Advertisement(
                 ss_id=ss_id,
@@ -195,62 +184,261 @@ class SSParser:
             logger.error(f"Error parsing advertisement: {e}")
             return None
     
-    def get_real_estate_ads(self, url: str, property_type: str = 'apartment', max_pages: int = None) -> List[Advertisement]:
-        """Get real estate advertisements from URL"""
+    def _build_target_url(self, url: str) -> str:
+        """Add /all/sell/ to URL for better results (only for sale ads)"""
+        target_url = normalize_section_url(url)
+        if target_url != url:
+            logger.info(f"Using URL with /all/sell/: {target_url}")
+        return target_url
+    
+    def _page_url(self, target_url: str, page: int) -> str:
+        """Get URL of a listing page"""
+        return f"{target_url}?page={page}" if page > 1 else target_url
+    
+    def _parse_listing_page(self, content: bytes, page: int) -> List[Advertisement]:
+        """Parse advertisements from listing page content"""
+        return self._build_listing_ads(extract_listing_rows(content, self.backend), page)
+    
+    async def _parse_listing_page_async(self, content: bytes, page: int) -> List[Advertisement]:
+        """Parse advertisements from listing page content in the parser process pool"""
+        rows = await extract_listing_rows_async(content, self.backend)
+        return self._build_listing_ads(rows, page)
+    
+    def _build_listing_ads(self, rows: Optional[List[RawAdRow]], page: int) -> List[Advertisement]:
+        """Build advertisements from the rows of a listing page"""
+        if rows is None:
+            logger.warning(f"No main table found on page {page}")
+            return []
+        
+        logger.info(f"Found {len(rows)} advertisement rows on page {page}")
+        
+        # Parse each advertisement
+        ads = []
+        for row in rows:
+            ad = self._build_advertisement(row, self.base_url)
+            if ad:
+                ads.append(ad)
+        
+        return ads
+    
+    def _read_listing_page(self, page_url: str, page: int, response,
+                           cached: Optional[CachedPage]) -> List[Advertisement]:
+        """Get advertisements from listing page response, reusing cached parse when unchanged"""
+        ads, fingerprint = self._cached_page_ads(page, response, cached)
+        if ads is None:
+            ads = self._parse_listing_page(response.content, page)
+            self._store_page(page_url, response, ads, fingerprint)
+        return ads
+    
+    async def _read_listing_page_async(self, page_url: str, page: int, response,
+                                       cached: Optional[CachedPage]) -> List[Advertisement]:
+        """Get advertisements from listing page response, parsing changed pages off the loop"""
+        ads, fingerprint = self._cached_page_ads(page, response, cached)
+        if ads is None:
+            ads = await self._parse_listing_page_async(response.content, page)
+            self._store_page(page_url, response, ads, fingerprint)
+        return ads
+    
+    def _cached_page_ads(self, page: int, response,
+                         cached: Optional[CachedPage]
+                         ) -> Tuple[Optional[List[Advertisement]], Optional[str]]:
+        """Cached advertisements if the page did not change (else None), and the page fingerprint"""
+        if cached and response.status_code == 304:
+            logger.info(f"Page {page} not modified")
+            self.page_cache.record_hit(not_modified=True)
+            return list(cached.ads), cached.fingerprint
+        
+        fingerprint = listing_fingerprint(response.content)
+        if cached and fingerprint and fingerprint == cached.fingerprint:
+            logger.info(f"Page {page} unchanged")
+            self.page_cache.record_hit()
+            return list(cached.ads), fingerprint
+        
+        self.page_cache.record_miss()
+        return None, fingerprint
+    
+    def _store_page(self, page_url: str, response, ads: List[Advertisement],
+                    fingerprint: Optional[str]):
+        """Remember parsed page with its validators"""
+        self.page_cache.store(
+            page_url, ads, fingerprint,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+    
+    def _is_known_page(self, ads: List[Advertisement], known_ads: KnownAds) -> bool:
+        """Check if page consists only of already known, unchanged ads"""
+        if not ads:
+            return False
+        
+        for ad in ads:
+            if ad.ss_id not in known_ads:
+                return False
+            if isinstance(known_ads, Mapping) and known_ads[ad.ss_id] != ad.price_info.price:
+                return False
+        
+        return True
+    
+    def iter_real_estate_ads(self, url: str, property_type: str = 'apartment',
+                             max_pages: int = None,
+                             known_ads: Optional[KnownAds] = None) -> Iterator[List[Advertisement]]:
+        """Yield advertisements page by page as soon as each page is parsed (blocking)
+        
+        Each page is fetched by the async engine only when the consumer asks
+        for it. Failed pages are skipped; with known_ads paging stops after
+        the first page made up entirely of known, unchanged ads.
+        """
         if max_pages is None:
             max_pages = config.MAX_PAGES_PER_CATEGORY
         
-        # Add /all/sell/ to URL for better results (only for sale ads)
-        if not url.endswith('/all/sell/'):
-            target_url = url.rstrip('/') + '/all/sell/'
-            logger.info(f"Using URL with /all/sell/: {target_url}")
-        else:
-            target_url = url
-        
-        all_ads = []
+        target_url = self._build_target_url(url)
         
-        for page in range(1, max_pages + 1):
-            try:
-                page_url = f"{target_url}?page={page}" if page > 1 else target_url
-                logger.info(f"Fetching ads from: {page_url}")
-                
-                response = self._make_request(page_url)
-                if not response:
+        with self._sync_loop() as loop:
+            for page in range(1, max_pages + 1):
+                page_url = self._page_url(target_url, page)
+                page_ads = loop.run_until_complete(self._fetch_page_async(page_url, page))
+                if page_ads is None:
                     continue
+                yield page_ads
                 
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Find advertisement table
-                main_table = soup.find('table', id='page_main')
-                if not main_table:
-                    logger.warning(f"No main table found on page {page}")
+                if known_ads is not None and self._is_known_page(page_ads, known_ads):
+                    logger.info(f"Page {page} has no new ads, stopping")
+                    break
+    
+    def get_real_estate_ads(self, url: str, property_type: str = 'apartment', max_pages: int = None,
+                            known_ads: Optional[KnownAds] = None) -> List[Advertisement]:
+        """Get real estate advertisements from URL (blocking, for tests and scripts)"""
+        with self._sync_loop() as loop:
+            try:
+                return loop.run_until_complete(
+                    self.get_real_estate_ads_async(url, property_type, max_pages, known_ads)
+                )
+            except SectionFetchError as e:
+                logger.error(str(e))
+                return []
+    
+    async def aiter_real_estate_ads(self, url: str, property_type: str = 'apartment',
+                                    max_pages: int = None, known_ads: Optional[KnownAds] = None
+                                    ) -> AsyncIterator[List[Advertisement]]:
+        """Yield advertisements page by page, in page order, without blocking the event loop
+        
+        Without known_ads later pages keep downloading while the caller
+        processes earlier ones; with known_ads pages are fetched one by one
+        until a page has nothing new. Pages that fail are skipped, and
+        SectionFetchError is raised when not a single page could be fetched.
+        """
+        if max_pages is None:
+            max_pages = config.MAX_PAGES_PER_CATEGORY
+        
+        target_url = self._build_target_url(url)
+        fetched = 0
+        
+        if known_ads is not None:
+            for page in range(1, max_pages + 1):
+                page_ads = await self._fetch_page_async(self._page_url(target_url, page), page)
+                if page_ads is None:
                     continue
+                fetched += 1
+                yield page_ads
                 
-                # Find advertisement rows
-                ad_rows = main_table.find_all('tr', id=re.compile(r'^tr_\d+'))
-                logger.info(f"Found {len(ad_rows)} advertisement rows on page {page}")
-                
-                # Parse each advertisement
-                for row in ad_rows:
-                    ad = self._parse_advertisement(row, self.base_url)
-                    if ad:
-                        all_ads.append(ad)
-                
-                # Add delay between requests
-                if page < max_pages:
-                    time.sleep(config.REQUEST_DELAY)
-                    
-            except Exception as e:
-                logger.error(f"Error fetching page {page}: {e}")
-                continue
+                if self._is_known_page(page_ads, known_ads):
+                    logger.info(f"Page {page} has no new ads, stopping")
+                    break
         
+        else:
+            # Prefetch all pages, paced by the shared per-host rate limiter
+            tasks = [
+                asyncio.ensure_future(
+                    self._fetch_page_async(self._page_url(target_url, page), page)
+                )
+                for page in range(1, max_pages + 1)
+            ]
+            try:
+                for task in tasks:
+                    page_ads = await task
+                    if page_ads is None:
+                        continue
+                    fetched += 1
+                    yield page_ads
+            finally:
+                # Consumer stopped early or failed, drop pages nobody will read
+                for task in tasks:
+                    task.cancel()
+        
+        if not fetched:
+            raise SectionFetchError(f"No listing page of {target_url} could be fetched")
+    
+    async def get_real_estate_ads_async(self, url: str, property_type: str = 'apartment',
+                                        max_pages: int = None,
+                                        known_ads: Optional[KnownAds] = None
+                                        ) -> List[Advertisement]:
+        """Get real estate advertisements from URL without blocking the event loop"""
+        all_ads = []
+        async for page_ads in self.aiter_real_estate_ads(url, property_type, max_pages, known_ads):
+            all_ads.extend(page_ads)
         logger.info(f"Total advertisements collected: {len(all_ads)}")
         return all_ads
     
+    async def _fetch_page_async(self, page_url: str, page: int) -> Optional[List[Advertisement]]:
+        """Fetch and parse a single listing page, None if it failed"""
+        try:
+            logger.info(f"Fetching ads from: {page_url}")
+            cached = self.page_cache.get(page_url)
+            headers = cached.conditional_headers() if cached else None
+            response = await self.fetcher.fetch(page_url, headers)
+            if not response:
+                return None
+            
+            return await self._read_listing_page_async(page_url, page, response, cached)
+            
+        except Exception as e:
+            logger.error(f"Error fetching page {page}: {e}")
+            return None
+    
+    async def get_section_preview_async(self, url: str) -> Optional[SectionPreview]:
+        """Fetch the first listing page of a section, None if it could not be fetched
+        
+        Sale listings (/all/sell/) are tried first, the URL as given when
+        they have no ads.
+        """
+        target_url = self._build_target_url(url)
+        preview = await self._fetch_preview_async(target_url)
+        
+        if (preview is None or not preview.ads) and target_url != url:
+            logger.info(f"No ads found in {target_url}, trying original URL: {url}")
+            fallback = await self._fetch_preview_async(url)
+            if fallback is not None and (preview is None or fallback.ads):
+                preview = fallback
+        
+        return preview
+    
+    async def _fetch_preview_async(self, page_url: str) -> Optional[SectionPreview]:
+        """Fetch and parse a listing page with its title"""
+        try:
+            started = time.perf_counter()
+            response = await self.fetcher.fetch(page_url)
+            if not response:
+                return None
+            
+            fetched = time.perf_counter()
+            ads = await self._read_listing_page_async(page_url, 1, response, None)
+            return SectionPreview(
+                url=page_url,
+                ads=ads,
+                title=extract_page_title(response.content),
+                fetch_seconds=fetched - started,
+                parse_seconds=time.perf_counter() - fetched
+            )
+            
+        except Exception as e:
+            logger.error(f"Error fetching preview of {page_url}: {e}")
+            return None
+    
     def get_advertisement_details(self, url: str) -> Optional[Dict[str, Any]]:
         """Get detailed information about a specific advertisement"""
         try:
-            response = self._make_request(url)
+            with self._sync_loop() as loop:
+                response = loop.run_until_complete(self.fetcher.fetch(url))
             if not response:
                 return None
             
@@ -0,0 +1,87 @@
+"""
+Process-wide rate limiting for SS.lv Monitor
+"""
+import asyncio
+import threading
+import time
+import logging
+from typing import Dict
+from urllib.parse import urlsplit
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket usable from both sync and async code"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add tokens accumulated since last update"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Reserve one token, returns seconds to wait until it is available"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available, otherwise return seconds until it is"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+    
+    def acquire(self):
+        """Block until a token is available"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back all callers for the given time (e.g. after HTTP 429)"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+        logger.warning(f"Rate limiter paused for {seconds:.1f}s")
+
+_host_limiters: Dict[str, TokenBucket] = {}
+_host_limiters_lock = threading.Lock()
+
+def get_host_limiter(url: str) -> TokenBucket:
+    """Get the shared token bucket for the host of the given URL"""
+    host = urlsplit(url).netloc.lower()
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = TokenBucket(config.RATE_LIMIT_PER_SECOND,
+                                               config.RATE_LIMIT_BURST)
+        return _host_limiters[host]
+
+def parse_retry_after(value: str, default: float) -> float:
+    """Parse Retry-After header value in seconds"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,95 @@
+"""
+Single-process runtime running the bot and the background scheduler together
+"""
+import signal
+import asyncio
+import logging
+from typing import Optional
+
+from .config import config
+from .database import DatabaseManager
+from .bot.interactive_bot import InteractiveSSMonitorBot
+from .scheduler import BackgroundScheduler
+from .parser import shutdown_parse_pool
+from .parser.async_fetcher import get_shared_fetcher
+
+logger = logging.getLogger(__name__)
+
+class MonitorRuntime:
+    """Bot and background scheduler on one event loop
+    
+    The scheduler reuses the bot's parser, user manager and notification
+    system, so scans and bot commands share one fetch engine, one database
+    manager and one delivery pipeline. Scan notifications are sent through
+    the bot that is already running instead of a second Bot instance.
+    """
+    
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.bot = InteractiveSSMonitorBot(self.db_manager)
+        self.scheduler = BackgroundScheduler(
+            self.db_manager,
+            parser=self.bot.parser,
+            user_manager=self.bot.user_manager,
+            notification_system=self.bot.notification_system
+        )
+        self._stopping: Optional[asyncio.Event] = None
+    
+    async def start(self):
+        """Start the bot and the scheduler on the running event loop"""
+        await self.bot.start()
+        self.scheduler.start()
+        logger.info(f"Monitor running, bot receiving updates by {config.BOT_MODE}")
+    
+    async def stop(self, timeout: Optional[float] = None):
+        """Stop scanning, deliver queued notifications and shut everything down"""
+        timeout = config.SHUTDOWN_TIMEOUT if timeout is None else timeout
+        self.scheduler.stop(shutdown_pool=False)
+        # Joining the parser processes blocks, keep it off the loop while delivery drains
+        pool_stopped = asyncio.get_running_loop().run_in_executor(None, shutdown_parse_pool)
+        try:
+            await self.bot.notification_system.close(timeout)
+        except Exception as e:
+            logger.error(f"Error delivering notifications on shutdown: {e}")
+        try:
+            await self.bot.stop()
+        except Exception as e:
+            logger.error(f"Error stopping bot: {e}")
+        await get_shared_fetcher().close()
+        await pool_stopped
+        self.db_manager.close()
+        logger.info("Monitor stopped")
+    
+    def request_stop(self):
+        """Ask run_forever to shut down"""
+        if self._stopping is not None:
+            self._stopping.set()
+    
+    async def run_forever(self):
+        """Run until SIGINT/SIGTERM or request_stop, then shut down"""
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Not available on Windows or outside the main thread
+                pass
+        
+        await self.start()
+        try:
+            await self._stopping.wait()
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await self.stop()
+    
+    def run(self):
+        """Run the bot and the scheduler until interrupted"""
+        try:
+            asyncio.run(self.run_forever())
+        except KeyboardInterrupt:
+            logger.info("Received keyboard interrupt, shutting down...")
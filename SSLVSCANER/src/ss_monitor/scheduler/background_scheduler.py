@@ -1,9 +1,13 @@
 """
 Background scheduler for SS.lv Monitor
 """
+import os
+import socket
 import asyncio
+import heapq
+import hashlib
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
@@ -11,32 +15,77 @@ from apscheduler.triggers.interval import IntervalTrigger
 from ..config import config
 from ..database import DatabaseManager
 from ..database.user_manager import UserManager
-from ..parser import SSParser
+from ..database.models import SubscriptionModel, ScanStateModel
+from ..parser import SSParser, normalize_section_url, shutdown_parse_pool
 from ..notifications import NotificationSystem
 
 logger = logging.getLogger(__name__)
 
+# Max remembered ads per section for incremental scans
+SECTION_WATERMARK_SIZE = 500
+
+# Scan interval per subscription frequency
+FREQUENCY_INTERVALS = {
+    '1h': timedelta(hours=1),
+    '4h': timedelta(hours=4),
+    '12h': timedelta(hours=12),
+    '1d': timedelta(days=1)
+}
+DEFAULT_SCAN_INTERVAL = FREQUENCY_INTERVALS['1h']
+
+# Weight of the latest scan in a section's churn rate
+CHURN_ALPHA = 0.3
+
+def scan_result_hash(scanned: Dict[str, Any]) -> str:
+    """Hash of the (ss_id, price) pairs seen by a section scan"""
+    data = repr(sorted(scanned.items())).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 class BackgroundScheduler:
-    """Background scheduler for periodic scanning"""
+    """Background scheduler for periodic scanning
     
-    def __init__(self, db_manager: DatabaseManager = None, bot=None):
+    Several schedulers (processes or nodes) may share one database: a
+    section is only scanned under a lease in the scan_leases table, renewed
+    while the scan runs, so workers split the due sections and take over
+    sections of a crashed worker once its leases expire.
+    """
+    
+    def __init__(self, db_manager: DatabaseManager = None, bot=None, parser: SSParser = None,
+                 user_manager: UserManager = None, notification_system: NotificationSystem = None):
         self.db_manager = db_manager or DatabaseManager()
-        self.user_manager = UserManager(self.db_manager)
-        self.parser = SSParser()
-        self.notification_system = NotificationSystem(self.db_manager, bot)
+        self.user_manager = user_manager or UserManager(self.db_manager)
+        self.parser = parser or SSParser()
+        self.notification_system = notification_system or NotificationSystem(
+            self.db_manager, bot, parser=self.parser
+        )
         self.scheduler = AsyncIOScheduler()
         self.scan_tasks = {}  # Track running scan tasks
+        self.section_watermarks: Dict[str, Dict[str, Any]] = {}  # section URL -> {ss_id: price}
+        self.scan_states: Dict[str, ScanStateModel] = {}
+        self._due_queue: List[Tuple[datetime, str]] = []  # min-heap of (next_due_at, section URL)
+        self._scheduled: Dict[str, datetime] = {}  # section URL -> due time of its live queue entry
+        self.worker_id = config.SCAN_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+        self._load_scan_states()
         self._setup_scheduler()
     
     def _setup_scheduler(self):
         """Setup the scheduler"""
         try:
-            # Add job for scanning all user subscriptions
+            # Add job scanning the sections that are due
+            self.scheduler.add_job(
+                self._scan_due_sections,
+                trigger=IntervalTrigger(seconds=config.SCAN_TICK_SECONDS),
+                id='scan_due_sections',
+                name='Scan due sections',
+                replace_existing=True
+            )
+            
+            # Forget sent notifications past their TTL
             self.scheduler.add_job(
-                self._scan_all_subscriptions,
-                trigger=IntervalTrigger(minutes=30),  # Check every 30 minutes
-                id='scan_all_subscriptions',
-                name='Scan all user subscriptions',
+                self.notification_system.ledger.purge,
+                trigger=IntervalTrigger(hours=24),
+                id='purge_notification_ledger',
+                name='Purge notification ledger',
                 replace_existing=True
             )
             
@@ -46,184 +95,279 @@ class BackgroundScheduler:
             logger.error(f"Error setting up scheduler: {e}")
             raise
     
-    async def _scan_all_subscriptions(self):
-        """Scan all user subscriptions"""
+    async def _scan_due_sections(self):
+        """Scan sections whose next due time has passed"""
         try:
-            logger.info("Starting background scan of all subscriptions")
-            
-            # Get all users with active subscriptions
-            users = self.user_manager.get_users_for_scanning()
+            plan = self._build_scan_plan(self.db_manager.get_subscriptions(active_only=True))
+            self._refresh_due_queue(plan)
             
-            if not users:
-                logger.info("No active subscriptions found")
+            now = datetime.now()
+            due = self._lease_due_sections(self._pop_due_sections(plan, now), now)
+            if not due:
                 return
             
-            logger.info(f"Found {len(users)} users with active subscriptions")
-            
-            # Process each user's subscriptions
-            for user_data in users:
-                user_id = user_data['user_id']
-                subscriptions = user_data['subscriptions']
-                
-                # Check if user needs scanning based on frequency
-                if self._should_scan_user(user_data):
-                    await self._scan_user_subscriptions(user_id, subscriptions)
-                else:
-                    logger.debug(f"User {user_id} not due for scanning yet")
-            
-            logger.info("Background scan completed")
+            logger.info(f"{len(due)} of {len(plan)} sections due for scanning")
+            heartbeat = asyncio.create_task(self._renew_leases(list(due)))
+            try:
+                await self._execute_scan_plan(due)
+            finally:
+                heartbeat.cancel()
+                # Scan state is saved by now, other workers see the next due time
+                self.db_manager.release_scan_leases(self.worker_id, list(due))
             
         except Exception as e:
-            logger.error(f"Error in background scan: {e}")
+            logger.error(f"Error scanning due sections: {e}")
     
-    def _should_scan_user(self, user_data: Dict[str, Any]) -> bool:
-        """Check if user should be scanned based on frequency"""
-        try:
-            frequency = user_data.get('frequency', '1h')
-            subscriptions = user_data.get('subscriptions', [])
-            
-            if not subscriptions:
-                return False
-            
-            # Get the most recent scan time for this user
-            last_scan = self._get_user_last_scan_time(user_data['user_id'])
-            
-            if not last_scan:
-                return True  # First scan
-            
-            # Calculate next scan time based on frequency
-            next_scan = self._calculate_next_scan_time(last_scan, frequency)
-            
-            return datetime.now() >= next_scan
-            
-        except Exception as e:
-            logger.error(f"Error checking scan frequency for user: {e}")
-            return False
+    def _lease_due_sections(self, due: Dict[str, List[SubscriptionModel]],
+                            now: datetime) -> Dict[str, List[SubscriptionModel]]:
+        """Lease up to SCAN_LEASE_BATCH due sections for this worker
+        
+        Scan state is reloaded before and after leasing, as other workers
+        may have scanned a section since; sections no longer due are
+        rescheduled. Sections leased elsewhere stay due for the next tick.
+        """
+        urls = self._still_due(list(due), now)
+        leased = self.db_manager.acquire_scan_leases(
+            self.worker_id, urls, config.SCAN_LEASE_SECONDS, now, limit=config.SCAN_LEASE_BATCH
+        )
+        
+        # Another worker may have finished a scan between the reload and the lease
+        still_due = self._still_due(leased, now)
+        if len(still_due) < len(leased):
+            self.db_manager.release_scan_leases(
+                self.worker_id, [url for url in leased if url not in still_due]
+            )
+        
+        for url in urls:
+            if url not in leased:
+                self._schedule_section(url, now)
+        return {url: due[url] for url in still_due}
     
-    def _get_user_last_scan_time(self, user_id: str) -> datetime:
-        """Get user's last scan time"""
-        try:
-            # This would be stored in a user_scan_logs table
-            # For now, we'll use a simple approach
-            return datetime.now() - timedelta(hours=2)  # Placeholder
-        except Exception as e:
-            logger.error(f"Error getting last scan time for user {user_id}: {e}")
-            return None
+    def _still_due(self, urls: List[str], now: datetime) -> List[str]:
+        """Reload scan state of sections, rescheduling those other workers scanned meanwhile"""
+        for state in self.db_manager.get_scan_states(urls):
+            self.scan_states[state.section_url] = state
+        
+        still_due = []
+        for url in urls:
+            state = self.scan_states.get(url)
+            if state and state.next_due_at > now:
+                self._schedule_section(url, state.next_due_at)
+            else:
+                still_due.append(url)
+        return still_due
     
-    def _calculate_next_scan_time(self, last_scan: datetime, frequency: str) -> datetime:
-        """Calculate next scan time based on frequency"""
-        try:
-            frequency_map = {
-                '1h': timedelta(hours=1),
-                '4h': timedelta(hours=4),
-                '12h': timedelta(hours=12),
-                '1d': timedelta(days=1)
-            }
-            
-            interval = frequency_map.get(frequency, timedelta(hours=1))
-            return last_scan + interval
+    async def _renew_leases(self, urls: List[str]):
+        """Heartbeat leases of sections being scanned until cancelled"""
+        while True:
+            await asyncio.sleep(config.SCAN_LEASE_SECONDS / 3)
+            renewed = self.db_manager.renew_scan_leases(
+                self.worker_id, urls, config.SCAN_LEASE_SECONDS
+            )
+            if len(renewed) < len(urls):
+                logger.warning(f"Lost {len(urls) - len(renewed)} scan leases, "
+                               "another worker may rescan them")
+    
+    def _load_scan_states(self):
+        """Load persisted scan state of all sections"""
+        self.scan_states = {state.section_url: state for state in self.db_manager.get_scan_states()}
+        logger.info(f"Loaded scan state of {len(self.scan_states)} sections")
+    
+    def _scan_interval(self, subscriptions: List[SubscriptionModel],
+                       state: ScanStateModel = None) -> timedelta:
+        """Scan interval of a section
+        
+        The shortest frequency among its subscriptions, shortened for busy
+        sections to expect SCAN_TARGET_EVENTS changes per scan, but not
+        below SCAN_MIN_INTERVAL.
+        """
+        interval = min(
+            (FREQUENCY_INTERVALS.get(subscription.frequency, DEFAULT_SCAN_INTERVAL)
+             for subscription in subscriptions),
+            default=DEFAULT_SCAN_INTERVAL
+        )
+        
+        if config.ADAPTIVE_SCAN and state and state.churn_rate > 0:
+            churn_interval = timedelta(hours=config.SCAN_TARGET_EVENTS / state.churn_rate)
+            floor = min(interval, timedelta(seconds=config.SCAN_MIN_INTERVAL))
+            interval = max(floor, min(interval, churn_interval))
+        
+        return interval
+    
+    def _update_churn(self, state: ScanStateModel, events: int, now: datetime):
+        """Fold changes found since the previous scan into the section's churn rate"""
+        if state.last_scan_at is None:
+            return  # Everything is new on the first scan
+        
+        hours = max((now - state.last_scan_at).total_seconds() / 3600, 1 / 60)
+        state.churn_rate = CHURN_ALPHA * (events / hours) + (1 - CHURN_ALPHA) * state.churn_rate
+    
+    def _schedule_section(self, url: str, due_at: datetime):
+        """Push section onto the due queue, superseding its earlier entry"""
+        self._scheduled[url] = due_at
+        heapq.heappush(self._due_queue, (due_at, url))
+    
+    def _refresh_due_queue(self, plan: Dict[str, List[SubscriptionModel]]):
+        """Schedule planned sections that are new or need an earlier scan"""
+        now = datetime.now()
+        for url, subscriptions in plan.items():
+            state = self.scan_states.get(url)
+            if state is None:
+                due_at = now  # Never scanned
+            elif state.last_scan_at and not state.consecutive_failures:
+                # A subscriber may have switched to a shorter frequency
+                due_at = min(state.next_due_at,
+                             state.last_scan_at + self._scan_interval(subscriptions, state))
+            else:
+                due_at = state.next_due_at
             
-        except Exception as e:
-            logger.error(f"Error calculating next scan time: {e}")
-            return datetime.now() + timedelta(hours=1)
+            if self._scheduled.get(url) != due_at:
+                self._schedule_section(url, due_at)
+    
+    def _pop_due_sections(self, plan: Dict[str, List[SubscriptionModel]],
+                          now: datetime) -> Dict[str, List[SubscriptionModel]]:
+        """Pop sections due by now, with their subscriptions"""
+        due = {}
+        while self._due_queue and self._due_queue[0][0] <= now:
+            due_at, url = heapq.heappop(self._due_queue)
+            if self._scheduled.get(url) != due_at:
+                continue  # Superseded entry
+            del self._scheduled[url]
+            
+            # Sections left without active subscriptions drop out of the queue
+            if url in plan:
+                due[url] = plan[url]
+        return due
+    
+    def _record_scan(self, url: str, subscriptions: List[SubscriptionModel],
+                     scanned: Dict[str, Any], failed: bool, events: int = 0):
+        """Persist scan outcome of a section and schedule its next scan"""
+        now = datetime.now()
+        state = self.scan_states.get(url) or ScanStateModel(section_url=url)
+        
+        if failed:
+            # Retry sooner than the regular interval, backing off on repeated failures
+            state.consecutive_failures += 1
+            retry_delay = timedelta(
+                seconds=config.SCAN_RETRY_DELAY * 2 ** (state.consecutive_failures - 1)
+            )
+            state.next_due_at = now + min(self._scan_interval(subscriptions, state), retry_delay)
+        else:
+            self._update_churn(state, events, now)
+            state.consecutive_failures = 0
+            state.last_scan_at = now
+            state.last_result_hash = scan_result_hash(scanned)
+            state.next_due_at = now + self._scan_interval(subscriptions, state)
+        
+        self.scan_states[url] = state
+        self.db_manager.save_scan_state(state)
+        self._schedule_section(url, state.next_due_at)
+    
+    def _build_scan_plan(self, subscriptions: List[SubscriptionModel]
+                         ) -> Dict[str, List[SubscriptionModel]]:
+        """Group subscriptions by normalized section URL"""
+        plan = {}
+        for subscription in subscriptions:
+            plan.setdefault(normalize_section_url(subscription.url), []).append(subscription)
+        return plan
+    
+    async def _execute_scan_plan(self, plan: Dict[str, List[SubscriptionModel]]):
+        """Fetch every section once and fan out the ads to all its subscribers"""
+        if not plan:
+            return
+        
+        total_subscriptions = sum(len(subscriptions) for subscriptions in plan.values())
+        logger.info(
+            f"Scan plan: {total_subscriptions} subscriptions -> {len(plan)} unique sections"
+        )
+        
+        # Stream all sections in parallel, each page is processed as soon as it is parsed
+        await asyncio.gather(*[
+            self._scan_section(url, subscriptions) for url, subscriptions in plan.items()
+        ])
     
     async def _scan_user_subscriptions(self, user_id: str, subscriptions: List[Any]):
         """Scan subscriptions for a specific user"""
         try:
             logger.info(f"Scanning subscriptions for user {user_id}")
             
-            # Group subscriptions by URL to avoid duplicate scanning
-            urls = list(set(sub.url for sub in subscriptions))
-            
-            for url in urls:
-                try:
-                    # Scan this URL
-                    ads = await self._scan_url(url)
-                    
-                    if ads:
-                        # Process new ads and price changes
-                        await self._process_ads_for_user(user_id, ads, url)
-                    
-                except Exception as e:
-                    logger.error(f"Error scanning URL {url} for user {user_id}: {e}")
+            if not subscriptions:
+                subscriptions = self.user_manager.get_user_subscriptions(user_id)
             
-            # Update user's last scan time
-            self._update_user_scan_time(user_id)
+            await self._execute_scan_plan(self._build_scan_plan(subscriptions))
             
         except Exception as e:
             logger.error(f"Error scanning subscriptions for user {user_id}: {e}")
     
-    async def _scan_url(self, url: str) -> List[Any]:
-        """Scan a specific URL"""
+    async def _scan_section(self, url: str, subscriptions: List[SubscriptionModel]) -> int:
+        """Scan a section URL page by page and fan out each page to its subscribers"""
+        scanned: Dict[str, Any] = {}  # ss_id -> price, in page order
+        events = 0  # new ads and price changes
+        failed = False
         try:
-            # Add /all/sell/ to URL for better results (only for sale ads)
-            if not url.endswith('/all/sell/'):
-                target_url = url.rstrip('/') + '/all/sell/'
-                logger.info(f"Scanning URL with /all/sell/: {target_url}")
-            else:
-                target_url = url
-            
-            # Use the parser to get ads from URL
-            if 'flats' in url:
-                ads = self.parser.get_real_estate_ads(target_url, 'apartment')
-            elif 'homes-summer-residences' in url:
-                ads = self.parser.get_real_estate_ads(target_url, 'house')
-            else:
-                ads = self.parser.get_real_estate_ads(target_url, 'apartment')
-            
-            return ads
+            property_type = 'house' if 'homes-summer-residences' in url else 'apartment'
+            known_ads = self.section_watermarks.get(url) if config.INCREMENTAL_SCAN else None
+            
+            async for page_ads in self.parser.aiter_real_estate_ads(url, property_type,
+                                                                    known_ads=known_ads):
+                if not page_ads:
+                    continue
+                result = await self._process_section_ads(url, page_ads, subscriptions)
+                events += result.get('new_ads_found', 0) + result.get('price_changes', 0)
+                for ad in page_ads:
+                    scanned.setdefault(ad.ss_id, ad.price_info.price)
             
         except Exception as e:
-            logger.error(f"Error scanning URL {url}: {e}")
-            return []
+            logger.error(f"Error scanning section {url}: {e}")
+            failed = True
+        
+        # Only processed pages count as seen, a failed page is retried next scan
+        self._update_section_watermark(url, scanned)
+        self._record_scan(url, subscriptions, scanned, failed, events)
+        return len(scanned)
     
-    async def _process_ads_for_user(self, user_id: str, ads: List[Any], url: str):
-        """Process ads for a specific user"""
-        try:
-            # Get user's subscriptions for this URL
-            subscriptions = self.user_manager.get_user_subscriptions(user_id)
-            url_subscriptions = [sub for sub in subscriptions if sub.url == url]
-            
-            if not url_subscriptions:
-                return
-            
-            # Process each ad
-            for ad in ads:
-                try:
-                    # Save advertisement
-                    ad_id = self.db_manager.save_advertisement(ad)
-                    
-                    # Check for new ads and price changes
-                    await self.notification_system._process_advertisement(ad, user_id)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing ad for user {user_id}: {e}")
-            
-        except Exception as e:
-            logger.error(f"Error processing ads for user {user_id}: {e}")
+    def _update_section_watermark(self, url: str, scanned: Dict[str, Any]):
+        """Remember scanned ads of a section (ss_id -> price), newest first"""
+        watermark = dict(scanned)
+        for ss_id, price in self.section_watermarks.get(url, {}).items():
+            if len(watermark) >= SECTION_WATERMARK_SIZE:
+                break
+            watermark.setdefault(ss_id, price)
+        self.section_watermarks[url] = watermark
     
-    def _update_user_scan_time(self, user_id: str):
-        """Update user's last scan time"""
-        try:
-            # This would update a user_scan_logs table
-            # For now, we'll just log it
-            logger.info(f"Updated scan time for user {user_id}")
-        except Exception as e:
-            logger.error(f"Error updating scan time for user {user_id}: {e}")
+    async def _process_section_ads(self, url: str, ads: List[Any],
+                                   subscriptions: List[SubscriptionModel]) -> Dict[str, Any]:
+        """Process ads of one section page once and notify all its subscribers"""
+        result = await self.notification_system.process_section_ads(ads, subscriptions)
+        logger.info(f"Processed {len(ads)} ads of section {url} "
+                    f"for {len(subscriptions)} subscriptions: {result}")
+        return result
     
     def start(self):
         """Start the scheduler"""
         try:
             self.scheduler.start()
+            
+            # Deliver notifications left in the outbox by a previous run
+            self.scheduler.add_job(
+                self.notification_system.replay_outbox,
+                id='replay_outbox',
+                name='Replay pending notifications',
+                replace_existing=True
+            )
             logger.info("Background scheduler started")
         except Exception as e:
             logger.error(f"Error starting scheduler: {e}")
             raise
     
-    def stop(self):
-        """Stop the scheduler"""
+    def stop(self, shutdown_pool: bool = True):
+        """Stop the scheduler, shutdown_pool=False leaves the parser pool to the caller"""
         try:
             self.scheduler.shutdown()
+            self.db_manager.release_scan_leases(self.worker_id)
+            if shutdown_pool:
+                # Waits for the worker processes to exit
+                shutdown_parse_pool()
             logger.info("Background scheduler stopped")
         except Exception as e:
             logger.error(f"Error stopping scheduler: {e}")
@@ -233,20 +377,12 @@ class BackgroundScheduler:
         try:
             job_id = f"scan_user_{user_id}"
             
-            # Calculate interval
-            frequency_map = {
-                '1h': 60,  # minutes
-                '4h': 240,
-                '12h': 720,
-                '1d': 1440
-            }
-            
-            interval_minutes = frequency_map.get(frequency, 60)
+            interval = FREQUENCY_INTERVALS.get(frequency, DEFAULT_SCAN_INTERVAL)
             
             # Add job
             self.scheduler.add_job(
                 self._scan_user_subscriptions,
-                trigger=IntervalTrigger(minutes=interval_minutes),
+                trigger=IntervalTrigger(seconds=interval.total_seconds()),
                 id=job_id,
                 name=f"Scan user {user_id} subscriptions",
                 replace_existing=True,
@@ -274,6 +410,10 @@ class BackgroundScheduler:
             
             return {
                 'scheduler_running': self.scheduler.running,
+                'worker_id': self.worker_id,
+                'leased_sections': sum(
+                    lease.owner_id == self.worker_id for lease in self.db_manager.get_scan_leases()
+                ),
                 'total_jobs': len(jobs),
                 'jobs': [
                     {
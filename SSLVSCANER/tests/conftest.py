@@ -18,12 +18,15 @@ def temp_db():
     yield db_manager
     
     # Cleanup
-    os.unlink(db_path)
+    db_manager.close()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.unlink(path)
 
 @pytest.fixture
 def mock_parser():
     """Create mock parser for testing"""
-    with patch('src.ss_monitor.parser.ss_parser.requests.Session') as mock_session:
+    with patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch'):
         parser = SSParser()
         yield parser
 
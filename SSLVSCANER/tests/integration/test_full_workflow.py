@@ -2,7 +2,8 @@
 Integration tests for full workflow
 """
 import pytest
-from unittest.mock import Mock, patch
+import httpx
+from unittest.mock import patch
 from src.ss_monitor.database.database_manager import DatabaseManager
 from src.ss_monitor.parser.ss_parser import SSParser
 from src.ss_monitor.parser.models import Advertisement, PriceInfo
@@ -161,15 +162,13 @@ class TestFullWorkflow:
         assert subscriptions[0].min_price == 50000.0
         assert subscriptions[0].max_price == 200000.0
     
-    @patch('src.ss_monitor.parser.ss_parser.SSParser._make_request')
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
     def test_end_to_end_parsing(self, mock_request, temp_db, sample_html):
         """Test end-to-end parsing workflow"""
         parser = SSParser()
         
         # Mock response
-        mock_response = Mock()
-        mock_response.content = sample_html.encode()
-        mock_request.return_value = mock_response
+        mock_request.return_value = httpx.Response(200, content=sample_html.encode())
         
         # Parse advertisements
         ads = parser.get_real_estate_ads('apartment', 'riga', 1)
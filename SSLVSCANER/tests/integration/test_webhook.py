@@ -0,0 +1,158 @@
+"""
+Integration tests for webhook mode against a local fake Telegram endpoint
+"""
+import json
+import socket
+import asyncio
+import threading
+import pytest
+import httpx
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs
+
+from src.ss_monitor.config import config
+from src.ss_monitor.bot.interactive_bot import InteractiveSSMonitorBot
+from src.ss_monitor.runtime import MonitorRuntime
+from src.ss_monitor.scheduler import background_scheduler
+
+pytest.importorskip('tornado')  # python-telegram-bot[webhooks]
+
+CHAT = {'id': 42, 'type': 'private'}
+USER = {'id': 42, 'is_bot': False, 'first_name': 'Test'}
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Bot API stub recording called methods"""
+    
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(body)
+        else:
+            params = {key: values[0] for key, values in parse_qs(body).items()}
+        self.server.calls.append((method, params))
+        
+        results = {
+            'getMe': {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'},
+            'sendMessage': {
+                'message_id': 2, 'date': 0, 'chat': CHAT, 'text': params.get('text', '')
+            },
+        }
+        payload = json.dumps({'ok': True, 'result': results.get(method, True)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def fake_telegram():
+    """Fake Bot API server on a free local port"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramHandler)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def free_port() -> int:
+    """Get a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def webhook_settings(fake_telegram) -> dict:
+    """Config of webhook mode against the fake Bot API"""
+    return {
+        'BOT_MODE': 'webhook',
+        'TELEGRAM_API_URL': f"http://127.0.0.1:{fake_telegram.server_address[1]}/bot",
+        'WEBHOOK_URL': 'https://bot.example.com/telegram',
+        'WEBHOOK_PORT': free_port(),
+        'WEBHOOK_SECRET': 'secret',
+    }
+
+class TestWebhookMode:
+    """Test cases for receiving updates over the local webhook server"""
+    
+    @pytest.mark.asyncio
+    async def test_webhook_update_reaches_handlers(self, temp_db, fake_telegram):
+        """Test that a posted update is handled and answered through the Bot API"""
+        settings = webhook_settings(fake_telegram)
+        port = settings['WEBHOOK_PORT']
+        update = {
+            'update_id': 1,
+            'message': {
+                'message_id': 1, 'date': 0, 'chat': CHAT, 'from': USER, 'text': '/help',
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+            }
+        }
+        
+        with patch.multiple(config, **settings):
+            bot = InteractiveSSMonitorBot(temp_db)
+            await bot.start()
+            try:
+                async with httpx.AsyncClient() as client:
+                    url = f"http://127.0.0.1:{port}/telegram"
+                    secret = 'X-Telegram-Bot-Api-Secret-Token'
+                    rejected = await client.post(url, json=update, headers={secret: 'wrong'})
+                    accepted = await client.post(url, json=update, headers={secret: 'secret'})
+                
+                for _ in range(100):
+                    if any(method == 'sendMessage' for method, _ in fake_telegram.calls):
+                        break
+                    await asyncio.sleep(0.05)
+            finally:
+                await bot.stop()
+        
+        methods = [method for method, _ in fake_telegram.calls]
+        assert rejected.status_code == 403
+        assert accepted.status_code == 200
+        assert methods.count('sendMessage') == 1
+        
+        calls = fake_telegram.calls
+        set_webhook = next(params for method, params in calls if method == 'setWebhook')
+        assert set_webhook['url'] == 'https://bot.example.com/telegram'
+        assert set_webhook['secret_token'] == 'secret'
+        sent = next(params for method, params in calls if method == 'sendMessage')
+        assert str(sent['chat_id']) == '42'
+
+class TestMonitorRuntime:
+    """Test cases for running the bot and the scheduler on one event loop"""
+    
+    @pytest.mark.asyncio
+    async def test_runtime_shares_components_and_drains_on_stop(self, temp_db, fake_telegram):
+        """Test that the scheduler reuses the bot's components and stop delivers the queue"""
+        pool_threads = []
+        with patch.multiple(config, **webhook_settings(fake_telegram)), \
+                patch('src.ss_monitor.runtime.shutdown_parse_pool',
+                      lambda: pool_threads.append(threading.current_thread())), \
+                patch.object(background_scheduler, 'shutdown_parse_pool') as scheduler_pool:
+            runtime = MonitorRuntime(temp_db)
+            scheduler, bot = runtime.scheduler, runtime.bot
+            
+            assert scheduler.parser is bot.parser
+            assert scheduler.user_manager is bot.user_manager
+            assert scheduler.notification_system is bot.notification_system
+            assert bot.notification_system.parser is bot.parser
+            
+            await runtime.start()
+            try:
+                assert scheduler.scheduler.running
+                assert bot.application.running
+                bot.notification_system.delivery.enqueue('42', 'Queued before shutdown')
+            finally:
+                await runtime.stop(timeout=5)
+        
+        assert not scheduler.scheduler.running
+        assert not bot.application.running
+        assert bot.notification_system.delivery.pending == 0
+        # The parser pool is joined off the event loop thread
+        scheduler_pool.assert_not_called()
+        assert len(pool_threads) == 1 and pool_threads[0] is not threading.current_thread()
+        sent = [params for method, params in fake_telegram.calls if method == 'sendMessage']
+        assert [params['text'] for params in sent] == ['Queued before shutdown']
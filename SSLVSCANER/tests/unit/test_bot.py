@@ -0,0 +1,118 @@
+"""
+Unit tests for interactive bot handlers
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from telegram import ReplyKeyboardMarkup
+from telegram.error import BadRequest
+from src.ss_monitor.bot import interactive_bot
+from src.ss_monitor.bot.interactive_bot import InteractiveSSMonitorBot
+from src.ss_monitor.database.models import SubscriptionModel
+from src.ss_monitor.parser.models import Advertisement, PriceInfo, SectionPreview
+
+SECTIONS = [
+    'https://www.ss.lv/lv/real-estate/flats/riga/',
+    'https://www.ss.lv/lv/real-estate/homes-summer-residences/riga/',
+    'https://www.ss.lv/lv/real-estate/plots-and-lands/riga/',
+]
+
+def make_update(user_id: int = 42):
+    """Mock update whose replies are recorded in update.sent
+    
+    Like the Bot API, editing a message sent with a reply keyboard fails.
+    """
+    update = Mock()
+    update.effective_user.id = user_id
+    update.sent = []
+    
+    async def reply_text(text, reply_markup=None):
+        message = Mock(text=text, reply_markup=reply_markup, delete=AsyncMock())
+        if isinstance(reply_markup, ReplyKeyboardMarkup):
+            message.edit_text = AsyncMock(side_effect=BadRequest("Message can't be edited"))
+        else:
+            message.edit_text = AsyncMock()
+        update.sent.append(message)
+        return message
+    
+    update.message.reply_text = reply_text
+    return update
+
+class TestDebugHandler:
+    """Test cases for the /debug section check"""
+    
+    @pytest.fixture
+    def bot(self, temp_db):
+        """Bot with three sections subscribed by user 42"""
+        for url in SECTIONS:
+            temp_db.save_subscription(
+                SubscriptionModel(user_id='42', category='apartment', city='riga', url=url)
+            )
+        return InteractiveSSMonitorBot(temp_db)
+    
+    @staticmethod
+    def gated_previews():
+        """Preview fetch that only completes once every section has been requested"""
+        requested = []
+        gate = asyncio.Event()
+        
+        async def get(url, refresh=False):
+            requested.append((url, refresh))
+            if len(requested) == len(SECTIONS):
+                gate.set()
+            await gate.wait()
+            if 'plots' in url:
+                raise RuntimeError("Connection refused")
+            ad = Advertisement(
+                ss_id='1', title="Test Apartment", url='https://www.ss.lv/msg/1.html',
+                price_info=PriceInfo(price=100000.0, currency='EUR')
+            )
+            return SectionPreview(url=url, ads=[ad], fetch_seconds=0.5, parse_seconds=0.1)
+        
+        return get, requested
+    
+    @pytest.mark.asyncio
+    async def test_sections_checked_concurrently_with_throttled_edits(self, bot):
+        """Test that sections are fetched at once and intermediate edits are throttled"""
+        get, requested = self.gated_previews()
+        update = make_update()
+        
+        with patch.object(bot.previews, 'get', side_effect=get), \
+                patch.object(interactive_bot, 'DEBUG_PROGRESS_INTERVAL', 60):
+            # Sequential checks would wait on the gate forever
+            await asyncio.wait_for(bot._debug_handler(update), 2)
+        
+        progress, final = update.sent
+        assert progress.text.count("⏳ Проверяется...") == 3
+        assert progress.reply_markup is None
+        assert sorted(requested) == sorted((url, True) for url in SECTIONS)
+        
+        # Nothing in between passes the throttle, the results come as a new message
+        # with the keyboard
+        assert progress.edit_text.await_count == 0
+        progress.delete.assert_awaited_once()
+        assert isinstance(final.reply_markup, ReplyKeyboardMarkup)
+        final_text = final.text
+        assert final_text.startswith("🔧 Результаты отладки")
+        assert "⏳" not in final_text
+        assert final_text.count("✅ Найдено объявлений о продаже: 1") == 2
+        assert "❌ Ошибка: Connection refused" in final_text
+        assert "(загрузка 0.50 с, разбор 0.10 с)" in final_text
+    
+    @pytest.mark.asyncio
+    async def test_progress_edited_per_section_without_throttle(self, bot):
+        """Test that every finished section updates the progress, pending ones stay marked"""
+        get, _ = self.gated_previews()
+        update = make_update()
+        
+        with patch.object(bot.previews, 'get', side_effect=get), \
+                patch.object(interactive_bot, 'DEBUG_PROGRESS_INTERVAL', 0):
+            await asyncio.wait_for(bot._debug_handler(update), 2)
+        
+        progress, final = update.sent
+        edits = [call.args[0] for call in progress.edit_text.call_args_list]
+        assert len(edits) == 2
+        assert edits[0].startswith("🔧 Отладка: проверено 1 из 3 разделов")
+        assert edits[0].count("⏳ Проверяется...") == 2
+        assert edits[1].count("⏳ Проверяется...") == 1
+        assert final.text.startswith("🔧 Результаты отладки")
@@ -2,9 +2,14 @@
 Unit tests for database manager
 """
 import pytest
+import threading
 from datetime import datetime
+from unittest.mock import patch
 from src.ss_monitor.database.database_manager import DatabaseManager
-from src.ss_monitor.database.models import AdvertisementModel, PriceHistoryModel, SubscriptionModel
+from src.ss_monitor.database.user_manager import UserManager
+from src.ss_monitor.database.models import (
+    AdvertisementModel, PriceHistoryModel, SubscriptionModel, OutboxMessageModel
+)
 
 class TestDatabaseManager:
     """Test cases for DatabaseManager"""
@@ -264,6 +269,332 @@ class TestDatabaseManager:
         # Should be 1
         assert temp_db.get_total_subscriptions_count() == 1
 
+class TestConnections:
+    """Test cases for persistent WAL connections"""
+    
+    def test_connection_is_reused_per_thread(self, temp_db):
+        """Test that one thread keeps using one connection"""
+        with temp_db._get_connection() as first:
+            pass
+        with temp_db._get_connection() as second:
+            pass
+        
+        other = []
+        def use_connection():
+            with temp_db._get_connection() as conn:
+                other.append(conn)
+        thread = threading.Thread(target=use_connection)
+        thread.start()
+        thread.join()
+        
+        assert first is second
+        assert other[0] is not first
+    
+    def test_wal_pragmas(self, temp_db):
+        """Test connection settings"""
+        with temp_db._get_connection() as conn:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+            assert conn.execute('PRAGMA busy_timeout').fetchone()[0] > 0
+    
+    def test_reader_not_blocked_by_open_write(self, temp_db):
+        """Test that reads proceed while another thread holds a write transaction"""
+        temp_db.save_subscription(SubscriptionModel(user_id="1", category="apartment", city="riga"))
+        writing = threading.Event()
+        done = threading.Event()
+        
+        def write():
+            with temp_db._get_connection() as conn:
+                conn.execute("UPDATE subscriptions SET frequency = '4h'")
+                writing.set()
+                done.wait(5)
+        thread = threading.Thread(target=write)
+        thread.start()
+        writing.wait(5)
+        
+        try:
+            assert temp_db.get_total_subscriptions_count() == 1
+            assert temp_db.get_subscriptions()[0].frequency == '1h'
+        finally:
+            done.set()
+            thread.join()
+    
+    def test_uncommitted_work_is_discarded(self, temp_db):
+        """Test that a block without commit does not leave a transaction open"""
+        with temp_db._get_connection() as conn:
+            conn.execute("INSERT INTO subscriptions (user_id, category, city, url) "
+                         "VALUES ('1', 'a', 'b', 'c')")
+        
+        with temp_db._get_connection() as conn:
+            assert not conn.in_transaction
+        assert temp_db.get_total_subscriptions_count() == 0
+    
+    def test_close_reconnects_on_next_use(self, temp_db):
+        """Test that the manager is usable after close"""
+        temp_db.close()
+        assert temp_db.get_total_ads_count() == 0
+
+class TestBulkUpsert:
+    """Test cases for bulk advertisement upsert"""
+    
+    @staticmethod
+    def make_ad(ss_id: str, price: float = 100000.0) -> AdvertisementModel:
+        """Create advertisement model for tests"""
+        return AdvertisementModel(
+            ss_id=ss_id,
+            title=f"Test Apartment {ss_id}",
+            url=f"https://www.ss.lv/{ss_id}.html",
+            price=price,
+            currency="EUR"
+        )
+    
+    def test_bulk_classifies_ads(self, temp_db):
+        """Test inserted, price changed and unchanged classification"""
+        first = temp_db.save_advertisements_bulk([self.make_ad('1'), self.make_ad('2')])
+        assert [result.status for result in first] == ['inserted', 'inserted']
+        
+        second = temp_db.save_advertisements_bulk([
+            self.make_ad('3'), self.make_ad('1'), self.make_ad('2', 90000.0)
+        ])
+        assert [(result.ss_id, result.status) for result in second] == [
+            ('3', 'inserted'), ('1', 'unchanged'), ('2', 'price_changed')
+        ]
+        assert second[2].old_price == 100000.0
+        assert second[2].new_price == 90000.0
+        
+        # Ids match the stored rows
+        for result in first + second:
+            assert temp_db.get_advertisement_by_ss_id(result.ss_id).id == result.advertisement_id
+        assert temp_db.get_advertisement_by_ss_id('2').price == 90000.0
+        assert temp_db.get_total_ads_count() == 3
+    
+    def test_bulk_writes_price_history(self, temp_db):
+        """Test price history rows for new ads and price changes"""
+        ad_id = temp_db.save_advertisements_bulk([self.make_ad('1')])[0].advertisement_id
+        temp_db.save_advertisements_bulk([self.make_ad('1')])
+        temp_db.save_advertisements_bulk([self.make_ad('1', 95000.0)])
+        
+        history = temp_db.get_price_history(ad_id)
+        assert sorted(entry.change_type for entry in history) == ['new_ad', 'price_change']
+    
+    def test_bulk_duplicates_and_empty_batch(self, temp_db):
+        """Test that repeated ads in one batch are saved once"""
+        assert temp_db.save_advertisements_bulk([]) == []
+        
+        results = temp_db.save_advertisements_bulk([self.make_ad('1'), self.make_ad('1', 1.0)])
+        
+        assert len(results) == 1
+        assert temp_db.get_advertisement_by_ss_id('1').price == 100000.0
+
+class TestOutbox:
+    """Test cases for the notification outbox"""
+    
+    @staticmethod
+    def build_outbox(results):
+        """One notification per new advertisement"""
+        return [
+            OutboxMessageModel(chat_id='42', message=f"New {result.ss_id}",
+                               advertisement_id=result.advertisement_id)
+            for result in results if result.is_new
+        ]
+    
+    def test_outbox_written_with_upsert(self, temp_db):
+        """Test that notifications are stored with ids in the upsert transaction"""
+        ads = [TestBulkUpsert.make_ad('1'), TestBulkUpsert.make_ad('2')]
+        results = temp_db.save_advertisements_bulk(ads, self.build_outbox)
+        
+        pending = temp_db.get_pending_outbox()
+        assert [message.message for message in pending] == ['New 1', 'New 2']
+        assert [message.advertisement_id for message in pending] == [
+            result.advertisement_id for result in results
+        ]
+        
+        # Known ads produce no new notifications
+        temp_db.save_advertisements_bulk([TestBulkUpsert.make_ad('1')], self.build_outbox)
+        assert len(temp_db.get_pending_outbox()) == 2
+    
+    def test_failed_outbox_rolls_back_upsert(self, temp_db):
+        """Test that ads are not committed when their notifications cannot be stored"""
+        def broken_outbox(results):
+            raise RuntimeError("matching failed")
+        
+        with pytest.raises(RuntimeError):
+            temp_db.save_advertisements_bulk([TestBulkUpsert.make_ad('1')], broken_outbox)
+        
+        assert temp_db.get_total_ads_count() == 0
+        assert '1' not in temp_db.ad_index
+        assert temp_db.get_pending_outbox() == []
+    
+    def test_mark_delivered_and_failed(self, temp_db):
+        """Test that finished messages leave the pending list"""
+        ads = [TestBulkUpsert.make_ad(str(i)) for i in range(3)]
+        temp_db.save_advertisements_bulk(ads, self.build_outbox)
+        first, second, third = temp_db.get_pending_outbox()
+        
+        assert temp_db.mark_outbox_delivered(first.id)
+        assert temp_db.mark_outbox_failed(second.id, attempts=6)
+        
+        assert [message.id for message in temp_db.get_pending_outbox()] == [third.id]
+        assert temp_db.get_pending_outbox(limit=1)[0].id == third.id
+
+class TestAdvertisementIndex:
+    """Test cases for in-memory advertisement index"""
+    
+    @staticmethod
+    def make_ad(ss_id: str, price: float = 100000.0,
+                title: str = "Test Apartment") -> AdvertisementModel:
+        """Create advertisement model for tests"""
+        return AdvertisementModel(
+            ss_id=ss_id,
+            title=title,
+            url=f"https://www.ss.lv/{ss_id}.html",
+            price=price,
+            currency="EUR",
+            area=50.5,
+            rooms=2,
+            is_monthly=False
+        )
+    
+    def test_index_loaded_at_startup(self, temp_db):
+        """Test that a new manager loads stored ads with matching fingerprints"""
+        temp_db.save_advertisements_bulk([self.make_ad('1'), self.make_ad('2')])
+        
+        reopened = DatabaseManager(temp_db.db_path)
+        try:
+            assert len(reopened.ad_index) == 2
+            assert reopened.ad_index.get('1') == temp_db.ad_index.get('1')
+        finally:
+            reopened.close()
+    
+    def test_index_follows_writes(self, temp_db):
+        """Test that single and bulk saves keep the index in sync"""
+        ad_id = temp_db.save_advertisement(self.make_ad('1'))
+        assert temp_db.ad_index.get('1').id == ad_id
+        
+        temp_db.save_advertisements_bulk([self.make_ad('1', 90000.0)])
+        assert temp_db.ad_index.get('1').price == 90000.0
+    
+    def test_unchanged_ads_are_not_written(self, temp_db):
+        """Test that ads with identical content skip the update"""
+        temp_db.save_advertisements_bulk([self.make_ad('1'), self.make_ad('2')])
+        with temp_db._get_connection() as conn:
+            conn.execute("UPDATE advertisements SET updated_at = '2020-01-01 00:00:00'")
+            conn.commit()
+        
+        results = temp_db.save_advertisements_bulk([
+            self.make_ad('1'), self.make_ad('2', title="Renovated")
+        ])
+        
+        assert [result.status for result in results] == ['unchanged', 'unchanged']
+        assert temp_db.get_advertisement_by_ss_id('1').updated_at == datetime(2020, 1, 1)
+        assert temp_db.get_advertisement_by_ss_id('2').title == "Renovated"
+        assert temp_db.get_advertisement_by_ss_id('2').updated_at != datetime(2020, 1, 1)
+    
+    def test_unindexed_ads_fall_back_to_database(self, temp_db):
+        """Test classification of ads stored behind the index's back"""
+        temp_db.save_advertisements_bulk([self.make_ad('1')])
+        temp_db.ad_index.discard('1')
+        
+        results = temp_db.save_advertisements_bulk([self.make_ad('1', 80000.0)])
+        
+        assert results[0].status == 'price_changed'
+        assert results[0].old_price == 100000.0
+        assert '1' in temp_db.ad_index
+    
+    def test_changes_by_another_worker_are_seen(self, temp_db):
+        """Test that a price written by another manager on the same database is not missed"""
+        other = DatabaseManager(temp_db.db_path)
+        try:
+            temp_db.save_advertisements_bulk([self.make_ad('1', 100000.0)])
+            changed = other.save_advertisements_bulk([self.make_ad('1', 90000.0)])
+            restored = temp_db.save_advertisements_bulk([self.make_ad('1', 100000.0)])
+        finally:
+            other.close()
+        
+        assert changed[0].status == 'price_changed'
+        assert restored[0].status == 'price_changed'
+        assert restored[0].old_price == 90000.0
+        assert temp_db.get_advertisement_by_ss_id('1').price == 100000.0
+        history = temp_db.get_price_history(restored[0].advertisement_id)
+        changes = [(entry.old_price, entry.new_price) for entry in history
+                   if entry.change_type == 'price_change']
+        assert changes == [(100000.0, 90000.0), (90000.0, 100000.0)]
+
+class TestCounters:
+    """Test cases for trigger-maintained counters"""
+    
+    def test_counters_follow_writes(self, temp_db):
+        """Test that inserts, deactivation and bulk upserts keep counters exact"""
+        temp_db.save_advertisements_bulk([TestBulkUpsert.make_ad(str(i)) for i in range(5)])
+        temp_db.save_advertisements_bulk([
+            TestBulkUpsert.make_ad('1', price=90000.0), TestBulkUpsert.make_ad('9')
+        ])
+        assert temp_db.get_total_ads_count() == 6
+        
+        with temp_db._get_connection() as conn:
+            conn.execute("UPDATE advertisements SET is_active = 0 WHERE ss_id IN ('1', '2')")
+            conn.execute("DELETE FROM advertisements WHERE ss_id = '3'")
+            conn.commit()
+        assert temp_db.get_total_ads_count() == 3
+        
+        subscription = SubscriptionModel(user_id="1", category="apartment", city="riga", url="u")
+        subscription.id = temp_db.save_subscription(subscription)
+        temp_db.save_subscription(
+            SubscriptionModel(user_id="2", category="apartment", city="riga", url="u")
+        )
+        subscription.is_active = False
+        temp_db.update_subscription(subscription)
+        temp_db.update_subscription(subscription)
+        assert temp_db.get_total_subscriptions_count() == 1
+    
+    def test_counters_seeded_from_existing_rows(self, temp_db):
+        """Test that a database created before the counters gets them from its rows"""
+        temp_db.save_advertisements_bulk([TestBulkUpsert.make_ad(str(i)) for i in range(3)])
+        with temp_db._get_connection() as conn:
+            conn.execute("DROP TABLE counters")
+            for name in ('insert', 'update', 'delete'):
+                conn.execute(f"DROP TRIGGER trg_advertisements_count_{name}")
+            conn.execute("DELETE FROM advertisements WHERE ss_id = '0'")
+            conn.commit()
+        
+        reopened = DatabaseManager(temp_db.db_path)
+        assert reopened.get_total_ads_count() == 2
+        reopened.close()
+
+class TestUserSnapshot:
+    """Test cases for cached per-user status snapshots"""
+    
+    URL = "https://www.ss.lv/lv/real-estate/flats/riga/"
+    
+    def test_snapshot_served_from_memory(self, temp_db):
+        """Test that repeated reads of subscriptions and stats hit the database once"""
+        user_manager = UserManager(temp_db)
+        user_manager.create_user_subscription("1", self.URL)
+        
+        with patch.object(temp_db, 'get_subscriptions',
+                          wraps=temp_db.get_subscriptions) as get_subscriptions:
+            for _ in range(3):
+                assert len(user_manager.get_user_subscriptions("1")) == 1
+                assert user_manager.get_user_stats("1")['total_subscriptions'] == 1
+        assert get_subscriptions.call_count == 1
+    
+    def test_snapshot_invalidated_on_writes(self, temp_db):
+        """Test that subscription writes through any manager drop the snapshot"""
+        user_manager = UserManager(temp_db)
+        other_manager = UserManager(temp_db)
+        user_manager.create_user_subscription("1", self.URL)
+        
+        subscriptions = user_manager.get_user_subscriptions("1")
+        subscriptions[0].frequency = '1d'  # Callers get copies
+        assert user_manager.get_user_stats("1")['frequency'] == '1h'
+        
+        other_manager.update_user_frequency("1", '4h')
+        assert user_manager.get_user_stats("1")['frequency'] == '4h'
+        
+        other_manager.delete_user_subscription("1", subscriptions[0].id)
+        assert user_manager.get_user_subscriptions("1") == []
+        assert user_manager.get_user_stats("1")['total_subscriptions'] == 0
+
 class TestDatabaseModels:
     """Test cases for database models"""
     
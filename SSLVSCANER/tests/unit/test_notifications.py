@@ -0,0 +1,373 @@
+"""
+Unit tests for notification system
+"""
+import time
+import random
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from telegram.error import Forbidden, NetworkError, RetryAfter
+from src.ss_monitor.notifications.delivery import DeliveryPipeline
+from src.ss_monitor.notifications.digest import TELEGRAM_MESSAGE_LIMIT, pack_digest
+from src.ss_monitor.notifications.ledger import NotificationLedger
+from src.ss_monitor.notifications.notification_system import NotificationSystem
+from src.ss_monitor.notifications.subscription_index import SubscriptionIndex
+from src.ss_monitor.database.models import SubscriptionModel
+from src.ss_monitor.parser.models import Advertisement, PriceInfo
+from src.ss_monitor.config import config
+from src.ss_monitor.rate_limiter import TokenBucket
+
+def make_ad(ss_id: str, price=100000.0, area=50.0, rooms=2,
+            property_type='apartment') -> Advertisement:
+    """Create advertisement for tests"""
+    return Advertisement(
+        ss_id=ss_id,
+        title=f"Test Apartment {ss_id}",
+        url=f"https://www.ss.lv/msg/{ss_id}.html",
+        price_info=PriceInfo(price=price, currency='EUR'),
+        area=area,
+        rooms=rooms,
+        property_type=property_type
+    )
+
+def random_bound(rng: random.Random, values):
+    """Random subscription bound, often empty"""
+    return rng.choice([None, 0] + list(values))
+
+def random_subscriptions_and_ads(rng: random.Random):
+    """Random subscriptions and ads covering empty bounds and missing values"""
+    prices = [20000, 50000, 80000, 120000, 200000]
+    areas = [30, 45.5, 60, 90]
+    rooms = [1, 2, 3, 4]
+    
+    subscriptions = [
+        SubscriptionModel(
+            id=i,
+            user_id=str(i),
+            category=rng.choice(['', 'apartment', 'house']),
+            min_price=random_bound(rng, prices),
+            max_price=random_bound(rng, prices),
+            min_area=random_bound(rng, areas),
+            max_area=random_bound(rng, areas),
+            min_rooms=random_bound(rng, rooms),
+            max_rooms=random_bound(rng, rooms)
+        )
+        for i in range(300)
+    ]
+    ads = [
+        make_ad(
+            str(i),
+            price=rng.choice([None, 0.0] + [float(p) for p in prices] + [65000.0]),
+            area=rng.choice([None] + areas + [52.0]),
+            rooms=rng.choice([None] + rooms),
+            property_type=rng.choice(['apartment', 'house', None])
+        )
+        for i in range(200)
+    ]
+    return subscriptions, ads
+
+class TestSubscriptionIndex:
+    """Test cases for indexed subscription matching"""
+    
+    def test_index_matches_linear_scan(self, temp_db):
+        """Test that the index returns exactly what _matches_subscription accepts"""
+        notification_system = NotificationSystem(temp_db)
+        subscriptions, ads = random_subscriptions_and_ads(random.Random(7))
+        
+        index = SubscriptionIndex(subscriptions)
+        for ad in ads:
+            expected = [sub for sub in subscriptions
+                        if notification_system._matches_subscription(ad, sub)]
+            assert index.match(ad) == expected
+    
+    def test_index_keeps_subscription_order(self):
+        """Test that matches come back in subscription order across partitions"""
+        subscriptions = [
+            SubscriptionModel(id=1, user_id='1', category='apartment', max_price=150000),
+            SubscriptionModel(id=2, user_id='2', category=''),
+            SubscriptionModel(id=3, user_id='3', category='house'),
+            SubscriptionModel(id=4, user_id='4', category='apartment', min_rooms=3),
+            SubscriptionModel(id=5, user_id='5', category='apartment', min_price=50000)
+        ]
+        
+        matches = SubscriptionIndex(subscriptions).match(make_ad('1'))
+        
+        assert [sub.id for sub in matches] == [1, 2, 5]
+    
+    def test_empty_index(self):
+        """Test index without subscriptions"""
+        index = SubscriptionIndex([])
+        
+        assert len(index) == 0
+        assert index.match(make_ad('1')) == []
+
+class TestBatchMatcher:
+    """Test cases for vectorized batch matching"""
+    
+    def test_batch_matches_linear_scan(self, temp_db):
+        """Test that the match matrix equals _matches_subscription for every pair"""
+        np = pytest.importorskip('numpy')
+        from src.ss_monitor.notifications.batch_matcher import BatchMatcher
+        
+        notification_system = NotificationSystem(temp_db)
+        subscriptions, ads = random_subscriptions_and_ads(random.Random(11))
+        
+        matrix = BatchMatcher(subscriptions).match_matrix(ads)
+        expected = np.array([
+            [notification_system._matches_subscription(ad, sub) for sub in subscriptions]
+            for ad in ads
+        ])
+        
+        assert matrix.shape == (len(ads), len(subscriptions))
+        assert (matrix == expected).all()
+    
+    def test_large_batches_use_batch_matcher(self, temp_db):
+        """Test that _match_ads switches to batch matching above the threshold"""
+        pytest.importorskip('numpy')
+        
+        notification_system = NotificationSystem(temp_db)
+        subscriptions, ads = random_subscriptions_and_ads(random.Random(3))
+        expected = notification_system._match_ads(ads, subscriptions)
+        
+        with patch.object(config, 'BATCH_MATCH_THRESHOLD', 1), \
+             patch('src.ss_monitor.notifications.batch_matcher.MAX_MATRIX_CELLS', 1000), \
+             patch(f'{NotificationSystem.__module__}.SubscriptionIndex') as mock_index:
+            batch = notification_system._match_ads(ads, subscriptions)
+        
+        mock_index.assert_not_called()
+        assert batch == expected
+
+class RecordingSender:
+    """Send function recording delivered messages, failing with queued errors first"""
+    
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})  # text -> list of exceptions to raise
+        self.sent = []
+    
+    async def __call__(self, chat_id, text):
+        errors = self.errors.get(text)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+class TestDeliveryPipeline:
+    """Test cases for rate-limited notification delivery"""
+    
+    @pytest.mark.asyncio
+    async def test_every_message_is_delivered_in_chat_order(self):
+        """Test that a burst is fully delivered and each chat keeps its order"""
+        sender = RecordingSender()
+        pipeline = DeliveryPipeline(sender, workers=4, global_limiter=TokenBucket(1000, 1000),
+                                    chat_rate=1000)
+        
+        for i in range(200):
+            pipeline.enqueue(i % 10, f"{i % 10}:{i}")
+        await pipeline.join()
+        
+        assert len(sender.sent) == 200
+        assert pipeline.pending == 0
+        for chat in range(10):
+            texts = [text for chat_id, text, _ in sender.sent if chat_id == str(chat)]
+            assert texts == [f"{chat}:{i}" for i in range(chat, 200, 10)]
+        await pipeline.stop()
+    
+    @pytest.mark.asyncio
+    async def test_per_chat_rate_does_not_block_other_chats(self):
+        """Test that messages to one chat are spaced while other chats go through"""
+        sender = RecordingSender()
+        pipeline = DeliveryPipeline(sender, workers=2, global_limiter=TokenBucket(1000, 1000),
+                                    chat_rate=10)
+        
+        for i in range(3):
+            pipeline.enqueue('busy', f"busy {i}")
+        pipeline.enqueue('other', 'other')
+        await pipeline.join()
+        
+        busy = [sent_at for chat_id, _, sent_at in sender.sent if chat_id == 'busy']
+        assert [chat_id for chat_id, _, _ in sender.sent].index('other') < 2
+        assert all(later - earlier >= 0.08 for earlier, later in zip(busy, busy[1:]))
+        await pipeline.stop()
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_and_network_errors_are_retried(self):
+        """Test that flood control pauses delivery and transient errors are retried"""
+        sender = RecordingSender({
+            'flood': [RetryAfter(0)],
+            'flaky': [NetworkError('timed out'), NetworkError('timed out')],
+        })
+        pipeline = DeliveryPipeline(sender, global_limiter=TokenBucket(1000, 1000), chat_rate=1000,
+                                    max_retries=3)
+        
+        with patch('src.ss_monitor.notifications.delivery.RETRY_BACKOFF', 0.01):
+            pipeline.enqueue('1', 'flood')
+            pipeline.enqueue('2', 'flaky')
+            await pipeline.join()
+        
+        assert sorted(text for _, text, _ in sender.sent) == ['flaky', 'flood']
+        assert pipeline.stats == {'delivered': 2, 'retried': 3, 'failed': 0}
+        await pipeline.stop()
+    
+    @pytest.mark.asyncio
+    async def test_permanent_errors_drop_only_that_message(self):
+        """Test that a blocked chat or exhausted retries do not stall the queue"""
+        sender = RecordingSender({
+            'blocked': [Forbidden('bot was blocked by the user')],
+            'down': [NetworkError('down')] * 3,
+        })
+        pipeline = DeliveryPipeline(sender, global_limiter=TokenBucket(1000, 1000), chat_rate=1000,
+                                    max_retries=1)
+        
+        with patch('src.ss_monitor.notifications.delivery.RETRY_BACKOFF', 0.01):
+            for text in ('blocked', 'down', 'after'):
+                pipeline.enqueue('1', text)
+            await pipeline.join()
+        
+        assert [text for _, text, _ in sender.sent] == ['after']
+        assert pipeline.stats['failed'] == 2
+        await pipeline.stop()
+
+class TestOutboxDelivery:
+    """Test cases for outbox-backed notification delivery"""
+    
+    @staticmethod
+    def make_notification_system(db_manager) -> NotificationSystem:
+        """Notification system with a mock bot and unthrottled delivery"""
+        notification_system = NotificationSystem(db_manager, AsyncMock())
+        notification_system.delivery.global_limiter = TokenBucket(1000, 1000)
+        notification_system.delivery.chat_rate = 1000
+        return notification_system
+    
+    @pytest.mark.asyncio
+    async def test_delivered_notifications_are_marked(self, temp_db):
+        """Test that matches go through the outbox and are marked delivered"""
+        notification_system = self.make_notification_system(temp_db)
+        subscriptions = [SubscriptionModel(id=1, user_id='1'), SubscriptionModel(id=2, user_id='2')]
+        
+        result = await notification_system.process_section_ads([make_ad('1')], subscriptions)
+        await notification_system.flush_notifications()
+        
+        assert result['notifications_sent'] == 2
+        assert notification_system.bot.deliver_message.await_count == 2
+        assert temp_db.get_pending_outbox() == []
+    
+    @pytest.mark.asyncio
+    async def test_pending_notifications_are_replayed(self, temp_db):
+        """Test that notifications stored before a crash are delivered after restart"""
+        crashed = self.make_notification_system(temp_db)
+        crashed.outbox.dispatch = lambda messages: 0  # process dies before delivery
+        await crashed.process_section_ads([make_ad('1'), make_ad('2')],
+                                          [SubscriptionModel(id=1, user_id='1')])
+        assert len(temp_db.get_pending_outbox()) == 2
+        
+        restarted = self.make_notification_system(temp_db)
+        assert await restarted.replay_outbox() == 2
+        assert restarted.outbox.replay() == 0  # already queued
+        await restarted.flush_notifications()
+        
+        sent = [call.args for call in restarted.bot.deliver_message.await_args_list]
+        assert [chat_id for chat_id, _ in sent] == ['1', '1']
+        assert 'Test Apartment 1' in sent[0][1] and 'Test Apartment 2' in sent[1][1]
+        assert temp_db.get_pending_outbox() == []
+
+class TestDigest:
+    """Test cases for per-user digest batching"""
+    
+    def test_pack_digest_respects_limits(self):
+        """Test that digests stay under Telegram's limit and the message cap"""
+        texts = [f"{i} " + "x" * 300 for i in range(40)]
+        
+        packed = pack_digest(texts, max_messages=3)
+        
+        assert len(packed) == 3
+        assert all(len(text) <= TELEGRAM_MESSAGE_LIMIT for text, _ in packed)
+        assert sum(covered for _, covered in packed) == 40
+        assert "ещё" in packed[-1][0]
+        assert pack_digest(["x" * 10000], max_messages=1)[0][1] == 1
+        assert len(pack_digest(["x" * 10000], max_messages=1)[0][0]) <= TELEGRAM_MESSAGE_LIMIT
+    
+    @pytest.mark.asyncio
+    async def test_matches_are_combined_per_user(self, temp_db):
+        """Test that one cooldown window yields one message per user"""
+        with patch.object(config, 'NOTIFICATION_DIGEST', True), \
+             patch.object(config, 'NOTIFICATION_COOLDOWN', 0.05):
+            notification_system = TestOutboxDelivery.make_notification_system(temp_db)
+        subscriptions = [SubscriptionModel(id=1, user_id='1'),
+                         SubscriptionModel(id=2, user_id='2', max_price=50000)]
+        
+        await notification_system.process_section_ads([make_ad('1'), make_ad('2')], subscriptions)
+        await notification_system.process_section_ads([make_ad('3', price=40000.0)], subscriptions)
+        assert len(temp_db.get_pending_outbox()) == 4
+        
+        await asyncio.sleep(0.2)
+        await notification_system.delivery.join()
+        
+        deliver_message = notification_system.bot.deliver_message
+        sent = {call.args[0]: call.args[1] for call in deliver_message.await_args_list}
+        assert notification_system.bot.deliver_message.await_count == 2
+        assert all(f"Test Apartment {i}" in sent['1'] for i in range(1, 4))
+        assert "Подборка" not in sent['2']  # a single match is sent as is
+        assert temp_db.get_pending_outbox() == []
+
+class TestNotificationLedger:
+    """Test cases for sent notification deduplication"""
+    
+    @pytest.mark.asyncio
+    async def test_user_gets_each_event_once(self, temp_db):
+        """Test that overlapping subscriptions and repeated events notify once"""
+        notification_system = TestOutboxDelivery.make_notification_system(temp_db)
+        subscriptions = [SubscriptionModel(id=1, user_id='1'),
+                         SubscriptionModel(id=2, user_id='1', max_price=200000)]
+        
+        first = await notification_system.process_section_ads([make_ad('1')], subscriptions)
+        await notification_system.process_section_ads([make_ad('1', price=90000.0)], subscriptions)
+        await notification_system.process_section_ads([make_ad('1', price=100000.0)], subscriptions)
+        repeated = await notification_system.process_section_ads(
+            [make_ad('1', price=90000.0)], subscriptions
+        )
+        
+        assert first['notifications_sent'] == 1
+        assert repeated['price_changes'] == 1
+        assert repeated['notifications_sent'] == 0
+    
+    def test_recent_keys_are_rejected_without_database(self, temp_db):
+        """Test that the LRU front answers repeats"""
+        ledger = NotificationLedger(temp_db, cache_size=10)
+        key = ('1', '100', 'new_ad', 100000.0)
+        
+        assert ledger.claim([key]) == [True]
+        ledger.remember([key])
+        with patch.object(temp_db, 'claim_notifications',
+                          wraps=temp_db.claim_notifications) as claim:
+            assert ledger.claim([key]) == [False]
+        claim.assert_called_once_with([])
+        
+        # A fresh ledger falls back to the table
+        assert NotificationLedger(temp_db).claim([key, key]) == [False, False]
+    
+    def test_claims_roll_back_with_failed_transaction(self, temp_db):
+        """Test that keys claimed in a failed upsert can be claimed again"""
+        ledger = NotificationLedger(temp_db)
+        key = ('1', '100', 'new_ad', 100000.0)
+        
+        with pytest.raises(RuntimeError):
+            with temp_db._get_connection() as conn:
+                conn.execute("INSERT INTO outbox (chat_id, message) VALUES ('1', 'x')")
+                ledger.claim([key])
+                raise RuntimeError("upsert failed")
+        
+        assert ledger.claim([key]) == [True]
+    
+    def test_purge_expired_entries(self, temp_db):
+        """Test that entries past the TTL are deleted and may be sent again"""
+        ledger = NotificationLedger(temp_db)
+        old, recent = ('1', '100', 'new_ad', 1.0), ('1', '200', 'new_ad', 1.0)
+        ledger.claim([old, recent])
+        ledger.remember([old, recent])
+        with temp_db._get_connection() as conn:
+            conn.execute("UPDATE notification_ledger SET created_at = datetime('now', '-2 days') "
+                         "WHERE ss_id = '100'")
+            conn.commit()
+        
+        assert ledger.purge(ttl=86400) == 1
+        assert len(ledger) == 0
+        assert ledger.claim([old, recent]) == [True, False]
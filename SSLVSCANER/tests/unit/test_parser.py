@@ -1,11 +1,58 @@
 """
 Unit tests for SS.lv parser
 """
+import asyncio
 import pytest
+import httpx
 from unittest.mock import Mock, patch
 from bs4 import BeautifulSoup
-from src.ss_monitor.parser.ss_parser import SSParser
+from src.ss_monitor.parser.ss_parser import SSParser, SectionFetchError
 from src.ss_monitor.parser.models import Advertisement, PriceInfo
+from src.ss_monitor.parser.async_fetcher import AsyncFetcher
+from src.ss_monitor.parser.backends import extract_page_title, extract_rows_bs4, extract_rows_lxml
+from src.ss_monitor.parser.page_cache import PageCache, listing_fingerprint
+from src.ss_monitor.parser.preview import SectionPreviewCache
+from src.ss_monitor.parser.parse_pool import extract_listing_rows_async, shutdown_parse_pool
+from src.ss_monitor.config import config
+from src.ss_monitor.rate_limiter import TokenBucket
+
+LISTING_HTML = """
+<html>
+    <head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8"></head>
+    <body>
+        <table id="page_main">
+            <tr id="head_line"><td class="msg_column">Sludinājumi</td></tr>
+            <tr id="tr_bnr_712"><td class="msga2-o">Banner</td></tr>
+            <tr id="tr_54321">
+                <td class="msga2 pp0"><a href="/msg/lv/real-estate/flats/riga/centre/abc.html"
+                    ><img class="isfoto" src="https://i.ss.lv/images/abc.th2.jpg"></a></td>
+                <td class="msg2"><a class="am" id="dm_54321"
+                    href="/msg/lv/real-estate/flats/riga/centre/abc.html"
+                    >Dzīvoklis <b>centrā</b>, 3 istabas</a></td>
+                <td class="msga2-o pp6">centrs<br>Tērbatas 14</td>
+                <td class="msga2-o pp6">3</td>
+                <td class="msga2-o pp6">72.5</td>
+                <td class="msga2-o pp6">4/6</td>
+                <td class="msga2-o pp6">Specpr.</td>
+                <td class="msga2-o pp6">145&nbsp;000&nbsp;€</td>
+            </tr>
+            <tr id="tr_54322">
+                <td class="msg2"><a class="am"
+                    href="/msg/lv/real-estate/homes-summer-residences/riga/xyz.html"
+                    >Māja <!-- promo -->Imantā</a></td>
+                <td class="msga2-o pp6">Imanta</td>
+                <td class="msga2-o pp6">-</td>
+                <td class="msga2-o pp6">210</td>
+                <td class="msga2-o pp6">2</td>
+                <td class="msga2-o pp6">850 €/mēn.</td>
+            </tr>
+            <tr id="tr_54323">
+                <td class="msga2-o pp6">No title link</td>
+            </tr>
+        </table>
+    </body>
+</html>
+"""
 
 class TestSSParser:
     """Test cases for SSParser"""
@@ -73,15 +120,13 @@ class TestSSParser:
         result = parser._parse_advertisement(ad_row, "https://www.ss.lv")
         assert result is None
     
-    @patch('src.ss_monitor.parser.ss_parser.SSParser._make_request')
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
     def test_get_real_estate_ads_success(self, mock_request, sample_html):
         """Test successful real estate ads fetching"""
         parser = SSParser()
         
         # Mock response
-        mock_response = Mock()
-        mock_response.content = sample_html.encode()
-        mock_request.return_value = mock_response
+        mock_request.return_value = httpx.Response(200, content=sample_html.encode())
         
         # Test fetching
         ads = parser.get_real_estate_ads('apartment', 'riga', 1)
@@ -90,7 +135,7 @@ class TestSSParser:
         assert ads[0].ss_id == "12345678"
         assert ads[0].title == "Test Apartment"
     
-    @patch('src.ss_monitor.parser.ss_parser.SSParser._make_request')
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
     def test_get_real_estate_ads_failure(self, mock_request):
         """Test real estate ads fetching with network failure"""
         parser = SSParser()
@@ -101,6 +146,47 @@ class TestSSParser:
         ads = parser.get_real_estate_ads('apartment', 'riga', 1)
         assert len(ads) == 0
     
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
+    def test_get_real_estate_ads_incremental_stops_on_known_page(self, mock_request, sample_html):
+        """Test that incremental mode stops after a page of known ads"""
+        parser = SSParser()
+        mock_request.return_value = httpx.Response(200, content=sample_html.encode())
+        
+        ads = parser.get_real_estate_ads('https://www.ss.lv/lv/real-estate/flats/riga/',
+                                         max_pages=3, known_ads={'12345678': 100000.0})
+        
+        assert len(ads) == 1
+        assert mock_request.call_count == 1
+    
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
+    def test_get_real_estate_ads_incremental_continues_on_change(self, mock_request, sample_html):
+        """Test that price changes and unknown ads keep paging"""
+        parser = SSParser()
+        mock_request.return_value = httpx.Response(200, content=sample_html.encode())
+        
+        parser.get_real_estate_ads('https://www.ss.lv/lv/real-estate/flats/riga/', max_pages=3,
+                                   known_ads={'12345678': 90000.0})
+        assert mock_request.call_count == 3
+        
+        mock_request.reset_mock()
+        parser.get_real_estate_ads('https://www.ss.lv/lv/real-estate/flats/riga/', max_pages=3,
+                                   known_ads={'87654321'})
+        assert mock_request.call_count == 3
+    
+    @patch('src.ss_monitor.parser.async_fetcher.AsyncFetcher.fetch')
+    def test_iter_real_estate_ads_is_lazy(self, mock_request, sample_html):
+        """Test that pages are fetched only when the consumer asks for them"""
+        parser = SSParser()
+        mock_request.return_value = httpx.Response(200, content=sample_html.encode())
+        
+        stream = parser.iter_real_estate_ads('https://www.ss.lv/lv/real-estate/flats/riga/',
+                                             max_pages=3)
+        assert mock_request.call_count == 0
+        
+        first_page = next(stream)
+        assert len(first_page) == 1
+        assert mock_request.call_count == 1
+    
     def test_get_real_estate_ads_invalid_category(self):
         """Test fetching with invalid category"""
         parser = SSParser()
@@ -115,6 +201,403 @@ class TestSSParser:
         ads = parser.get_real_estate_ads('apartment', 'invalid_city', 1)
         assert len(ads) == 0
 
+class TestParserBackends:
+    """Test cases for BeautifulSoup and lxml parser backends"""
+    
+    def test_backends_extract_identical_rows(self):
+        """Test that both backends extract the same raw rows"""
+        content = LISTING_HTML.encode('utf-8')
+        
+        bs4_rows = extract_rows_bs4(content)
+        lxml_rows = extract_rows_lxml(content)
+        
+        assert len(lxml_rows) == 2
+        assert lxml_rows == bs4_rows
+        assert lxml_rows[0].title == "Dzīvokliscentrā, 3 istabas"
+        assert lxml_rows[1].title == "MājaImantā"
+    
+    @pytest.mark.parametrize('html', [LISTING_HTML, None])
+    def test_backends_build_identical_ads(self, html, sample_html):
+        """Test that both backends produce identical Advertisement objects"""
+        content = (html or sample_html).encode('utf-8')
+        
+        bs4_ads = SSParser(backend='bs4')._parse_listing_page(content, 1)
+        lxml_ads = SSParser(backend='lxml')._parse_listing_page(content, 1)
+        
+        assert len(lxml_ads) > 0
+        assert lxml_ads == bs4_ads
+    
+    def test_lxml_backend_fields(self):
+        """Test fields parsed through the lxml backend"""
+        ads = SSParser(backend='lxml')._parse_listing_page(LISTING_HTML.encode('utf-8'), 1)
+        
+        assert ads[0].ss_id == "54321"
+        assert ads[0].url == "https://www.ss.lv/msg/lv/real-estate/flats/riga/centre/abc.html"
+        assert ads[0].location == "centrsTērbatas 14"
+        assert ads[0].rooms == 3
+        assert ads[0].area == 72.5
+        assert (ads[0].floor, ads[0].total_floors) == (4, 6)
+        assert ads[0].price_info.price == 145000.0
+        assert ads[0].image_url == "https://i.ss.lv/images/abc.th2.jpg"
+        assert ads[1].price_info.is_monthly
+    
+    def test_no_main_table(self):
+        """Test page without listing table"""
+        assert extract_rows_lxml(b"<html><body><p>Nothing</p></body></html>") is None
+        assert extract_rows_bs4(b"<html><body><p>Nothing</p></body></html>") is None
+        assert extract_rows_lxml(b"") is None
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('workers', [0, 2])
+    async def test_process_pool_matches_in_process(self, workers, sample_html):
+        """Test that rows parsed in worker processes equal in-process parsing"""
+        content = sample_html.encode('utf-8')
+        
+        with patch.object(config, 'PARSER_WORKERS', workers):
+            try:
+                rows = await extract_listing_rows_async(content, 'lxml')
+                pool_ads = await SSParser(backend='lxml')._parse_listing_page_async(content, 1)
+            finally:
+                shutdown_parse_pool()
+        
+        assert rows == extract_rows_lxml(content)
+        assert pool_ads == SSParser(backend='lxml')._parse_listing_page(content, 1)
+    
+    def test_page_title(self):
+        """Test title extraction with page encoding and entities"""
+        page = ('<html><head><meta charset="windows-1257">'
+                '<TITLE>\n SS.LV &ndash; Dzīvokļi </TITLE></head></html>')
+        
+        assert extract_page_title(page.encode('windows-1257')) == 'SS.LV – Dzīvokļi'
+        assert extract_page_title(page) == 'SS.LV – Dzīvokļi'
+        assert extract_page_title(b'<html><head><title> </title></head></html>') is None
+        assert extract_page_title(LISTING_HTML.encode()) is None
+    
+    def test_invalid_backend(self):
+        """Test that unknown backend is rejected"""
+        with pytest.raises(ValueError):
+            SSParser(backend='regex')
+
+class TestPageCache:
+    """Test cases for listing page cache"""
+    
+    def test_fingerprint_ignores_content_outside_table(self):
+        """Test that only the listing table affects the fingerprint"""
+        page = LISTING_HTML.encode()
+        changed_outside = page.replace(b'<body>', b'<body><div>Banner 42</div>')
+        reformatted = page.replace(b'\n', b'\n    ')
+        changed_inside = page.replace(b'145&nbsp;000', b'139&nbsp;000')
+        
+        assert listing_fingerprint(page) is not None
+        assert listing_fingerprint(changed_outside) == listing_fingerprint(page)
+        assert listing_fingerprint(reformatted) == listing_fingerprint(page)
+        assert listing_fingerprint(changed_inside) != listing_fingerprint(page)
+        assert listing_fingerprint(b'<html><body></body></html>') is None
+    
+    def test_lru_eviction_and_ttl(self):
+        """Test least recently used eviction and expiry"""
+        cache = PageCache(max_size=2, ttl=60)
+        cache.store('a', [], 'fa')
+        cache.store('b', [], 'fb')
+        cache.get('a')
+        cache.store('c', [], 'fc')
+        
+        assert cache.get('b') is None
+        assert cache.get('a').fingerprint == 'fa'
+        
+        cache.ttl = -1
+        assert cache.get('a') is None
+    
+    @pytest.mark.asyncio
+    async def test_conditional_get_skips_parsing(self):
+        """Test that 304 and unchanged pages reuse the cached advertisements"""
+        requests_seen = []
+        responses = [
+            httpx.Response(200, content=LISTING_HTML.encode(), headers={'ETag': '"v1"'}),
+            httpx.Response(304),
+            httpx.Response(200, content=LISTING_HTML.replace('<body>', '<body>x').encode()),
+        ]
+        
+        def handler(request):
+            requests_seen.append(request)
+            return responses[len(requests_seen) - 1]
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher, page_cache=PageCache(max_size=10, ttl=60))
+        url = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+        
+        first = await parser.get_real_estate_ads_async(url, max_pages=1)
+        with patch.object(parser, '_parse_listing_page_async') as mock_parse:
+            second = await parser.get_real_estate_ads_async(url, max_pages=1)
+            third = await parser.get_real_estate_ads_async(url, max_pages=1)
+        await fetcher.close()
+        
+        mock_parse.assert_not_called()
+        assert len(first) == 2
+        assert second == first
+        assert third == first
+        assert 'if-none-match' not in requests_seen[0].headers
+        assert requests_seen[1].headers['if-none-match'] == '"v1"'
+        assert parser.page_cache.get_stats() == {
+            'size': 1, 'hits': 2, 'not_modified': 1, 'misses': 1, 'hit_rate': 2 / 3
+        }
+
+class TestSectionPreview:
+    """Test cases for bot section previews"""
+    
+    @staticmethod
+    def make_cache(handler, **options) -> SectionPreviewCache:
+        """Preview cache over a parser with a mocked transport"""
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher, page_cache=PageCache(max_size=10, ttl=60))
+        return SectionPreviewCache(parser, **options)
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_previews_share_one_fetch(self):
+        """Test that users adding the same section at once trigger a single request"""
+        requested_urls = []
+        title = '<head><title>SS.LV - Dzīvokļi - Rīga</title>'
+        page = LISTING_HTML.replace('<head>', title).encode()
+        
+        def handler(request):
+            requested_urls.append(str(request.url))
+            return httpx.Response(200, content=page)
+        
+        cache = self.make_cache(handler)
+        previews = await asyncio.gather(
+            cache.get('https://www.ss.lv/lv/real-estate/flats/riga/'),
+            cache.get('https://www.ss.lv/lv/real-estate/flats/riga/all/sell/'),
+            cache.get('https://www.ss.lv/lv/real-estate/flats/riga'),
+        )
+        again = await cache.get('https://www.ss.lv/lv/real-estate/flats/riga/')
+        assert requested_urls == ['https://www.ss.lv/lv/real-estate/flats/riga/all/sell/']
+        
+        refreshed = await cache.get('https://www.ss.lv/lv/real-estate/flats/riga/', refresh=True)
+        await cache.parser.fetcher.close()
+        
+        assert all(preview is previews[0] for preview in previews + [again])
+        assert [ad.ss_id for ad in again.ads] == ['54321', '54322']
+        assert refreshed is not again and refreshed.fetch_seconds > 0
+        assert cache.stats == {'hits': 1, 'shared': 2, 'fetches': 2}
+        assert cache.display_name('https://www.ss.lv/lv/real-estate/flats/riga/') == 'Dzīvokļi'
+    
+    @pytest.mark.asyncio
+    async def test_failed_and_expired_previews_are_refetched(self):
+        """Test that failures are not cached and previews expire after the TTL"""
+        responses = [
+            httpx.Response(404), httpx.Response(404),
+            httpx.Response(200, content=LISTING_HTML.encode())
+        ]
+        
+        def handler(request):
+            return responses.pop(0) if responses else httpx.Response(200, content=b'<html></html>')
+        
+        cache = self.make_cache(handler, ttl=60)
+        url = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+        
+        # Sale listings fail, then the URL as given
+        assert (await cache.get(url)).ads == []
+        assert len((await cache.get(url)).ads) == 2
+        
+        cache.ttl = -1
+        assert (await cache.get(url)).ads == []
+        await cache.parser.fetcher.close()
+        assert cache.stats['fetches'] == 3
+    
+    @pytest.mark.asyncio
+    async def test_display_names_are_warmed_in_background(self):
+        """Test that warming names does not block and skips failing sections until the TTL"""
+        requested_paths = []
+        title = '<head><title>SS.LV - Dzīvokļi - Rīga</title>'
+        page = LISTING_HTML.replace('<head>', title).encode()
+        
+        def handler(request):
+            requested_paths.append(request.url.path)
+            if 'plots' in request.url.path:
+                return httpx.Response(404)
+            return httpx.Response(200, content=page)
+        
+        cache = self.make_cache(handler, ttl=60)
+        flats = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+        plots = 'https://www.ss.lv/lv/real-estate/plots-and-lands/riga/'
+        
+        task = cache.warm_display_names([flats, plots])
+        assert cache.display_name(flats) is None and not requested_paths
+        await task
+        
+        assert cache.display_name(flats) == 'Dzīvokļi'
+        assert cache.display_name(plots) is None
+        failed_requests = len(requested_paths)
+        
+        # Named sections and recently failed ones are not fetched again
+        assert cache.warm_display_names([flats, plots]) is None
+        cache.ttl = -1
+        await cache.warm_display_names([flats, plots])
+        await cache.parser.fetcher.close()
+        assert len(requested_paths) == failed_requests + 2
+
+class TestAsyncSSParser:
+    """Test cases for the async fetch engine"""
+    
+    @pytest.mark.asyncio
+    async def test_get_real_estate_ads_async_success(self, sample_html):
+        """Test fetching ads through the async fetcher"""
+        requested_urls = []
+        
+        def handler(request):
+            requested_urls.append(str(request.url))
+            return httpx.Response(200, content=sample_html.encode())
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher)
+        
+        flats = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+        ads = await parser.get_real_estate_ads_async(flats, max_pages=2)
+        await fetcher.close()
+        
+        assert len(ads) == 2
+        assert ads[0].ss_id == "12345678"
+        assert sorted(requested_urls) == [
+            'https://www.ss.lv/lv/real-estate/flats/riga/all/sell/',
+            'https://www.ss.lv/lv/real-estate/flats/riga/all/sell/?page=2'
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_get_real_estate_ads_async_incremental(self, sample_html):
+        """Test that async incremental mode fetches only until a known page"""
+        requested_urls = []
+        
+        def handler(request):
+            requested_urls.append(str(request.url))
+            return httpx.Response(200, content=sample_html.encode())
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher)
+        
+        ads = await parser.get_real_estate_ads_async('https://www.ss.lv/lv/real-estate/flats/riga/',
+                                                     max_pages=3, known_ads={'12345678'})
+        await fetcher.close()
+        
+        assert len(ads) == 1
+        assert requested_urls == ['https://www.ss.lv/lv/real-estate/flats/riga/all/sell/']
+    
+    @pytest.mark.asyncio
+    async def test_aiter_real_estate_ads_yields_pages_in_order(self, sample_html):
+        """Test that pages are streamed in page order and unread pages are cancelled"""
+        def handler(request):
+            return httpx.Response(200, content=sample_html.encode())
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher)
+        pages = []
+        
+        with patch.object(parser, '_fetch_page_async',
+                          wraps=parser._fetch_page_async) as mock_fetch:
+            stream = parser.aiter_real_estate_ads('https://www.ss.lv/lv/real-estate/flats/riga/',
+                                                  max_pages=3)
+            async for page_ads in stream:
+                pages.append(page_ads)
+                break
+            await stream.aclose()
+        await fetcher.close()
+        
+        assert len(pages) == 1
+        assert len(pages[0]) == 1
+        assert [call.args[1] for call in mock_fetch.call_args_list] == [1, 2, 3]
+    
+    @pytest.mark.asyncio
+    async def test_failed_pages_are_skipped_and_outage_raises(self, sample_html):
+        """Test that a failed page is skipped and a section with no fetched page raises"""
+        def handler(request):
+            if request.url.params.get('page') == '2' or 'houses' in request.url.path:
+                return httpx.Response(404)
+            return httpx.Response(200, content=sample_html.encode())
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        parser = SSParser(fetcher=fetcher)
+        
+        flats = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+        pages = [page async for page in parser.aiter_real_estate_ads(flats, max_pages=3)]
+        with pytest.raises(SectionFetchError):
+            await parser.get_real_estate_ads_async('https://www.ss.lv/lv/real-estate/houses/riga/',
+                                                   max_pages=2)
+        await fetcher.close()
+        
+        assert len(pages) == 2
+    
+    @pytest.mark.asyncio
+    async def test_fetcher_per_host_limit(self):
+        """Test that concurrent requests to one host are bounded"""
+        active = 0
+        max_active = 0
+        
+        async def handler(request):
+            nonlocal active, max_active
+            active += 1
+            max_active = max(max_active, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return httpx.Response(200, content=b"ok")
+        
+        fetcher = AsyncFetcher(max_per_host=2, rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        responses = await asyncio.gather(*[
+            fetcher.fetch(f"https://www.ss.lv/page{i}") for i in range(6)
+        ])
+        await fetcher.close()
+        
+        assert all(response is not None for response in responses)
+        assert max_active == 2
+    
+    @pytest.mark.asyncio
+    async def test_fetcher_retries_transient_errors(self):
+        """Test that retryable status codes are retried"""
+        statuses = [503, 200]
+        
+        def handler(request):
+            return httpx.Response(statuses.pop(0), content=b"ok")
+        
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(handler))
+        with patch('src.ss_monitor.parser.async_fetcher.BACKOFF_FACTOR', 0):
+            response = await fetcher.fetch("https://www.ss.lv/page")
+        await fetcher.close()
+        
+        assert response is not None
+        assert response.status_code == 200
+    
+    @pytest.mark.asyncio
+    async def test_fetcher_acquires_rate_limiter(self):
+        """Test that every request takes a token from the rate limiter"""
+        rate_limiter = Mock(wraps=TokenBucket(1000, 100))
+        rate_limiter.acquire_async = Mock(wraps=rate_limiter.acquire_async)
+        fetcher = AsyncFetcher(rate_limiter=rate_limiter, transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=b"ok")
+        ))
+        
+        await asyncio.gather(*[fetcher.fetch(f"https://www.ss.lv/page{i}") for i in range(3)])
+        await fetcher.close()
+        
+        assert rate_limiter.acquire_async.call_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_fetcher_failure_returns_none(self):
+        """Test that permanent errors return None"""
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100), transport=httpx.MockTransport(
+            lambda request: httpx.Response(404)
+        ))
+        
+        response = await fetcher.fetch("https://www.ss.lv/missing")
+        await fetcher.close()
+        
+        assert response is None
+
 class TestPriceInfo:
     """Test cases for PriceInfo model"""
     
@@ -0,0 +1,73 @@
+"""
+Unit tests for the token bucket rate limiter
+"""
+import time
+import pytest
+from src.ss_monitor.rate_limiter import TokenBucket, get_host_limiter, parse_retry_after
+
+class TestTokenBucket:
+    """Test cases for TokenBucket"""
+    
+    def test_burst_is_available_immediately(self):
+        """Test that burst tokens do not wait"""
+        bucket = TokenBucket(rate=1.0, burst=3)
+        
+        assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    
+    def test_waits_after_burst(self):
+        """Test that tokens beyond burst are paced by rate"""
+        bucket = TokenBucket(rate=10.0, burst=1)
+        
+        assert bucket._reserve() == 0.0
+        assert bucket._reserve() == pytest.approx(0.1, abs=0.01)
+        assert bucket._reserve() == pytest.approx(0.2, abs=0.01)
+    
+    def test_acquire_paces_calls(self):
+        """Test that blocking acquire respects the rate"""
+        bucket = TokenBucket(rate=50.0, burst=1)
+        
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        
+        assert time.monotonic() - start >= 0.05
+    
+    @pytest.mark.asyncio
+    async def test_acquire_async_paces_calls(self):
+        """Test that async acquire respects the rate"""
+        bucket = TokenBucket(rate=50.0, burst=1)
+        
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire_async()
+        
+        assert time.monotonic() - start >= 0.05
+    
+    def test_pause(self):
+        """Test that pause holds back the next caller"""
+        bucket = TokenBucket(rate=10.0, burst=5)
+        bucket.pause(2.0)
+        
+        assert bucket._reserve() == pytest.approx(2.1, abs=0.01)
+    
+    def test_invalid_rate(self):
+        """Test that rate must be positive"""
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+class TestHostLimiter:
+    """Test cases for the shared host limiter registry"""
+    
+    def test_same_host_shares_limiter(self):
+        """Test that all URLs of one host share one bucket"""
+        limiter1 = get_host_limiter("https://www.ss.lv/lv/real-estate/flats/riga/")
+        limiter2 = get_host_limiter("https://WWW.SS.LV/lv/real-estate/homes-summer-residences/")
+        
+        assert limiter1 is limiter2
+        assert limiter1 is not get_host_limiter("https://example.com/")
+    
+    def test_parse_retry_after(self):
+        """Test Retry-After parsing"""
+        assert parse_retry_after("5", 1.0) == 5.0
+        assert parse_retry_after(None, 1.0) == 1.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 1.0) == 1.0
@@ -0,0 +1,336 @@
+"""
+Unit tests for background scheduler
+"""
+import asyncio
+import pytest
+import httpx
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+from src.ss_monitor.config import config
+from src.ss_monitor.scheduler.background_scheduler import BackgroundScheduler
+from src.ss_monitor.database.models import SubscriptionModel, ScanStateModel
+from src.ss_monitor.parser.models import Advertisement, PriceInfo
+from src.ss_monitor.parser.ss_parser import SSParser, normalize_section_url
+from src.ss_monitor.parser.async_fetcher import AsyncFetcher
+from src.ss_monitor.rate_limiter import TokenBucket
+
+RIGA_FLATS = 'https://www.ss.lv/lv/real-estate/flats/riga/'
+
+def make_subscription(user_id: str, url: str = RIGA_FLATS,
+                      frequency: str = '1h') -> SubscriptionModel:
+    """Create subscription for tests"""
+    return SubscriptionModel(user_id=user_id, category='apartment', city='riga', url=url,
+                             frequency=frequency)
+
+def make_ad(ss_id: str, price: float = 100000.0) -> Advertisement:
+    """Create advertisement for tests"""
+    return Advertisement(
+        ss_id=ss_id,
+        title=f"Test Apartment {ss_id}",
+        url=f"https://www.ss.lv/msg/{ss_id}.html",
+        price_info=PriceInfo(price=price, currency='EUR'),
+        property_type='apartment'
+    )
+
+def stream_pages(*pages):
+    """Mock for aiter_real_estate_ads yielding the given pages"""
+    async def pages_iterator(*args, **kwargs):
+        for page_ads in pages:
+            yield page_ads
+    return Mock(side_effect=pages_iterator)
+
+class TestScanPlan:
+    """Test cases for deduplicated scan planning"""
+    
+    def test_normalize_section_url(self):
+        """Test that URL variants of one section normalize to one URL"""
+        expected = 'https://www.ss.lv/lv/real-estate/flats/riga/all/sell/'
+        
+        assert normalize_section_url('https://www.ss.lv/lv/real-estate/flats/riga/') == expected
+        assert normalize_section_url('https://www.ss.lv/lv/real-estate/flats/riga') == expected
+        assert normalize_section_url('https://WWW.SS.LV/lv/real-estate/flats/riga/all/') == expected
+        assert normalize_section_url(
+            'https://www.ss.lv/lv/real-estate/flats/riga/all/sell/'
+        ) == expected
+        assert normalize_section_url(
+            ' https://www.ss.lv/lv/real-estate/flats/riga/?page=2 '
+        ) == expected
+    
+    def test_build_scan_plan_collapses_subscribers(self, temp_db):
+        """Test that many subscribers of one section give one target URL"""
+        scheduler = BackgroundScheduler(temp_db)
+        subscriptions = [make_subscription(str(i)) for i in range(50)]
+        subscriptions.append(make_subscription('50', RIGA_FLATS.rstrip('/')))
+        subscriptions.append(make_subscription(
+            '51', 'https://www.ss.lv/lv/real-estate/homes-summer-residences/riga/'
+        ))
+        
+        plan = scheduler._build_scan_plan(subscriptions)
+        
+        assert len(plan) == 2
+        assert len(plan[normalize_section_url(RIGA_FLATS)]) == 51
+    
+    @pytest.mark.asyncio
+    async def test_execute_scan_plan_fetches_each_section_once(self, temp_db):
+        """Test that each section is fetched once and fanned out to all subscribers"""
+        scheduler = BackgroundScheduler(temp_db)
+        ads = [make_ad('1'), make_ad('2')]
+        scheduler.parser.aiter_real_estate_ads = stream_pages(ads)
+        scheduler.notification_system.process_section_ads = AsyncMock(return_value={})
+        subscriptions = [make_subscription(str(i)) for i in range(5)]
+        
+        await scheduler._execute_scan_plan(scheduler._build_scan_plan(subscriptions))
+        
+        scheduler.parser.aiter_real_estate_ads.assert_called_once()
+        process_section_ads = scheduler.notification_system.process_section_ads
+        process_section_ads.assert_awaited_once_with(ads, subscriptions)
+    
+    @pytest.mark.asyncio
+    async def test_pages_are_processed_as_they_arrive(self, temp_db):
+        """Test that every non-empty page is processed separately"""
+        scheduler = BackgroundScheduler(temp_db)
+        first_page, second_page = [make_ad('1'), make_ad('2')], [make_ad('3')]
+        scheduler.parser.aiter_real_estate_ads = stream_pages(first_page, [], second_page)
+        scheduler.notification_system.process_section_ads = AsyncMock(return_value={})
+        subscriptions = [make_subscription('1')]
+        
+        scanned = await scheduler._scan_section(normalize_section_url(RIGA_FLATS), subscriptions)
+        
+        assert scanned == 3
+        process_section_ads = scheduler.notification_system.process_section_ads
+        assert [call.args[0] for call in process_section_ads.await_args_list] == [
+            first_page, second_page
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_section_ads_notify_every_subscriber(self, temp_db):
+        """Test that ads of a section are saved once and sent to each subscriber"""
+        bot = AsyncMock()
+        scheduler = BackgroundScheduler(temp_db, bot)
+        scheduler.parser.aiter_real_estate_ads = stream_pages([make_ad('1'), make_ad('2')])
+        subscriptions = [make_subscription(str(i)) for i in range(3)]
+        
+        await scheduler._execute_scan_plan(scheduler._build_scan_plan(subscriptions))
+        await scheduler.notification_system.flush_notifications()
+        
+        assert temp_db.get_total_ads_count() == 2
+        assert bot.deliver_message.await_count == 6
+
+class TestIncrementalScan:
+    """Test cases for incremental section scans"""
+    
+    @pytest.mark.asyncio
+    async def test_scan_section_passes_section_watermark(self, temp_db):
+        """Test that the second scan of a section passes known ads to the parser"""
+        scheduler = BackgroundScheduler(temp_db)
+        url = normalize_section_url(RIGA_FLATS)
+        scheduler.parser.aiter_real_estate_ads = stream_pages([make_ad('1'), make_ad('2', 50000.0)])
+        scheduler.notification_system.process_section_ads = AsyncMock(return_value={})
+        
+        await scheduler._scan_section(url, [make_subscription('1')])
+        assert scheduler.parser.aiter_real_estate_ads.call_args.kwargs['known_ads'] is None
+        
+        await scheduler._scan_section(url, [make_subscription('1')])
+        assert scheduler.parser.aiter_real_estate_ads.call_args.kwargs['known_ads'] == {
+            '1': 100000.0,
+            '2': 50000.0
+        }
+    
+    def test_watermark_keeps_older_ads(self, temp_db):
+        """Test that an early-stopped scan does not forget older ads"""
+        scheduler = BackgroundScheduler(temp_db)
+        scheduler._update_section_watermark(RIGA_FLATS, {'1': 100000.0, '2': 100000.0})
+        scheduler._update_section_watermark(RIGA_FLATS, {'3': 100000.0, '1': 90000.0})
+        
+        watermark = scheduler.section_watermarks[RIGA_FLATS]
+        assert list(watermark) == ['3', '1', '2']
+        assert watermark['1'] == 90000.0
+
+class TestDueQueue:
+    """Test cases for due-time ordered section scanning"""
+    
+    HOUSES = 'https://www.ss.lv/lv/real-estate/homes-summer-residences/riga/'
+    
+    @staticmethod
+    def make_scheduler(db_manager, subscriptions) -> BackgroundScheduler:
+        """Scheduler over stored subscriptions with a mocked parser"""
+        for subscription in subscriptions:
+            db_manager.save_subscription(subscription)
+        scheduler = BackgroundScheduler(db_manager)
+        scheduler.parser.aiter_real_estate_ads = stream_pages([make_ad('1')])
+        scheduler.notification_system.process_section_ads = AsyncMock(return_value={})
+        return scheduler
+    
+    @pytest.mark.asyncio
+    async def test_only_due_sections_are_scanned(self, temp_db):
+        """Test that a section is scanned once per interval of its most frequent subscriber"""
+        scheduler = self.make_scheduler(temp_db, [
+            make_subscription('1', frequency='4h'),
+            make_subscription('2', frequency='1h'),
+            make_subscription('3', url=self.HOUSES, frequency='1d'),
+        ])
+        
+        await scheduler._scan_due_sections()
+        await scheduler._scan_due_sections()
+        assert scheduler.parser.aiter_real_estate_ads.call_count == 2
+        
+        plan = scheduler._build_scan_plan(temp_db.get_subscriptions())
+        flats, houses = normalize_section_url(RIGA_FLATS), normalize_section_url(self.HOUSES)
+        now = datetime.now()
+        assert scheduler._pop_due_sections(plan, now + timedelta(minutes=59)) == {}
+        assert list(scheduler._pop_due_sections(plan, now + timedelta(minutes=61))) == [flats]
+        assert list(scheduler._pop_due_sections(plan, now + timedelta(days=1, minutes=1))) == [
+            houses
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_scan_state_survives_restart(self, temp_db):
+        """Test that a restarted scheduler does not rescan sections that are not due"""
+        scheduler = self.make_scheduler(temp_db, [make_subscription('1')])
+        await scheduler._scan_due_sections()
+        
+        restarted = self.make_scheduler(temp_db, [])
+        await restarted._scan_due_sections()
+        
+        restarted.parser.aiter_real_estate_ads.assert_not_called()
+        state = restarted.scan_states[normalize_section_url(RIGA_FLATS)]
+        assert state.consecutive_failures == 0
+        assert state.last_result_hash
+        assert state.next_due_at - state.last_scan_at == timedelta(hours=1)
+    
+    @pytest.mark.asyncio
+    async def test_failed_scan_is_retried_early(self, temp_db):
+        """Test that failures are retried before the regular interval, with backoff"""
+        scheduler = self.make_scheduler(temp_db, [make_subscription('1', frequency='1d')])
+        # Site down: every page answers 503 through the real fetch and parse path
+        fetcher = AsyncFetcher(rate_limiter=TokenBucket(1000, 100),
+                               transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+        scheduler.parser = SSParser(fetcher=fetcher)
+        
+        with patch('src.ss_monitor.parser.async_fetcher.BACKOFF_FACTOR', 0):
+            await scheduler._scan_due_sections()
+        await fetcher.close()
+        
+        state = scheduler.scan_states[normalize_section_url(RIGA_FLATS)]
+        assert state.consecutive_failures == 1
+        assert state.last_scan_at is None and state.last_result_hash is None
+        assert state.churn_rate == 0
+        assert state.next_due_at - datetime.now() < timedelta(minutes=6)
+        scheduler.notification_system.process_section_ads.assert_not_called()
+        
+        scheduler._record_scan(state.section_url, [make_subscription('1', frequency='1d')], {},
+                               failed=True)
+        assert state.consecutive_failures == 2
+        assert timedelta(minutes=9) < state.next_due_at - datetime.now() < timedelta(minutes=11)
+    
+    @pytest.mark.asyncio
+    async def test_shorter_frequency_reschedules_section(self, temp_db):
+        """Test that switching to a shorter frequency moves the next scan forward"""
+        scheduler = self.make_scheduler(temp_db, [make_subscription('1', frequency='1d')])
+        await scheduler._scan_due_sections()
+        
+        plan = scheduler._build_scan_plan([make_subscription('1', frequency='1h')])
+        scheduler._refresh_due_queue(plan)
+        
+        assert list(scheduler._pop_due_sections(plan, datetime.now() + timedelta(minutes=61))) == [
+            normalize_section_url(RIGA_FLATS)
+        ]
+
+class TestAdaptiveInterval:
+    """Test cases for churn-driven scan intervals"""
+    
+    def test_busy_section_is_polled_more_often(self, temp_db):
+        """Test that observed changes shorten the interval down to the floor"""
+        scheduler = BackgroundScheduler(temp_db)
+        subscriptions = [make_subscription('1', frequency='4h')]
+        url = normalize_section_url(RIGA_FLATS)
+        
+        # First scan only sets the baseline
+        scheduler._record_scan(url, subscriptions, {'1': 1.0}, failed=False, events=50)
+        state = scheduler.scan_states[url]
+        assert state.churn_rate == 0
+        assert state.next_due_at - state.last_scan_at == timedelta(hours=4)
+        
+        state.last_scan_at -= timedelta(hours=1)
+        scheduler._record_scan(url, subscriptions, {'1': 1.0}, failed=False, events=10)
+        assert state.churn_rate == pytest.approx(3.0, rel=0.01)
+        interval = state.next_due_at - state.last_scan_at
+        assert interval.total_seconds() == pytest.approx(1200, abs=1)
+        
+        state.churn_rate = 1000.0
+        assert scheduler._scan_interval(subscriptions, state) == timedelta(minutes=5)
+        assert temp_db.get_scan_states()[0].churn_rate == pytest.approx(3.0, rel=0.01)
+    
+    def test_quiet_section_backs_off_to_frequency(self, temp_db):
+        """Test that the interval never exceeds the subscribers' frequency"""
+        scheduler = BackgroundScheduler(temp_db)
+        subscriptions = [make_subscription('1', frequency='1d'),
+                         make_subscription('2', frequency='12h')]
+        
+        quiet, busy = ScanStateModel(churn_rate=0.01), ScanStateModel(churn_rate=0.5)
+        assert scheduler._scan_interval(subscriptions, quiet) == timedelta(hours=12)
+        assert scheduler._scan_interval(subscriptions, busy) == timedelta(hours=2)
+
+class TestScanLeases:
+    """Test cases for sharing sections between scanner workers"""
+    
+    @staticmethod
+    def make_worker(db_manager, worker_id, subscriptions=()) -> BackgroundScheduler:
+        """Scheduler with its own lease owner id"""
+        scheduler = TestDueQueue.make_scheduler(db_manager, subscriptions)
+        scheduler.worker_id = worker_id
+        return scheduler
+    
+    def test_lease_is_exclusive_until_expiry(self, temp_db):
+        """Test that a lease blocks other owners until it expires or is released"""
+        now = datetime.now()
+        
+        assert temp_db.acquire_scan_leases('a', ['s1', 's2'], 60, now) == ['s1', 's2']
+        assert temp_db.acquire_scan_leases('b', ['s1', 's3'], 60, now, limit=1) == ['s3']
+        assert temp_db.renew_scan_leases('a', ['s1'], 60, now + timedelta(seconds=50)) == ['s1']
+        assert temp_db.acquire_scan_leases('b', ['s1'], 60, now + timedelta(seconds=70)) == []
+        
+        # Owner a stopped heartbeating
+        later = now + timedelta(seconds=111)
+        assert temp_db.acquire_scan_leases('b', ['s1', 's2'], 60, later) == ['s1', 's2']
+        assert temp_db.renew_scan_leases('a', ['s1', 's2'], 60, later) == []
+        
+        assert temp_db.release_scan_leases('b', ['s1']) == 1
+        assert temp_db.acquire_scan_leases('a', ['s1'], 60, later) == ['s1']
+        assert temp_db.release_scan_leases('b') == 2
+        assert [lease.owner_id for lease in temp_db.get_scan_leases()] == ['a']
+    
+    @pytest.mark.asyncio
+    async def test_workers_split_due_sections(self, temp_db):
+        """Test that concurrent workers scan every section exactly once"""
+        first = self.make_worker(temp_db, 'a', [
+            make_subscription('1'),
+            make_subscription('2', url=TestDueQueue.HOUSES),
+        ])
+        second = self.make_worker(temp_db, 'b')
+        
+        with patch.object(config, 'SCAN_LEASE_BATCH', 1):
+            await asyncio.gather(first._scan_due_sections(), second._scan_due_sections())
+            # Stale in-memory state of either worker must not cause a rescan
+            await asyncio.gather(first._scan_due_sections(), second._scan_due_sections())
+        
+        assert first.parser.aiter_real_estate_ads.call_count == 1
+        assert second.parser.aiter_real_estate_ads.call_count == 1
+        assert temp_db.get_scan_leases() == []
+        assert len(temp_db.get_scan_states()) == 2
+    
+    @pytest.mark.asyncio
+    async def test_expired_lease_of_crashed_worker_is_taken_over(self, temp_db):
+        """Test that sections of a worker that stopped heartbeating are picked up"""
+        worker = self.make_worker(temp_db, 'b', [make_subscription('1')])
+        url = normalize_section_url(RIGA_FLATS)
+        
+        temp_db.acquire_scan_leases('crashed', [url], config.SCAN_LEASE_SECONDS)
+        await worker._scan_due_sections()
+        worker.parser.aiter_real_estate_ads.assert_not_called()
+        
+        expired = datetime.now() - timedelta(seconds=config.SCAN_LEASE_SECONDS + 1)
+        temp_db.acquire_scan_leases('crashed', [url], config.SCAN_LEASE_SECONDS, expired)
+        await worker._scan_due_sections()
+        assert worker.parser.aiter_real_estate_ads.call_count == 1
+        assert worker.scan_states[url].last_scan_at is not None